@@ -4,7 +4,10 @@ from discord import Intents
 from discord.ext.commands import Bot
 from discord_slash import SlashCommand
 
-from const import get_secret
+from const import GUILDS, get_secret
+from economy.migrations import migrate
+from shard import current, get_shard
+from util import database
 
 intents = Intents.default()
 intents.members = True
@@ -25,4 +28,11 @@ for file in listdir('cogs'):
         bot.load_extension(f'cogs.{file[:-3]}')
         print(f'Cog loaded: {file[:-3]}')
 
+# migrate the configured guilds before logging in, so the full VACUUM an old file takes once does not stall the bot;
+# any other guild is migrated when its economy is first opened
+for guild_id in GUILDS:
+    token = current.set(get_shard(guild_id))
+    print(f'Database schema version of guild {guild_id}: {migrate(database)}')
+    current.reset(token)
+
 bot.run(get_secret('token'))
@@ -0,0 +1,12 @@
+from os import chdir, makedirs, path
+from sys import path as sys_path
+from tempfile import mkdtemp
+
+# The bot opens `res/db` relative to the working directory when `util` is imported, so the benchmarks move
+# into a scratch directory first and never touch the real database.
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+DIRECTORY = mkdtemp(prefix='goroso-benchmark-')
+
+sys_path.insert(0, ROOT)
+makedirs(path.join(DIRECTORY, 'res'))
+chdir(DIRECTORY)
@@ -0,0 +1,209 @@
+"""
+Benchmarks of the message billing hot path and the slash-command queries.
+
+    python -m benchmark [--sizes 100,10000,100000] [--messages 2000] [--log-rows 1000000] [--json result.json]
+
+Every run builds its own temporary sqlite database, so it can run in CI next to the bot.
+"""
+import benchmark  # noqa: F401, moves into the scratch directory before `util` opens the database
+
+from argparse import ArgumentParser
+from asyncio import run as run_async, gather
+from os import cpu_count
+from json import dump
+from random import Random
+from typing import List
+
+from benchmark import keys
+from benchmark.data import populate, make_messages, FIRST_OWNER_ID
+from benchmark.fakes import FakeBot, FakeMessage, FakeUser
+from benchmark.stats import Measurement, QueryCounter
+from const import GUILDS
+from economy import market
+from economy.cache import word_cache, word_text_cache
+from economy.dashboard import build_snapshot
+from economy.ingest import Ingestor, snapshots
+from economy.matcher import WordMatcher, get_matcher_path, open_matcher
+from economy.models import Owner, Word
+from economy.usage import leaderboard
+from economy.util import get_log
+
+
+async def bench_billing(sizes: List[int], count: int) -> List[Measurement]:
+    """ `on_message` and `handle_word_cost` against dictionaries of the given sizes. """
+    from cogs.general import GeneralCog, economies
+
+    results = list()
+    for size in sizes:
+        words = populate(size)
+        economies.shard_reset()
+        cog = GeneralCog(FakeBot())
+        cog.flush_buffers.cancel()
+        cog.publish_dashboards.cancel()
+        cog.compact_logs.cancel()
+        await cog.enter(GUILDS[0])
+        random = Random(size)
+        authors = [FakeUser(FIRST_OWNER_ID + i) for i in range(100)]
+        messages = [FakeMessage(random.choice(authors), content) for content in make_messages(words, count, size)]
+
+        on_message = Measurement(f'on_message ({size:,} words)')
+        with QueryCounter() as counter:
+            for message in messages:
+                on_message.start()
+                await cog.on_message(message)
+                on_message.stop()
+        on_message.queries = counter.count
+        results.append(on_message)
+
+        handle_word_cost = Measurement(f'handle_word_cost ({size:,} words)')
+        with QueryCounter() as counter:
+            for message in messages:
+                owner = Owner.get_by_id(message.author.id)
+                handle_word_cost.start()
+                await cog.handle_word_cost(owner, message)
+                handle_word_cost.stop()
+        handle_word_cost.queries = counter.count
+        results.append(handle_word_cost)
+    return results
+
+
+def bench_queries(log_rows: int, repeat: int = 20) -> List[Measurement]:
+    """ The ranking and log queries against a `word_use` table with `log_rows` rows. """
+    populate(10000, log_rows=log_rows)
+    middle = get_log(FIRST_OWNER_ID, 'all', max(1, log_rows // 2))[-1]
+    random = Random(log_rows)
+    cases = (
+        ('Leaderboard.load', leaderboard.load),
+        ('Leaderboard.add', lambda: leaderboard.add(random.randint(1, 10000), random.randrange(1000))),
+        ('get_log i_paid', lambda: get_log(FIRST_OWNER_ID, 'i_paid', 10)),
+        ('get_log i_got', lambda: get_log(FIRST_OWNER_ID, 'i_got', 10)),
+        ('get_log all', lambda: get_log(FIRST_OWNER_ID, 'all', 10)),
+        ('get_log all, middle page', lambda: get_log(FIRST_OWNER_ID, 'all', 10, (middle[1], middle[0]))),
+        ('market recent', lambda: market.get_listings('recent')),
+        ('market price', lambda: market.get_listings('price')),
+        ('build_snapshot', build_snapshot),
+    )
+    results = list()
+    for name, function in cases:
+        measurement = Measurement(f'{name} ({log_rows:,} rows)')
+        with QueryCounter() as counter:
+            for _ in range(repeat):
+                measurement.start()
+                function()
+                measurement.stop()
+        measurement.queries = counter.count
+        results.append(measurement)
+    return results
+
+
+def bench_reload(sizes: List[int], repeat: int = 5) -> List[Measurement]:
+    """ Cold `Word.get_all`, and mapping the saved matcher, which the cog does at startup instead. """
+    results = list()
+    for size in sizes:
+        populate(size)
+        open_matcher()
+        measurement = Measurement(f'WordMatcher.load ({size:,} words)')
+        for _ in range(repeat):
+            measurement.start()
+            WordMatcher.load(get_matcher_path(), Word.get_dictionary_version())
+            measurement.stop()
+        results.append(measurement)
+
+        measurement = Measurement(f'Word.get_all ({size:,} words)')
+        with QueryCounter() as counter:
+            for _ in range(repeat):
+                word_cache.clear()
+                word_text_cache.clear()
+                measurement.start()
+                Word.get_all()
+                measurement.stop()
+        measurement.queries = counter.count
+        results.append(measurement)
+    return results
+
+
+def bench_keys(count: int, repeat: int = 5) -> List[Measurement]:
+    """ Keystroke counting of whole messages. """
+    messages = keys.make_corpus(count)
+    results = list()
+    for name, function in (('get_keys per letter', keys.score_per_letter), ('get_hangul_keys', keys.score_table),
+                           ('get_keys_bulk', keys.score_bulk)):
+        measurement = Measurement(f'{name} ({count:,} messages)')
+        for _ in range(repeat):
+            measurement.start()
+            function(messages)
+            measurement.stop()
+        # report per message rather than per batch
+        measurement.latencies = [latency / count for latency in measurement.latencies for _ in range(count)]
+        results.append(measurement)
+    return results
+
+
+async def bench_ingest(size: int, count: int, repeat: int = 3) -> List[Measurement]:
+    """ Matching throughput of whole batches of messages, on one thread and in 1 to `cpu_count` processes. """
+    words = populate(size)
+    matcher = WordMatcher(Word.get_all())
+    messages = make_messages(words, count, size)
+    results = list()
+
+    measurement = Measurement(f'match in process ({size:,} words)')
+    for _ in range(repeat):
+        measurement.start()
+        for content in messages:
+            matcher.find(content)
+        measurement.stop()
+    results.append(measurement)
+
+    workers = 1
+    while workers <= (cpu_count() or 1):
+        ingestor = Ingestor(workers)
+        snapshots.shard_reset()
+        snapshots.publish(matcher)
+        measurement = Measurement(f'match in {workers} processes ({size:,} words)')
+        for _ in range(repeat):
+            measurement.start()
+            await gather(*(ingestor.scan(content) for content in messages))
+            measurement.stop()
+        ingestor.shutdown()
+        results.append(measurement)
+        workers *= 2
+
+    # report per message rather than per batch
+    for measurement in results:
+        measurement.latencies = [latency / count for latency in measurement.latencies for _ in range(count)]
+    return results
+
+
+def main():
+    parser = ArgumentParser(prog='python -m benchmark', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100,10000,100000', help='dictionary sizes, comma separated')
+    parser.add_argument('--messages', type=int, default=2000, help='messages per dictionary size')
+    parser.add_argument('--log-rows', type=int, default=1000000, help='rows of the word_use table')
+    parser.add_argument('--only', choices=('billing', 'queries', 'reload', 'keys', 'ingest'), action='append',
+                        help='run only these suites')
+    parser.add_argument('--json', help='also write the results to this file')
+    arguments = parser.parse_args()
+    sizes = [int(size) for size in arguments.sizes.split(',')]
+    suites = arguments.only or ['billing', 'queries', 'reload', 'keys', 'ingest']
+
+    results = list()
+    if 'billing' in suites:
+        results += run_async(bench_billing(sizes, arguments.messages))
+    if 'queries' in suites:
+        results += bench_queries(arguments.log_rows)
+    if 'reload' in suites:
+        results += bench_reload(sizes)
+    if 'keys' in suites:
+        results += bench_keys(arguments.messages)
+    if 'ingest' in suites:
+        results += run_async(bench_ingest(sizes[-1], arguments.messages))
+
+    for measurement in results:
+        print(measurement)
+    if arguments.json:
+        with open(arguments.json, 'w') as file:
+            dump([measurement.to_dict() for measurement in results], file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+from random import Random
+from typing import List
+
+from const import MONEY_SCALE, RATE_SCALE
+from economy import market
+from economy.cache import word_cache, word_text_cache, owner_cache
+from economy.ledger import ledger
+from economy.migrations import migrate
+from economy.models import owner_ids
+from economy.usage import log_buffer, leaderboard, backfill_rollups
+from util import database
+
+FIRST_OWNER_ID = 1000
+OWNER_MONEY = 10 ** 9 * MONEY_SCALE
+
+
+def reset():
+    """ Drop every table and forget every in-memory state of the economy. """
+    log_buffer.rows.clear()
+    ledger.balances.clear()
+    ledger.dirty.clear()
+    word_cache.clear()
+    word_text_cache.clear()
+    owner_cache.clear()
+    owner_ids.shard_reset()
+    cursor = database.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+    for (name,) in cursor.fetchall():
+        cursor.execute(f'DROP TABLE {name}')
+    cursor.execute('PRAGMA user_version = 0')
+    database.commit()
+
+
+def make_words(count: int, random: Random) -> List[str]:
+    """ Make distinct Korean words of 2 to 4 syllables. """
+    words = set()
+    while len(words) < count:
+        words.add(''.join(chr(random.randint(44032, 55203)) for _ in range(random.randint(2, 4))))
+    return sorted(words, key=lambda _: random.random())
+
+
+def populate(words: int, owners: int = 100, log_rows: int = 0, seed: int = 0) -> List[str]:
+    """
+    Build a fresh database with a synthetic economy.
+    :param words: count of the registered words
+    :param owners: count of the owners, who own the words round-robin
+    :param log_rows: count of the `word_use` rows, spread over the past 30 days
+    :param seed: random seed
+    :return: the registered words
+    """
+    random = Random(seed)
+    reset()
+    migrate(database)
+    cursor = database.cursor()
+    owner_ids = [FIRST_OWNER_ID + i for i in range(owners)]
+    cursor.executemany('INSERT INTO owner (id, money) VALUES (?, ?)', [(id_, OWNER_MONEY) for id_ in owner_ids])
+    texts = make_words(words, random)
+    cursor.executemany('INSERT INTO word (word, owner_id, price) VALUES (?, ?, ?)',
+                       [(text, owner_ids[i % owners], random.randint(10, 1000) * MONEY_SCALE) for i, text in enumerate(texts)])
+    word_ids = [word_id for (word_id,) in cursor.execute('SELECT id FROM word')]
+    cursor.executemany('INSERT INTO preference (owner_id, word_id, rate) VALUES (?, ?, ?)',
+                       [(random.choice(owner_ids), word_id, random.randrange(RATE_SCALE))
+                        for word_id in random.sample(word_ids, len(word_ids) // 100)])
+    cursor.executemany('INSERT INTO market (word_id, price) VALUES (?, ?)',
+                       [(word_id, random.randint(10, 1000) * MONEY_SCALE) for word_id in random.sample(word_ids, len(word_ids) // 100)])
+
+    now = datetime.now()
+    for start in range(0, log_rows, 100000):
+        cursor.executemany('INSERT INTO word_use (datetime, user_id, word_id, amount) VALUES (?, ?, ?, ?)',
+                           [(now - timedelta(seconds=random.randint(0, 30 * 24 * 3600)),
+                             random.choice(owner_ids), random.choice(word_ids), random.randrange(10 * MONEY_SCALE))
+                            for _ in range(min(100000, log_rows - start))])
+    database.commit()
+    backfill_rollups()
+    leaderboard.load()
+    market.book.load()
+    return texts
+
+
+def make_messages(words: List[str], count: int, seed: int = 0, hit_rate: float = 0.5) -> List[str]:
+    """
+    Make Korean chat messages; about `hit_rate` of them contain one to three of the registered words.
+    """
+    random = Random(seed)
+    syllables = [chr(random.randint(44032, 55203)) for _ in range(2000)]
+    messages = list()
+    for _ in range(count):
+        parts = [''.join(random.choices(syllables, k=random.randint(1, 5))) for _ in range(random.randint(1, 12))]
+        if words and random.random() < hit_rate:
+            for _ in range(random.randint(1, 3)):
+                parts.insert(random.randint(0, len(parts)), random.choice(words))
+        messages.append(' '.join(parts) + random.choice(('', '.', '?', '!', 'ㅋㅋ')))
+    return messages
@@ -0,0 +1,81 @@
+from typing import Dict, List, Optional
+
+from const import GUILDS
+
+
+class FakeUser:
+    """ Stands in for discord.User and discord.Member. """
+
+    def __init__(self, id_: int, bot: bool = False):
+        self.id = id_
+        self.bot = bot
+        self.name = f'user{id_}'
+        self.display_name = self.name
+
+
+class FakeMessage:
+    """ Stands in for discord.Message. """
+
+    def __init__(self, author: FakeUser, content: str, channel: Optional['FakeChannel'] = None,
+                 guild: Optional['FakeGuild'] = None):
+        self.author = author
+        self.content = content
+        self.channel = channel or FakeChannel()
+        self.guild = guild or FakeGuild(GUILDS[0], dict())
+        self.deleted = False
+
+    async def delete(self, *, delay: Optional[float] = None):
+        self.deleted = True
+
+    async def edit(self, *, content: Optional[str] = None, embed=None, delete_after: Optional[float] = None,
+                   **_):
+        if content is not None:
+            self.content = content
+
+
+class FakeChannel:
+    """ Stands in for discord.TextChannel; keeps what was sent. """
+
+    def __init__(self):
+        self.sent: List[str] = list()
+
+    async def send(self, content: Optional[str] = None, **_) -> FakeMessage:
+        self.sent.append(content)
+        return FakeMessage(FakeUser(0, bot=True), content or '', self)
+
+
+class FakeGuild:
+    """ Stands in for discord.Guild. """
+
+    def __init__(self, id_: int, users: Dict[int, FakeUser]):
+        self.id = id_
+        self.users = users
+
+    def get_member(self, id_: int) -> FakeUser:
+        return self.users.setdefault(id_, FakeUser(id_))
+
+
+class FakeBot:
+    """ Stands in for discord.ext.commands.Bot. """
+
+    def __init__(self):
+        self.users: Dict[int, FakeUser] = dict()
+        self.user = FakeUser(0, bot=True)
+
+    def get_user(self, id_: int) -> FakeUser:
+        return self.users.setdefault(id_, FakeUser(id_))
+
+
+class FakeSlashContext:
+    """ Stands in for discord_slash.SlashContext. """
+
+    def __init__(self, bot: FakeBot, author: FakeUser, guild_id: int = GUILDS[0]):
+        self.bot = bot
+        self.author = author
+        self.author_id = author.id
+        self.guild = FakeGuild(guild_id, bot.users)
+        self.guild_id = guild_id
+        self.channel = FakeChannel()
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
@@ -0,0 +1,41 @@
+from random import Random
+from timeit import repeat
+from typing import List
+
+from util import count_keys, get_hangul_keys, get_keys_bulk, numpy
+
+
+def make_corpus(count: int, seed: int = 0) -> List[str]:
+    """ Make Korean chat messages of 5 to 80 letters, with spaces and some punctuation. """
+    random = Random(seed)
+    syllables = [chr(random.randint(44032, 55203)) for _ in range(2000)]
+    letters = syllables + [' '] * 400 + list('.,?!~ㅋㅎ^') * 20
+    return [''.join(random.choices(letters, k=random.randint(5, 80))) for _ in range(count)]
+
+
+def score_per_letter(messages: List[str]) -> List[int]:
+    """ The keystroke counting of `on_message` before the table: one decomposition per letter. """
+    return [sum(count_keys(letter) for letter in message if '가' <= letter <= '힣') for message in messages]
+
+
+def score_table(messages: List[str]) -> List[int]:
+    return [get_hangul_keys(message) for message in messages]
+
+
+def score_bulk(messages: List[str]) -> List[int]:
+    return get_keys_bulk(messages, hangul_only=True)
+
+
+def main(count: int = 10000, number: int = 5):
+    messages = make_corpus(count)
+    letters = sum(map(len, messages))
+    expected = score_per_letter(messages)
+    print(f'{count} messages, {letters} letters, NumPy {"available" if numpy is not None else "not installed"}')
+    for name, function in (('per letter', score_per_letter), ('table', score_table), ('bulk', score_bulk)):
+        assert function(messages) == expected, name
+        seconds = min(repeat(lambda: function(messages), number=1, repeat=number))
+        print(f'{name:>10}: {seconds * 1000:8.2f}ms, {count / seconds:12,.0f} msgs/s, {letters / seconds:14,.0f} letters/s')
+
+
+if __name__ == '__main__':
+    main()
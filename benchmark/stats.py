@@ -0,0 +1,56 @@
+from time import perf_counter
+from typing import List, Dict
+
+from telemetry import percentile
+from util import database
+
+
+class QueryCounter:
+    """ Counts the statements sqlite runs while the counter is active. """
+
+    def __init__(self):
+        self.count = 0
+
+    def _trace(self, _: str):
+        self.count += 1
+
+    def __enter__(self) -> 'QueryCounter':
+        database.set_trace_callback(self._trace)
+        return self
+
+    def __exit__(self, *_):
+        database.set_trace_callback(None)
+
+
+class Measurement:
+    """ Latencies and query count of repeated operations. """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = list()
+        self.queries = 0
+        self.started = 0.0
+        self.seconds = 0.0
+
+    def start(self):
+        self.started = perf_counter()
+
+    def stop(self):
+        self.latencies.append(perf_counter() - self.started)
+
+    def to_dict(self) -> Dict[str, float]:
+        count = len(self.latencies)
+        total = sum(self.latencies)
+        return {
+            'name': self.name,
+            'count': count,
+            'ops_per_second': count / total if total else 0.0,
+            'p50_ms': percentile(self.latencies, 0.5) * 1000,
+            'p99_ms': percentile(self.latencies, 0.99) * 1000,
+            'queries_per_op': self.queries / count if count else 0.0,
+        }
+
+    def __str__(self):
+        result = self.to_dict()
+        return (f'{self.name:<40} {result["ops_per_second"]:>12,.1f}/s  p50 {result["p50_ms"]:>9.3f}ms  '
+                f'p99 {result["p99_ms"]:>9.3f}ms  {result["queries_per_op"]:>8.1f} queries/op')
@@ -1,82 +1,311 @@
-from asyncio import wait
-from typing import Optional
+from asyncio import wait, Lock, gather, get_running_loop, Future, TimeoutError
+from datetime import datetime, timedelta
+from functools import wraps
+from traceback import print_exception
+from typing import Optional, List, Callable, Union, Tuple, Awaitable
 
-from discord import User, Message, Embed
+from discord import User, Message, Embed, TextChannel, NotFound, Forbidden
 from discord.ext.commands import Cog, Bot
-from discord_slash import SlashCommandOptionType, SlashContext
+from discord.ext.tasks import loop
+from discord_slash import SlashCommandOptionType, SlashContext, ComponentContext, ButtonStyle
 from discord_slash.cog_ext import cog_slash
 from discord_slash.utils.manage_commands import create_option
+from discord_slash.utils.manage_components import create_button, create_actionrow, wait_for_component
 
-from const import DEVELOPERS, GUILDS, CURRENCY_NAME, YELLOW, AQUA, PERIOD
+from const import DEVELOPERS, COMMAND_GUILDS, CURRENCY_NAME, YELLOW, AQUA, PERIOD, LEDGER_FLUSH_INTERVAL, \
+    TELEMETRY_DUMP_PATH, TELEMETRY_DUMP_INTERVAL, DASHBOARD_INTERVAL, INGEST_WORKERS, LOG_PAGE_SIZE, LOG_PAGE_TIMEOUT, \
+    RETENTION_INTERVAL, MONEY_SCALE, RATE_SCALE
 from economy import market
+from economy.market import Fill
+from economy.cache import word_cache, word_text_cache, owner_cache
+from economy.contract import Contract, payouts
+from economy.dashboard import Snapshot, build_snapshot, get_dashboards, set_dashboard
+from economy.executor import run, run_in, read, executor
+from economy.ingest import Ingestor, snapshots
+from economy.matcher import WordMatcher, open_matcher, save_matcher
+from economy.migrations import migrate, check_indexes
 from economy.models import Owner, Word
-from economy.util import get_ranking_by_money, add_log, get_log, get_ranking_by_word, get_ranking_by_property
-from util import eul_reul, i_ga, get_keys, format_money
+from economy.retention import archive_day, compact_day, has_archive
+from economy.settlement import Settlement, plan, apply, flush
+from economy.usage import leaderboard, backfill_rollups
+from economy.util import get_log
+from shard import Shard, ShardLocal, use_shard, get_shards, get_current
+from telemetry import timed, measure, count, timings, counts, get_histograms, get_slow_queries, dump
+from util import database, eul_reul, i_ga, get_hangul_keys, format_money, to_money, to_rate
+
+
+class GuildEconomy:
+    """ The state of the cog in one guild. """
+
+    def __init__(self):
+        self.matcher = WordMatcher()
+        # the economy checks and updates await the database thread, so they must not interleave
+        self.lock = Lock()
+        # the latest dashboard snapshot, served by /rank and /mywords
+        self.snapshot: Optional[Snapshot] = None
+        self.opened = False
+
+
+economies = ShardLocal(GuildEconomy)
+
+
+async def for_each_shard(name: str, shards: List[Shard], job: Callable[[Shard], Awaitable]):
+    """
+    Run a job of a loop in every shard at once. A failure in one guild is printed and does not stop the job in
+    the other guilds, nor the loop.
+    """
+    results = await gather(*(job(shard) for shard in shards), return_exceptions=True)
+    for shard, result in zip(shards, results):
+        if isinstance(result, Exception):
+            print(f'Error: {name} failed in guild {shard.guild_id}')
+            print_exception(type(result), result, result.__traceback__)
+
+
+def guild_scoped(function: Callable) -> Callable:
+    """ Run a handler in the economy of the guild of its context or message; ignore direct messages. """
+    @wraps(function)
+    async def wrapper(self: 'GeneralCog', context: Union[SlashContext, Message], *args, **kwargs):
+        guild_id = getattr(context, 'guild_id', None) or (context.guild.id if context.guild is not None else None)
+        if guild_id is None:
+            return
+        await self.enter(guild_id)
+        return await function(self, context, *args, **kwargs)
+    return wrapper
 
 
 class GeneralCog(Cog):
     def __init__(self, bot):
         self.bot: Bot = bot
+        # the workers are forked before any database thread starts
+        self.ingestor = Ingestor() if INGEST_WORKERS else None
+
+        self.flush_buffers.start()
+        self.publish_dashboards.start()
+        self.compact_logs.start()
+        if TELEMETRY_DUMP_PATH is not None:
+            self.dump_telemetry.start()
+
+    @property
+    def matcher(self) -> WordMatcher:
+        return economies.matcher
+
+    @property
+    def lock(self) -> Lock:
+        return economies.lock
+
+    @property
+    def snapshot(self) -> Optional[Snapshot]:
+        return economies.snapshot
+
+    @snapshot.setter
+    def snapshot(self, snapshot: Snapshot):
+        economies.shard_instance().snapshot = snapshot
+
+    async def enter(self, guild_id: int):
+        """ Make a guild the economy of the running task, and open it on first use. """
+        shard = use_shard(guild_id)
+        if not economies.shard_instance(shard).opened:
+            await run(self.open_economy)
+
+    @staticmethod
+    def open_economy():
+        """ Migrate and load the economy of the current guild. Runs on its database thread. """
+        economy = economies.shard_instance()
+        if economy.opened:
+            return
+        print(f'Database schema version of guild {get_current().guild_id}: {migrate(database)}')
+        for index in check_indexes(database):
+            print(f'Warning: the query plan does not use the index {index}')
+        economy.matcher = open_matcher()
+        if INGEST_WORKERS:
+            snapshots.publish(economy.matcher)
+        Owner.get_ids()
+        leaderboard.load()
+        market.book.load()
+        payouts.load()
+        economy.opened = True
+
+    @staticmethod
+    def close_economy(shard: Shard):
+        """ Stop the database threads of a guild, then flush its buffers and save its matcher. """
+        executor.shard_instance(shard).shutdown()
+        use_shard(shard.guild_id)
+        flush()
+        economy = economies.shard_instance(shard)
+        # a command that holds the lock may have changed the database but not the matcher yet
+        if not economy.lock.locked():
+            save_matcher(economy.matcher)
+
+    @staticmethod
+    def get_open_shards() -> List[Shard]:
+        return [shard for shard in get_shards() if economies.shard_instance(shard).opened]
+
+    def cog_unload(self):
+        self.flush_buffers.cancel()
+        self.publish_dashboards.cancel()
+        self.compact_logs.cancel()
+        self.dump_telemetry.cancel()
+        for shard in self.get_open_shards():
+            self.close_economy(shard)
+        if self.ingestor is not None:
+            self.ingestor.shutdown()
 
-        self.words = Word.get_all()
+    @loop(seconds=LEDGER_FLUSH_INTERVAL)
+    async def flush_buffers(self):
+        await for_each_shard('flush_buffers', self.get_open_shards(), lambda shard: run_in(shard, flush, False))
 
-    async def handle_word_cost(self, owner: Owner, message: Message):
+    @loop(seconds=DASHBOARD_INTERVAL)
+    async def publish_dashboards(self):
+        await for_each_shard('publish_dashboards', self.get_open_shards(),
+                             lambda shard: self.publish_dashboard(shard.guild_id))
+
+    @publish_dashboards.before_loop
+    async def before_publish_dashboards(self):
+        await self.bot.wait_until_ready()
+
+    async def publish_dashboard(self, guild_id: int):
+        """ Rebuild the snapshot of a guild and edit its dashboard message. Runs in a task of its own. """
+        await self.enter(guild_id)
+        self.snapshot = await read(build_snapshot)
+        embed = self.get_dashboard_embed(self.snapshot)
+        for _, channel_id, message_id in await read(get_dashboards):
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                continue
+            try:
+                await channel.get_partial_message(message_id).edit(embed=embed)
+            except NotFound:
+                await self.post_dashboard(channel, embed)
+
+    @loop(seconds=RETENTION_INTERVAL)
+    async def compact_logs(self):
+        await for_each_shard('compact_logs', self.get_open_shards(), lambda shard: self.compact_log(shard.guild_id))
+
+    async def compact_log(self, guild_id: int):
+        """
+        Archive and compact the log of a guild past the retention horizon, one day per database job, so the
+        messages are billed in between. Runs in a task of its own.
+        """
+        await self.enter(guild_id)
+        while (archived := await read(archive_day)) is not None:
+            await run(compact_day, *archived)
+
+    @loop(seconds=TELEMETRY_DUMP_INTERVAL)
+    async def dump_telemetry(self):
+        # the snapshot is taken under the locks of the histograms, so the file is written off the event loop
+        await get_running_loop().run_in_executor(None, dump, TELEMETRY_DUMP_PATH)
+
+    def get_name(self, user_id: int) -> str:
+        user = self.bot.get_user(user_id)
+        return user.display_name if user is not None else str(user_id)
+
+    async def get_snapshot(self) -> Snapshot:
+        if self.snapshot is None:
+            self.snapshot = await read(build_snapshot)
+        return self.snapshot
+
+    def get_ranking(self, snapshot: Snapshot, kind: str) -> List[str]:
+        """ Render a ranking of a snapshot as lines. """
+        if kind == 'money':
+            return [f'{i + 1}. {self.get_name(owner_id)} ({format_money(money)})'
+                    for i, (owner_id, money) in enumerate(snapshot.money)]
+        if kind == 'word':
+            return [f'{i + 1}. {stat.word} ({self.get_name(stat.owner_id)}, {format_money(stat.revenue)} / '
+                    f'{format_money(stat.fee)}, 수익률 {stat.profit_rate * 100:.1f}%)'
+                    for i, stat in enumerate(snapshot.words)]
+        if kind == 'property':
+            return [f'{i + 1}. {self.get_name(owner_id)} ({format_money(property_)})'
+                    for i, (owner_id, property_) in enumerate(snapshot.property)]
+        return []
+
+    def get_dashboard_embed(self, snapshot: Snapshot) -> Embed:
+        embed = Embed(title='대시보드', color=YELLOW)
+        for name, kind in (('단어 순위', 'word'), ('소지금 순위', 'money'), ('총자본 순위', 'property')):
+            embed.add_field(name=name, value='\n'.join(self.get_ranking(snapshot, kind))[:1024] or '없음', inline=False)
+        embed.set_footer(text=f'{snapshot.created:%Y-%m-%d %H:%M} 기준')
+        return embed
+
+    async def post_dashboard(self, channel: TextChannel, embed: Embed):
+        """ Post and pin a dashboard message, and unpin the one it replaces. """
+        message = await channel.send(embed=embed)
+        await message.pin()
+        replaced = await run(set_dashboard, channel.guild.id, channel.id, message.id)
+        if replaced is None or (old_channel := self.bot.get_channel(replaced[0])) is None:
+            return
+        try:
+            await old_channel.get_partial_message(replaced[1]).unpin()
+        except (NotFound, Forbidden):
+            pass
+
+    def add_word(self, word: Word):
+        """ Add a word to the matcher of the current guild, and republish it to the ingest workers. """
+        self.matcher.add(word)
+        if INGEST_WORKERS:
+            snapshots.publish(self.matcher)
+
+    def remove_word(self, word: str):
+        """ Remove a word from the matcher of the current guild, and republish it to the ingest workers. """
+        self.matcher.remove(word)
+        if INGEST_WORKERS:
+            snapshots.publish(self.matcher)
+
+    def settle(self, owner: Owner, message: Message, scanned: Optional[Tuple[List[int], int]] = None) -> Settlement:
+        """
+        Plan and apply the charges and the keystroke income of a message. Runs on the database thread.
+        :param scanned: IDs of the matched words and the keystrokes, if an ingest worker matched the message
+        :return: the applied settlement
+        """
+        if scanned is None:
+            words, keys = self.matcher.find(message.content), get_hangul_keys(message.content)
+        else:
+            # a word removed since the worker matched it is not charged
+            words = Word.get_by_ids(scanned[0])
+            keys = scanned[1]
+            count('words.matched', len(words))
+        settlement = plan(owner, words, keys)
+        apply(settlement)
+        return settlement
+
+    async def handle_word_cost(self, owner: Owner, message: Message,
+                               scan: Optional['Future[Tuple[List[int], int]]'] = None):
         if owner is None:
             return
-        content = message.content
-
-        censored = False
-        used_words = list()
-
-        for word in sorted(self.words, key=lambda x: len(x.word), reverse=True):
-            if censored:
-                break
-            while word.word in content:
-                content = content.replace(word.word, ' ', 1)
-                word_owner = Owner.get_by_id(word.owner_id)
-                if word_owner.id == owner.id:
-                    continue
-                fee = word.get_fee()
-                used_words.append(word)
-                if owner.money < fee:
-                    censored = True
-                    break
-                else:
-                    rate = word.preferences[owner.id] if owner.id in word.preferences else 1
-                    if rate:
-                        owner.set_money(owner.money - fee * rate)
-                        word_owner.set_money(word_owner.money + fee * rate * 1.1)
-                    add_log(message.author.id, word.id)
-
-        if censored:
+
+        scanned = None
+        if scan is not None:
+            try:
+                scanned = await scan
+            except FileNotFoundError:
+                # the snapshot was replaced twice while the message waited; match it here instead
+                pass
+        settlement = await run(self.settle, owner, message, scanned)
+        if settlement.censored:
             content = message.content
-            for word in used_words:
+            for word in settlement.used_words:
                 content = content.replace(word.word, '**[수정됨]**')
             tasks = (message.channel.send(f':warning: __{message.author.display_name}__님의 소지금이 부족하여 '
                                           f'메시지의 일부가 수정되었습니다.\n> {content}'),
                      message.delete())
-            await wait(tasks)
+            with measure('discord.censor'):
+                await wait(tasks)
 
     @Cog.listener()
+    @timed('on_message')
+    @guild_scoped
     async def on_message(self, message: Message):
-        if message.author.bot:
+        if message.author.bot or not Owner.is_owner(message.author.id):
             return
-        owner = Owner.get_by_id(message.author.id)
+        owner = await run(Owner.get_by_id, message.author.id)
         if owner is not None:
-            await self.handle_word_cost(owner, message)
-
-            # give money by the key count
-            keys = 0
-            for letter in message.content:
-                if Word.is_valid(letter, no_length=True):
-                    keys += get_keys(letter)
-            if keys > 0:
-                owner.set_money(owner.money + keys * 0.009)
+            # the worker matches the message while the earlier messages are settled, in arrival order
+            scan = self.ingestor.scan(message.content) if self.ingestor is not None else None
+            async with self.lock:
+                await self.handle_word_cost(owner, message, scan)
 
     @cog_slash(
         name='money',
         description='소지금을 확인합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='user',
@@ -86,14 +315,17 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/money')
+    @guild_scoped
     async def money(self, ctx: SlashContext, user: Optional[User] = None):
         if user is None:
             user = ctx.author
 
-        owner = Owner.get_by_id(user.id)
+        owner = await run(Owner.get_by_id, user.id)
         if owner is None:
             await ctx.send(f':warning: __{user.display_name}__ 사용자를 찾을 수 없습니다.')
             return
+        await run(owner.load_words)
         await ctx.send(f':white_check_mark: __{user.display_name}__님의 소지금: __{format_money(owner.money)}__, '
                        f'총 자본: __{format_money(owner.get_property())}__',
                        delete_after=PERIOD)
@@ -101,21 +333,24 @@ class GeneralCog(Cog):
     @cog_slash(
         name='newcomer',
         description='새로운 사용자를 추가합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
     )
+    @timed('/newcomer')
+    @guild_scoped
     async def newcomer(self, ctx: SlashContext):
-        if Owner.is_owner(ctx.author.id):
-            await ctx.send(f':warning: __{ctx.author.display_name}__님은 이미 있는 사용자입니다.')
-            return
-        Owner.new(ctx.author.id)
-        await ctx.send(f':white_check_mark: 새로운 사용자 __{ctx.author.display_name}__{eul_reul(ctx.author.display_name)} '
-                       f'추가했습니다.',
-                       delete_after=PERIOD)
+        async with self.lock:
+            if await run(Owner.is_owner, ctx.author.id):
+                await ctx.send(f':warning: __{ctx.author.display_name}__님은 이미 있는 사용자입니다.')
+                return
+            await run(Owner.new, ctx.author.id)
+            await ctx.send(f':white_check_mark: 새로운 사용자 __{ctx.author.display_name}__{eul_reul(ctx.author.display_name)} '
+                           f'추가했습니다.',
+                           delete_after=PERIOD)
 
     @cog_slash(
         name='user',
         description='사용자 정보를 확인합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='user',
@@ -125,25 +360,29 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/user')
+    @guild_scoped
     async def user(self, ctx: SlashContext, user: Optional[User] = None):
         if user is None:
             user = ctx.author
-        owner = Owner.get_by_id(user.id)
+        owner = await run(Owner.get_by_id, user.id)
         if owner is None:
             await ctx.send(f':warning: __{user.display_name}__ 사용자를 찾을 수 없습니다.', delete_after=PERIOD)
             return
 
         message = await ctx.send(f':hourglass: __{user.display_name}__님의 정보를 가져오는 중입니다...')
+        await run(owner.load_words)
 
         embed = Embed(title=f'{user.display_name}님의 정보', color=YELLOW)
         embed.add_field(name='소지금', value=f'{format_money(owner.money)}')
         embed.add_field(name='출품한 단어 수', value=f'{len(owner.words)}개')
         embed.add_field(name=f'총자본', value=format_money(owner.get_property()))
         if owner.words:
+            on_sale = await run(market.get_on_sale, [word.id for word in owner.words])
             words = list()
             for word in owner.words:
-                words.append(f'{word.word}({round(word.price)})')
-                if market.is_on_sale(word.id):
+                words.append(f'{word.word}({round(word.price / MONEY_SCALE)})')
+                if word.id in on_sale:
                     words[-1] = f'__{words[-1]}__'
             words = ', '.join(words)
             i = 1
@@ -158,7 +397,7 @@ class GeneralCog(Cog):
     @cog_slash(
         name='register',
         description='단어를 등록합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='price',
@@ -174,37 +413,41 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/register')
+    @guild_scoped
     async def register(self, ctx: SlashContext, price: float, word: str):
-        if Word.is_duplicate(word):
-            await ctx.send(f':warning: __{word}__ 단어는 이미 등록되어 있습니다.', delete_after=PERIOD)
-            return
-        if price <= 0:
-            await ctx.send(f':warning: 단어의 가격은 0 {CURRENCY_NAME}{eul_reul(CURRENCY_NAME)} 넘어야 합니다. '
-                           f'(`{price}`라고 입력하셨습니다.)', delete_after=PERIOD)
-            return
-        if not Word.is_valid(word):
-            await ctx.send(f':warning: 단어에는 완성형 한글만 사용할 수 있고, 두 글자 이상이어야 합니다!', delete_after=PERIOD)
-            return
-        owner = Owner.get_by_id(ctx.author.id)
-        if owner is None:
-            await ctx.send(f':warning: 단어를 만들기 전에 사용자를 등록해야 합니다! 사용자 등록을 하려면 `/newcomer`를 입력하세요.',
+        price = to_money(price)
+        async with self.lock:
+            if await run(Word.is_duplicate, word):
+                await ctx.send(f':warning: __{word}__ 단어는 이미 등록되어 있습니다.', delete_after=PERIOD)
+                return
+            if price <= 0:
+                await ctx.send(f':warning: 단어의 가격은 0 {CURRENCY_NAME}{eul_reul(CURRENCY_NAME)} 넘어야 합니다. '
+                               f'(`{format_money(price)}`라고 입력하셨습니다.)', delete_after=PERIOD)
+                return
+            if not Word.is_valid(word):
+                await ctx.send(f':warning: 단어에는 완성형 한글만 사용할 수 있고, 두 글자 이상이어야 합니다!', delete_after=PERIOD)
+                return
+            owner = await run(Owner.get_by_id, ctx.author.id)
+            if owner is None:
+                await ctx.send(f':warning: 단어를 만들기 전에 사용자를 등록해야 합니다! 사용자 등록을 하려면 `/newcomer`를 입력하세요.',
+                               delete_after=PERIOD)
+                return
+            if owner.money < price:
+                await ctx.send(f':warning: __{ctx.author.display_name}__님의 소지금이 부족합니다! '
+                               f'(현재 __{format_money(owner.money)}__만큼을 가지고 있습니다.)', delete_after=PERIOD)
+                return
+            await run(owner.add_money, -price)
+            word = await run(Word.new, owner, word, price)
+            await ctx.send(f':white_check_mark: __{word.word}__ 단어를 등록했습니다.', embed=await run(word.get_embed, ctx),
                            delete_after=PERIOD)
-            return
-        if owner.money < price:
-            await ctx.send(f':warning: __{ctx.author.display_name}__님의 소지금이 부족합니다! '
-                           f'(현재 __{format_money(owner.money)}__만큼을 가지고 있습니다.)', delete_after=PERIOD)
-            return
-        owner.set_money(owner.money - price)
-        word = Word.new(owner, word, price)
-        await ctx.send(f':white_check_mark: __{word.word}__ 단어를 등록했습니다.', embed=word.get_embed(ctx),
-                       delete_after=PERIOD)
 
-        self.words = Word.get_all()
+            await run(self.add_word, word)
 
     @cog_slash(
         name='cancel',
         description='단어 특허 출원을 취소합니다. (수수료 10%가 발생합니다.)',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='word',
@@ -214,29 +457,31 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/cancel')
+    @guild_scoped
     async def cancel(self, ctx: SlashContext, word: str):
-        economy_word = Word.get_by_word(word)
-        if economy_word is None:
-            await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
-            return
-        if economy_word.owner_id != ctx.author.id:
-            await ctx.send(f':warning: __{economy_word.word}__ 단어는 __{ctx.author.display_name}__님이 등록한 단어가 아닙니다.',
-                           delete_after=PERIOD)
-            return
+        async with self.lock:
+            economy_word = await run(Word.get_by_word, word)
+            if economy_word is None:
+                await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
+                return
+            if economy_word.owner_id != ctx.author.id:
+                await ctx.send(f':warning: __{economy_word.word}__ 단어는 __{ctx.author.display_name}__님이 등록한 단어가 아닙니다.',
+                               delete_after=PERIOD)
+                return
 
-        if market.is_on_sale(economy_word.id):
-            market.withhold(economy_word.id)
-        Word.remove_word(word)
-        owner = Owner.get_by_id(ctx.author.id)
-        owner.set_money(owner.money + economy_word.price * 0.9)
-        await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어를 삭제했습니다.', delete_after=PERIOD)
+            await run(market.close_word, economy_word.id)
+            await run(Word.remove_word, word)
+            owner = await run(Owner.get_by_id, ctx.author.id)
+            await run(owner.add_money, economy_word.price * 9 // 10)
+            await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어를 삭제했습니다.', delete_after=PERIOD)
 
-        self.words = Word.get_all()
+            await run(self.remove_word, economy_word.word)
 
     @cog_slash(
         name='word',
         description='단어에 대한 세부 정보를 확인합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='word',
@@ -246,21 +491,30 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/word')
+    @guild_scoped
     async def word(self, ctx: SlashContext, word: str):
-        economy_word = Word.get_by_word(word)
+        economy_word = await run(Word.get_by_word, word)
         if economy_word is None:
             await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
             return
         message = await ctx.send(f':hourglass: __{word}__ 단어 정보를 불러오는 중입니다...')
-        embed = economy_word.get_embed(ctx)
-        embed.add_field(name='판매중', value=':o: 구매 가능' if market.is_on_sale(economy_word.id) else ':x: 구매 불가능')
+        embed = await run(economy_word.get_embed, ctx, await read(economy_word.get_used_count))
+        on_sale = await run(market.is_on_sale, economy_word.id)
+        embed.add_field(name='판매중', value=':o: 구매 가능' if on_sale else ':x: 구매 불가능')
+        contracts = await read(Contract.get_by_word, economy_word.id)
+        if contracts:
+            embed.add_field(name='공동소유권 계약', inline=False,
+                            value='\n'.join(f'{self.get_name(contract.beneficiary_id)}: '
+                                             f'{contract.share * 100 / RATE_SCALE:.1f}% ({contract.expires:%Y-%m-%d %H:%M}까지)'
+                                             for contract in contracts))
         await message.edit(content=f':white_check_mark: __{word}__ 단어 정보를 불러왔습니다!',
                            embed=embed, delete_after=PERIOD)
 
     @cog_slash(
         name='rank',
         description='랭킹을 확인합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='kind',
@@ -271,36 +525,52 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/rank')
+    @guild_scoped
     async def rank(self, ctx: SlashContext, kind: str):
-        message = await ctx.send(f':hourglass: __{kind}__ 랭킹을 불러오는 중입니다...')
-        field = list()
-        if kind == 'money':
-            for i, owner in enumerate(get_ranking_by_money(10)):
-                user = self.bot.get_user(owner.id)
-                field.append(f'{i + 1}. {user.display_name} ({format_money(owner.money)})')
-        elif kind == 'word':
-            for i, (word, fee, proceed) in enumerate(get_ranking_by_word(10)):
-                user = self.bot.get_user(word.owner_id)
-                field.append(f'{i + 1}. {word.word} '
-                             f'({user.display_name}, {format_money(proceed)} / {format_money(fee)})')
-        elif kind == 'property':
-            for i, owner in enumerate(get_ranking_by_property(10)):
-                user = self.bot.get_user(owner.id)
-                field.append(f'{i + 1}. {user.display_name} ({format_money(owner.get_property())})')
-
+        snapshot = await self.get_snapshot()
+        field = self.get_ranking(snapshot, kind)
         if not field:
             await ctx.send(f':warning: __{kind}__ 랭킹을 확인할 수 없습니다! 종류를 잘못 입력했거나 아직 사용자 또는 단어가 없습니다!',
                            delete_after=PERIOD)
             return
         embed = Embed(title=f'__{kind}__ 랭킹', color=YELLOW)
         embed.add_field(name='순위', value='\n'.join(field), inline=False)
-        await message.edit(content=f':white_check_mark: __{kind}__ 랭킹을 불러왔습니다!', embed=embed, delete_after=PERIOD)
+        embed.set_footer(text=f'{snapshot.created:%Y-%m-%d %H:%M} 기준')
+        await ctx.send(f':white_check_mark: __{kind}__ 랭킹을 불러왔습니다!', embed=embed, delete_after=PERIOD)
+
+    @cog_slash(
+        name='mywords',
+        description='내 단어의 수익과 수익률을 확인합니다.',
+        guild_ids=COMMAND_GUILDS,
+    )
+    @timed('/mywords')
+    @guild_scoped
+    async def mywords(self, ctx: SlashContext):
+        snapshot = await self.get_snapshot()
+        stats = snapshot.get_owner_words(ctx.author_id)
+        if not stats:
+            await ctx.send(f':warning: __{ctx.author.display_name}__님이 소유한 단어가 없습니다.', delete_after=PERIOD)
+            return
+        embed = Embed(title=f'{ctx.author.display_name}님의 단어', color=YELLOW)
+        lines = '\n'.join(f'{i + 1}. {stat.word}: 누적 {format_money(stat.revenue)} '
+                          f'(수익률 {stat.profit_rate * 100:.1f}%), 최근 1일 {format_money(stat.daily_revenue)}'
+                          for i, stat in enumerate(stats))
+        i = 1
+        while lines:
+            embed.add_field(name=f'단어 목록 {i}', value=lines[:1024], inline=False)
+            lines = lines[1024:]
+            i += 1
+        embed.set_footer(text=f'{snapshot.created:%Y-%m-%d %H:%M} 기준')
+        await ctx.send(embed=embed, delete_after=PERIOD)
 
     @cog_slash(
         name='prices',
         description='단어의 가격을 확인합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
     )
+    @timed('/prices')
+    @guild_scoped
     async def prices(self, ctx: SlashContext):
         content = ':white_check_mark: 단어의 가격은 길이에 따라 다르며, 길이가 짧은 단어는 가격이 낮아집니다.'
 
@@ -317,7 +587,7 @@ class GeneralCog(Cog):
     @cog_slash(
         name='exhibit',
         description='단어를 시장에 내놓습니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='word',
@@ -333,33 +603,43 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/exhibit')
+    @guild_scoped
     async def exhibit(self, ctx: SlashContext, word: str, price: float):
-        economy_word = Word.get_by_word(word)
-        if economy_word is None:
-            await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
-            return
-        if economy_word.owner_id != ctx.author_id:
-            user = self.bot.get_user(economy_word.owner_id)
-            await ctx.send(f':warning: __{economy_word.word}__ 단어를 소유하고 있지 않습니다. '
-                           f'__{economy_word.word}__ 단어는 __{user.display_name}__님이 소유하고 있습니다.',
-                           delete_after=PERIOD)
-            return
-        if market.is_on_sale(economy_word.id):
-            await ctx.send(f':warning: __{economy_word.word}__ 단어는 이미 시장에 내놓여있습니다.', delete_after=PERIOD)
-            return
-        if price <= 0:
-            await ctx.send(f':warning: 단어의 가격은 0보다 커야 합니다.', delete_after=PERIOD)
-            return
+        price = to_money(price)
+        async with self.lock:
+            economy_word = await run(Word.get_by_word, word)
+            if economy_word is None:
+                await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
+                return
+            if economy_word.owner_id != ctx.author_id:
+                user = self.bot.get_user(economy_word.owner_id)
+                await ctx.send(f':warning: __{economy_word.word}__ 단어를 소유하고 있지 않습니다. '
+                               f'__{economy_word.word}__ 단어는 __{user.display_name}__님이 소유하고 있습니다.',
+                               delete_after=PERIOD)
+                return
+            if await run(market.is_on_sale, economy_word.id):
+                await ctx.send(f':warning: __{economy_word.word}__ 단어는 이미 시장에 내놓여있습니다.', delete_after=PERIOD)
+                return
+            if price <= 0:
+                await ctx.send(f':warning: 단어의 가격은 0보다 커야 합니다.', delete_after=PERIOD)
+                return
 
-        market.exhibit(economy_word, price)
+            fill = await run(market.exhibit, economy_word, price)
+            if fill is not None:
+                buyer = self.bot.get_user(fill.buyer_id)
+                await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어가 __{buyer.display_name}__님의 입찰가 '
+                               f'__{format_money(fill.price)}__에 바로 팔렸습니다.', delete_after=PERIOD)
+                await run(self.add_word, await run(Word.get_by_id, economy_word.id))
+                return
 
-        await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어를 시장에 __{format_money(price)}__에 내놓았습니다.',
-                       delete_after=PERIOD)
+            await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어를 시장에 __{format_money(price)}__에 내놓았습니다.',
+                           delete_after=PERIOD)
 
     @cog_slash(
         name='withhold',
         description='단어 출품을 취소합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='word',
@@ -369,32 +649,35 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/withhold')
+    @guild_scoped
     async def withhold(self, ctx: SlashContext, word: str):
-        economy_word = Word.get_by_word(word)
-        if economy_word is None:
-            await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
-            return
-        if economy_word.owner_id != ctx.author_id:
-            user = self.bot.get_user(economy_word.owner_id)
-            await ctx.send(f':warning: __{economy_word.word}__ 단어를 소유하고 있지 않습니다. '
-                           f'__{economy_word}__ 단어는 __{user.display_name}__님이 소유하고 있습니다.', delete_after=PERIOD)
-            return
-        if not market.is_on_sale(economy_word.id):
-            await ctx.send(f':warning: __{economy_word.word}__ 단어는 시장에 내놓지 않았습니다.', delete_after=PERIOD)
-            return
+        async with self.lock:
+            economy_word = await run(Word.get_by_word, word)
+            if economy_word is None:
+                await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
+                return
+            if economy_word.owner_id != ctx.author_id:
+                user = self.bot.get_user(economy_word.owner_id)
+                await ctx.send(f':warning: __{economy_word.word}__ 단어를 소유하고 있지 않습니다. '
+                               f'__{economy_word}__ 단어는 __{user.display_name}__님이 소유하고 있습니다.', delete_after=PERIOD)
+                return
+            if not await run(market.is_on_sale, economy_word.id):
+                await ctx.send(f':warning: __{economy_word.word}__ 단어는 시장에 내놓지 않았습니다.', delete_after=PERIOD)
+                return
 
-        owner = Owner.get_by_id(ctx.author_id)
-        market.withhold(economy_word.id)
-        owner.set_money(owner.money + economy_word.price)
+            owner = await run(Owner.get_by_id, ctx.author_id)
+            await run(market.withhold, economy_word.id)
+            await run(owner.add_money, economy_word.price)
 
-        await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어 출품을 취소했습니다.', delete_after=PERIOD)
+            await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어 출품을 취소했습니다.', delete_after=PERIOD)
 
-        self.words = Word.get_all()
+            await run(self.add_word, economy_word)
 
     @cog_slash(
         name='market',
         description='시장에 내놓은 단어를 확인합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='sort',
@@ -405,29 +688,29 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/market')
+    @guild_scoped
     async def market(self, ctx: SlashContext, sort: str = 'recent'):
-        if sort == 'price':
-            words = market.get_words_by_price()
-        else:
-            words = market.get_recent_words()
+        listings = await run(market.get_listings, sort)
 
-        if len(words) == 0:
+        if len(listings) == 0:
             await ctx.send(f':warning: 시장에 내놓은 단어가 없습니다.', delete_after=PERIOD)
             return
 
         embed = Embed(title='시장', color=AQUA, description='정렬: ' + sort)
-        for word in words:
-            price = market.get_price(word.id)
-            embed.add_field(name=f'{word.word} ({format_money(price)})',
-                            value=f'**판매가**  {format_money(price)}\n'
-                                  f'**원가**  {format_money(word.price)}\n'
-                                  f'**현 소유자** {self.bot.get_user(word.owner_id).display_name}')
+        for word, price, best_bid in listings:
+            value = (f'**판매가**  {format_money(price)}\n'
+                     f'**원가**  {format_money(word.price)}\n'
+                     f'**현 소유자** {self.get_name(word.owner_id)}')
+            if best_bid is not None:
+                value += f'\n**최고 입찰가**  {format_money(best_bid)}'
+            embed.add_field(name=f'{word.word} ({format_money(price)})', value=value)
         await ctx.send(embed=embed, delete_after=PERIOD)
 
     @cog_slash(
         name='buy',
         description='시장에 내놓은 단어를 구매합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='word',
@@ -437,38 +720,132 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/buy')
+    @guild_scoped
     async def buy(self, ctx: SlashContext, word: str):
-        economy_word = Word.get_by_word(word)
-        if economy_word is None:
-            await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
-            return
-        if not market.is_on_sale(economy_word.id):
-            await ctx.send(f':warning: __{economy_word.word}__ 단어는 시장에 내놓지 않았습니다.', delete_after=PERIOD)
-            return
-        if economy_word.owner_id == ctx.author_id:
-            await ctx.send(f':warning: __{economy_word.word}__ 단어는 이미 소유하고 있습니다.', delete_after=PERIOD)
-            return
-        buyer = Owner.get_by_id(ctx.author_id)
-        price = market.get_price(economy_word.id)
-        if buyer.money < price:
-            await ctx.send(f':warning: 돈이 부족합니다. '
-                           f'현재 가지고 있는 돈은 __{format_money(buyer.money)}__이고 '
-                           f'단어는 __{format_money(price)}__이므로 '
-                           f'__{format_money(price - buyer.money)}__{i_ga(CURRENCY_NAME)} 더 필요합니다.',
+        async with self.lock:
+            economy_word = await run(Word.get_by_word, word)
+            if economy_word is None:
+                await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
+                return
+            if not await run(market.is_on_sale, economy_word.id):
+                await ctx.send(f':warning: __{economy_word.word}__ 단어는 시장에 내놓지 않았습니다.', delete_after=PERIOD)
+                return
+            if economy_word.owner_id == ctx.author_id:
+                await ctx.send(f':warning: __{economy_word.word}__ 단어는 이미 소유하고 있습니다.', delete_after=PERIOD)
+                return
+            buyer = await run(Owner.get_by_id, ctx.author_id)
+            fill, price, money = await run(self.buy_word, economy_word, buyer)
+            if fill is None:
+                await ctx.send(f':warning: 돈이 부족합니다. '
+                               f'현재 가지고 있는 돈은 __{format_money(money)}__이고 '
+                               f'단어는 __{format_money(price)}__이므로 '
+                               f'__{format_money(price - money)}__{i_ga(CURRENCY_NAME)} 더 필요합니다.',
+                               delete_after=PERIOD)
+                return
+            await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어를 구매했습니다.', delete_after=PERIOD)
+
+            await run(self.add_word, await run(Word.get_by_id, economy_word.id))
+
+    @staticmethod
+    def buy_word(word: Word, buyer: Owner) -> Tuple[Optional[Fill], int, int]:
+        """
+        Buy a word from the market if the buyer can pay its asking price. Runs on the database thread, so the price
+        that is checked is the one that is paid.
+        :return: the fill, or None if the buyer cannot pay, the asking price, and what the buyer can pay with: the
+                 balance, and the escrow of a bid on the word, which is refunded
+        """
+        price, money = market.get_price(word.id), market.get_available(word.id, buyer)
+        if money < price:
+            return None, price, money
+        return market.buy(word, buyer), price, money
+
+    @cog_slash(
+        name='bid',
+        description='단어에 매수 주문을 걸어둡니다. 주문 금액은 체결되거나 취소될 때까지 묶입니다.',
+        guild_ids=COMMAND_GUILDS,
+        options=[
+            create_option(
+                name='word',
+                description='매수할 단어',
+                option_type=SlashCommandOptionType.STRING,
+                required=True
+            ),
+            create_option(
+                name='price',
+                description='지불할 최고 가격',
+                option_type=SlashCommandOptionType.FLOAT,
+                required=True
+            )
+        ]
+    )
+    @timed('/bid')
+    @guild_scoped
+    async def bid(self, ctx: SlashContext, word: str, price: float):
+        price = to_money(price)
+        async with self.lock:
+            economy_word = await run(Word.get_by_word, word)
+            if economy_word is None:
+                await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
+                return
+            if economy_word.owner_id == ctx.author_id:
+                await ctx.send(f':warning: __{economy_word.word}__ 단어는 이미 소유하고 있습니다.', delete_after=PERIOD)
+                return
+            if price <= 0:
+                await ctx.send(f':warning: 매수 가격은 0보다 커야 합니다.', delete_after=PERIOD)
+                return
+            bidder = await run(Owner.get_by_id, ctx.author_id)
+            if bidder is None:
+                await ctx.send(f':warning: 매수 주문을 하기 전에 사용자를 등록해야 합니다! 사용자 등록을 하려면 `/newcomer`를 입력하세요.',
+                               delete_after=PERIOD)
+                return
+            available = await run(market.get_available, economy_word.id, bidder)
+            if available < price:
+                await ctx.send(f':warning: 돈이 부족합니다. '
+                               f'매수 주문에 쓸 수 있는 돈은 __{format_money(available)}__입니다.', delete_after=PERIOD)
+                return
+
+            fill = await run(market.bid, economy_word, bidder, price)
+            if fill is not None:
+                await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어를 판매가 '
+                               f'__{format_money(fill.price)}__에 바로 구매했습니다.', delete_after=PERIOD)
+                await run(self.add_word, await run(Word.get_by_id, economy_word.id))
+                return
+            await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어에 __{format_money(price)}__ 매수 주문을 걸었습니다.',
                            delete_after=PERIOD)
-            return
-        owner = Owner.get_by_id(economy_word.owner_id)
-        buyer.set_money(buyer.money - price)
-        owner.set_money(owner.money + price)
-        market.buy(economy_word, buyer)
-        await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어를 구매했습니다.', delete_after=PERIOD)
 
-        self.words = Word.get_all()
+    @cog_slash(
+        name='unbid',
+        description='단어에 걸어둔 매수 주문을 취소합니다.',
+        guild_ids=COMMAND_GUILDS,
+        options=[
+            create_option(
+                name='word',
+                description='매수 주문을 취소할 단어',
+                option_type=SlashCommandOptionType.STRING,
+                required=True
+            )
+        ]
+    )
+    @timed('/unbid')
+    @guild_scoped
+    async def unbid(self, ctx: SlashContext, word: str):
+        async with self.lock:
+            economy_word = await run(Word.get_by_word, word)
+            if economy_word is None:
+                await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
+                return
+            refund = await run(market.unbid, economy_word.id, ctx.author_id)
+            if refund is None:
+                await ctx.send(f':warning: __{economy_word.word}__ 단어에 걸어둔 매수 주문이 없습니다.', delete_after=PERIOD)
+                return
+            await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어의 매수 주문을 취소하고 '
+                           f'__{format_money(refund)}__{eul_reul(CURRENCY_NAME)} 돌려받았습니다.', delete_after=PERIOD)
 
     @cog_slash(
         name='remit',
         description='돈을 송금합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='to',
@@ -484,37 +861,112 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/remit')
+    @guild_scoped
     async def remit(self, ctx: SlashContext, to: User, amount: float):
-        if amount <= 0:
-            await ctx.send(f':warning: 송금할 금액은 0보다 커야 합니다.', delete_after=PERIOD)
-            return
-        if to.id == ctx.author_id:
-            await ctx.send(f':warning: 자기 자신에게는 송금할 수 없습니다.', delete_after=PERIOD)
-            return
-        if amount > Owner.get_by_id(ctx.author_id).money:
-            await ctx.send(
-                f':warning: 돈이 부족합니다. '
-                f'현재 가지고 있는 돈은 __{format_money(Owner.get_by_id(ctx.author_id).money)}__이고 '
-                f'송금할 금액은 __{format_money(amount)}__이므로 '
-                f'__{format_money(amount - Owner.get_by_id(ctx.author_id).money)}__{i_ga(CURRENCY_NAME)} '
-                f'더 필요합니다.',
-                delete_after=PERIOD)
-            return
-        from_owner = Owner.get_by_id(ctx.author_id)
-        to_owner = Owner.get_by_id(to.id)
-        if to_owner is None:
-            await ctx.send(f':warning: __{to.display_name}__에게 돈을 송금할 수 없습니다.', delete_after=PERIOD)
-            return
-        from_owner.set_money(from_owner.money - amount)
-        to_owner.set_money(to_owner.money + amount)
-        await ctx.send(f':white_check_mark: __{to.display_name}__에게 '
-                       f'__{format_money(amount)}__{eul_reul(CURRENCY_NAME)} 송금했습니다.',
-                       delete_after=PERIOD)
+        amount = to_money(amount)
+        async with self.lock:
+            if amount <= 0:
+                await ctx.send(f':warning: 송금할 금액은 0보다 커야 합니다.', delete_after=PERIOD)
+                return
+            if to.id == ctx.author_id:
+                await ctx.send(f':warning: 자기 자신에게는 송금할 수 없습니다.', delete_after=PERIOD)
+                return
+            from_owner = await run(Owner.get_by_id, ctx.author_id)
+            if amount > from_owner.money:
+                await ctx.send(
+                    f':warning: 돈이 부족합니다. '
+                    f'현재 가지고 있는 돈은 __{format_money(from_owner.money)}__이고 '
+                    f'송금할 금액은 __{format_money(amount)}__이므로 '
+                    f'__{format_money(amount - from_owner.money)}__{i_ga(CURRENCY_NAME)} '
+                    f'더 필요합니다.',
+                    delete_after=PERIOD)
+                return
+            to_owner = await run(Owner.get_by_id, to.id)
+            if to_owner is None:
+                await ctx.send(f':warning: __{to.display_name}__에게 돈을 송금할 수 없습니다.', delete_after=PERIOD)
+                return
+            await run(from_owner.add_money, -amount)
+            await run(to_owner.add_money, amount)
+            await ctx.send(f':white_check_mark: __{to.display_name}__에게 '
+                           f'__{format_money(amount)}__{eul_reul(CURRENCY_NAME)} 송금했습니다.',
+                           delete_after=PERIOD)
+
+    @cog_slash(
+        name='contract',
+        description='단어에서 발생하는 수익의 일부를 일정 기간 동안 다른 사용자에게 줍니다.',
+        guild_ids=COMMAND_GUILDS,
+        options=[
+            create_option(
+                name='word',
+                description='계약할 단어',
+                option_type=SlashCommandOptionType.STRING,
+                required=True
+            ),
+            create_option(
+                name='user',
+                description='수익을 받을 사용자',
+                option_type=SlashCommandOptionType.USER,
+                required=True
+            ),
+            create_option(
+                name='share',
+                description='줄 수익의 비율 (0 ~ 100)',
+                option_type=SlashCommandOptionType.FLOAT,
+                required=True
+            ),
+            create_option(
+                name='days',
+                description='계약 기간 (일)',
+                option_type=SlashCommandOptionType.INTEGER,
+                required=True
+            )
+        ]
+    )
+    @timed('/contract')
+    @guild_scoped
+    async def contract(self, ctx: SlashContext, word: str, user: User, share: float, days: int):
+        async with self.lock:
+            economy_word = await run(Word.get_by_word, word)
+            if economy_word is None:
+                await ctx.send(f':warning: __{word}__ 단어를 찾을 수 없습니다.', delete_after=PERIOD)
+                return
+            if economy_word.owner_id != ctx.author_id:
+                await ctx.send(':warning: 자신의 단어만 계약할 수 있습니다.', delete_after=PERIOD)
+                return
+            if user.id == ctx.author_id or not await run(Owner.is_owner, user.id):
+                await ctx.send(f':warning: __{user.display_name}__님과는 계약할 수 없습니다.', delete_after=PERIOD)
+                return
+            if to_rate(share) <= 0 or share > 100 or days <= 0:
+                await ctx.send(':warning: 비율은 0 ~ 100 사이, 기간은 1일 이상이어야 합니다.', delete_after=PERIOD)
+                return
+            contract, available = await run(self.make_contract, economy_word.id, user.id, to_rate(share),
+                                            datetime.now() + timedelta(days=days))
+            if contract is None:
+                await ctx.send(f':warning: __{economy_word.word}__ 단어는 __{available * 100 / RATE_SCALE:.1f}%__까지만 '
+                               f'더 계약할 수 있습니다.', delete_after=PERIOD)
+                return
+            await ctx.send(f':white_check_mark: __{economy_word.word}__ 단어 수익의 __{share}%__{eul_reul(str(share))} '
+                           f'__{contract.expires:%Y-%m-%d %H:%M}__까지 __{user.display_name}__님에게 주기로 계약했습니다.',
+                           delete_after=PERIOD)
+
+    @staticmethod
+    def make_contract(word_id: int, beneficiary_id: int, share: int,
+                      expires: datetime) -> Tuple[Optional[Contract], int]:
+        """
+        Make a contract if the share fits in what the active contracts of the word leave. Runs on the database
+        thread, after the expired contracts are dropped, so the share that is checked is the one that is contracted.
+        :return: the contract, or None if the share does not fit, and the share that was available, in per-mille
+        """
+        available = payouts.get_available_share(word_id)
+        if share > available:
+            return None, available
+        return Contract.new(word_id, beneficiary_id, share, expires), available
 
     @cog_slash(
         name='log',
         description='단어 검출 기록을 확인합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='type_',
@@ -525,27 +977,61 @@ class GeneralCog(Cog):
             ),
             create_option(
                 name='count',
-                description='기록의 개수를 선택합니다. (기본: `10`)',
+                description=f'한 쪽에 보일 기록의 개수를 선택합니다. (기본: `10`, 최대: `{LOG_PAGE_SIZE}`)',
                 option_type=SlashCommandOptionType.INTEGER,
                 required=False
             )
         ]
     )
+    @timed('/log')
+    @guild_scoped
     async def log(self, ctx: SlashContext, type_: str = 'all', count: int = 10):
+        count = max(1, min(count, LOG_PAGE_SIZE))
         message = await ctx.send(':hourglass: 기록을 가져오는 중입니다...')
-        records = get_log(ctx.author_id, type_, count)
-        lines = list()
-        for i, (id_, datetime, user_id, word_id) in enumerate(records):
-            user = self.bot.get_user(user_id)
-            word = Word.get_by_id(word_id)
-            lines.append(f'{i + 1}. {datetime}, {user.display_name}: {word.word}')
-        embed = Embed(title='기록', description='\n'.join(lines), color=YELLOW)
-        await message.edit(content=f':white_check_mark: `{type_}` 기록을 가져왔습니다.', embed=embed, delete_after=PERIOD)
+        # the key each page seen so far starts after; the last one is the current page
+        starts = [None]
+        # the archive is only read once the user asks for it, at the end of the live log
+        archived, can_archive = False, await read(has_archive)
+        origin: Optional[ComponentContext] = None
+        while True:
+            # one extra row tells if there is a next page
+            records = await read(get_log, ctx.author_id, type_, count + 1, starts[-1], archived)
+            has_next = len(records) > count
+            records = records[:count]
+            lines = [f'{(len(starts) - 1) * count + i + 1}. {datetime_}, {self.get_name(user_id)}: {word or "(삭제됨)"}'
+                     for i, (_, datetime_, user_id, _, word) in enumerate(records)]
+            embed = Embed(title='기록', description='\n'.join(lines) or '기록이 없습니다.', color=YELLOW)
+            embed.set_footer(text=f'{len(starts)}쪽')
+            buttons = [
+                create_button(style=ButtonStyle.gray, label='이전', custom_id='log_previous', disabled=len(starts) == 1),
+                create_button(style=ButtonStyle.gray, label='다음', custom_id='log_next', disabled=not has_next)]
+            if can_archive and not archived and not has_next:
+                buttons.append(create_button(style=ButtonStyle.gray, label='보관된 기록', custom_id='log_archive'))
+            components = [create_actionrow(*buttons)]
+            content = f':white_check_mark: `{type_}` 기록을 가져왔습니다.'
+            if origin is None:
+                await message.edit(content=content, embed=embed, components=components)
+            else:
+                await origin.edit_origin(content=content, embed=embed, components=components)
+
+            try:
+                origin = await wait_for_component(self.bot, messages=message, components=components,
+                                                  check=lambda x: x.author_id == ctx.author_id,
+                                                  timeout=LOG_PAGE_TIMEOUT)
+            except TimeoutError:
+                await message.delete()
+                return
+            if origin.custom_id == 'log_next':
+                starts.append((records[-1][1], records[-1][0]))
+            elif origin.custom_id == 'log_archive':
+                archived = True
+            else:
+                starts.pop()
 
     @cog_slash(
         name='discount',
         description='특정한 사용자에게 단어 사용 할인을 적용합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='user',
@@ -567,43 +1053,71 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/discount')
+    @guild_scoped
     async def discount(self, ctx: SlashContext, user: User, word: str, discount: float):
-        if discount < 0 or discount > 100:
-            await ctx.send(':warning: 할인은 0 ~ 100 사이의 값을 입력해야 합니다.', delete_after=PERIOD)
-            return
-        word = Word.get_by_word(word)
-        if word is None:
-            await ctx.send(':warning: 존재하지 않는 단어입니다.', delete_after=PERIOD)
-            return
-        if word.owner_id != ctx.author_id:
-            await ctx.send(':warning: 자신의 단어만 할인을 적용할 수 있습니다.', delete_after=PERIOD)
+        async with self.lock:
+            if discount < 0 or discount > 100:
+                await ctx.send(':warning: 할인은 0 ~ 100 사이의 값을 입력해야 합니다.', delete_after=PERIOD)
+                return
+            word = await run(Word.get_by_word, word)
+            if word is None:
+                await ctx.send(':warning: 존재하지 않는 단어입니다.', delete_after=PERIOD)
+                return
+            if word.owner_id != ctx.author_id:
+                await ctx.send(':warning: 자신의 단어만 할인을 적용할 수 있습니다.', delete_after=PERIOD)
+                return
+            preference_rate = RATE_SCALE - to_rate(discount)
+            await run(word.apply_preference, user.id, preference_rate)
+            if preference_rate != RATE_SCALE:
+                await ctx.send(f':white_check_mark: __{user.display_name}__에게 __{word.word}__ 단어를 '
+                               f'__{discount}%__ 할인으로 적용했습니다.', delete_after=PERIOD)
+            else:
+                await ctx.send(f':white_check_mark: __{user.display_name}__에게 __{word.word}__ 단어의 할인을 취소했습니다.',
+                               delete_after=PERIOD)
+            await run(self.add_word, word)
+
+    @cog_slash(
+        name='dashboard',
+        description='이 채널에 대시보드를 게시하고 고정합니다.',
+        guild_ids=COMMAND_GUILDS,
+    )
+    @timed('/dashboard')
+    @guild_scoped
+    async def dashboard(self, ctx: SlashContext):
+        if ctx.author.id not in DEVELOPERS:
+            await ctx.send(f':warning: __{ctx.author.display_name}__님은 권한이 없습니다.', delete_after=PERIOD)
             return
-        preference_rate = 1 - discount / 100
-        word.apply_preference(user.id, preference_rate)
-        if preference_rate != 1:
-            await ctx.send(f':white_check_mark: __{user.display_name}__에게 __{word.word}__ 단어를 '
-                           f'__{discount}%__ 할인으로 적용했습니다.', delete_after=PERIOD)
-        else:
-            await ctx.send(f':white_check_mark: __{user.display_name}__에게 __{word.word}__ 단어의 할인을 취소했습니다.',
-                           delete_after=PERIOD)
-        self.words = Word.get_all()
+        await self.post_dashboard(ctx.channel, self.get_dashboard_embed(await self.get_snapshot()))
+        await ctx.send(':white_check_mark: 대시보드를 게시했습니다.', delete_after=PERIOD)
 
     @cog_slash(
         name='debug_remove',
         description='사용자를 삭제합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
     )
+    @timed('/debug_remove')
+    @guild_scoped
     async def debug_remove(self, ctx: SlashContext):
-        if ctx.author.id not in DEVELOPERS:
-            await ctx.send(f':warning: __{ctx.author.display_name}__님은 권한이 없습니다.', delete_after=PERIOD)
-            return
-        Owner.remove_owner(ctx.author.id)
-        await ctx.send(f':white_check_mark: __{ctx.author.display_name}__ 사용자를 삭제했습니다.', delete_after=PERIOD)
+        async with self.lock:
+            if ctx.author.id not in DEVELOPERS:
+                await ctx.send(f':warning: __{ctx.author.display_name}__님은 권한이 없습니다.', delete_after=PERIOD)
+                return
+            owner = await run(Owner.get_by_id, ctx.author.id)
+            if owner is not None:
+                await run(owner.load_words)
+                await run(market.close_owner, owner.id, [word.id for word in owner.words])
+            await run(Contract.remove_owner, ctx.author.id)
+            await run(Owner.remove_owner, ctx.author.id)
+            if owner is not None:
+                for word in owner.words:
+                    await run(self.remove_word, word.word)
+            await ctx.send(f':white_check_mark: __{ctx.author.display_name}__ 사용자를 삭제했습니다.', delete_after=PERIOD)
 
     @cog_slash(
         name='debug_set_money',
         description='사용자의 소지금을 설정합니다.',
-        guild_ids=GUILDS,
+        guild_ids=COMMAND_GUILDS,
         options=[
             create_option(
                 name='money',
@@ -619,19 +1133,59 @@ class GeneralCog(Cog):
             )
         ]
     )
+    @timed('/debug_set_money')
+    @guild_scoped
     async def debug_set_money(self, ctx: SlashContext, money: float, user: Optional[User] = None):
+        money = to_money(money)
+        async with self.lock:
+            if ctx.author.id not in DEVELOPERS:
+                await ctx.send(f':warning: __{ctx.author.display_name}__님은 권한이 없습니다.', delete_after=PERIOD)
+                return
+            if user is None:
+                user = ctx.author
+            owner = await run(Owner.get_by_id, user.id)
+            if owner is None:
+                await ctx.send(f':warning: __{user.display_name}__ 사용자를 찾을 수 없습니다.', delete_after=PERIOD)
+                return
+            await run(owner.set_money, money)
+            await ctx.send(f':white_check_mark: __{user.display_name}__님의 소지금을 '
+                           f'__{format_money(money)}__로 설정했습니다.', delete_after=PERIOD)
+
+    @cog_slash(
+        name='debug_backfill',
+        description='단어 검출 기록으로 시간별 집계를 다시 만듭니다.',
+        guild_ids=COMMAND_GUILDS,
+    )
+    @timed('/debug_backfill')
+    @guild_scoped
+    async def debug_backfill(self, ctx: SlashContext):
         if ctx.author.id not in DEVELOPERS:
             await ctx.send(f':warning: __{ctx.author.display_name}__님은 권한이 없습니다.', delete_after=PERIOD)
             return
-        if user is None:
-            user = ctx.author
-        owner = Owner.get_by_id(user.id)
-        if owner is None:
-            await ctx.send(f':warning: __{user.display_name}__ 사용자를 찾을 수 없습니다.', delete_after=PERIOD)
+        message = await ctx.send(':hourglass: 시간별 집계를 다시 만드는 중입니다...')
+        await run(backfill_rollups)
+        await message.edit(content=':white_check_mark: 시간별 집계를 다시 만들었습니다.', delete_after=PERIOD)
+
+    @cog_slash(
+        name='debug_stats',
+        description='명령어, 쿼리와 단어 검출의 성능 통계를 확인합니다.',
+        guild_ids=COMMAND_GUILDS,
+    )
+    @timed('/debug_stats')
+    @guild_scoped
+    async def debug_stats(self, ctx: SlashContext):
+        if ctx.author.id not in DEVELOPERS:
+            await ctx.send(f':warning: __{ctx.author.display_name}__님은 권한이 없습니다.', delete_after=PERIOD)
             return
-        owner.set_money(money)
-        await ctx.send(f':white_check_mark: __{user.display_name}__님의 소지금을 '
-                       f'__{format_money(money)}__로 설정했습니다.', delete_after=PERIOD)
+        embed = Embed(title='성능 통계', color=YELLOW)
+        sections = (('시간', get_histograms(timings)), ('단어 검출', get_histograms(counts)),
+                    ('느린 쿼리', [(f'`{shape[:80]}`', histogram) for shape, histogram in get_slow_queries(5)]))
+        for name, histograms in sections:
+            value = '\n'.join(f'{key}: {histogram}' for key, histogram in histograms)
+            embed.add_field(name=name, value=value[:1024] or '기록 없음', inline=False)
+        embed.add_field(name='캐시', value=f'단어 (ID): {word_cache}\n단어 (단어): {word_text_cache}\n사용자: {owner_cache}',
+                        inline=False)
+        await ctx.send(':white_check_mark: 성능 통계를 가져왔습니다.', embed=embed, delete_after=PERIOD)
 
 
 def setup(bot: Bot):
@@ -2,13 +2,45 @@ import json
 
 CURRENCY_NAME = '로소'
 CURRENCY_SYMBOL = 'R'
+MONEY_SCALE = 1000  # money is stored and computed in integer milli-로소
+RATE_SCALE = 1000  # rates, discounts and shares are stored and computed in integer per-mille
 
 YELLOW = 0xffbb00
 AQUA = 0x03a9fc
 
 PERIOD = 20
 
-GUILDS = [935817966757478452]
+OWNER_PAYOUT_RATE = 1100  # per-mille of every fee charged for a word its owners get
+KEYSTROKE_INCOME = 9  # milli-로소 the author of a message earns per keystroke
+PRICE_RATE_EXPONENT = 2  # the fee of a word is length ** exponent / divisor of its price
+PRICE_RATE_DIVISOR = 100
+
+LEDGER_FLUSH_INTERVAL = 1.0  # seconds
+LEDGER_FLUSH_SIZE = 100  # balance mutations
+LOG_FLUSH_INTERVAL = 5.0  # seconds
+LOG_FLUSH_SIZE = 500  # word_use rows
+LEADERBOARD_SIZE = 50  # words kept sorted by revenue
+WORD_CACHE_SIZE = 10000  # Word objects kept in the identity map
+OWNER_CACHE_SIZE = 1000  # Owner objects kept in the identity map
+TELEMETRY_DUMP_PATH = None  # JSON lines file the telemetry is appended to, e.g. 'res/telemetry.jsonl'
+TELEMETRY_DUMP_INTERVAL = 60.0  # seconds
+DASHBOARD_INTERVAL = 300.0  # seconds between the dashboard snapshots
+INGEST_WORKERS = 0  # processes that match the messages; 0 matches them on the database threads
+SNAPSHOT_DIRECTORY = 'res/snapshots'  # pickled matchers read by the ingest workers
+DATABASE_SYNCHRONOUS = 'NORMAL'  # in WAL mode a crash can only lose the last commits, never corrupt the file
+WAL_AUTOCHECKPOINT = 1000  # pages of the WAL file before it is checkpointed into the database
+READER_THREADS = 2  # read-only connections per guild for the query-only commands
+LOG_PAGE_SIZE = 25  # most rows on a /log page, so a page always fits in an embed
+LOG_PAGE_TIMEOUT = 60.0  # seconds the /log buttons wait for a click
+RETENTION_DAYS = 30  # days the raw word_use rows are kept before they are archived
+RETENTION_INTERVAL = 3600.0  # seconds between the compaction runs
+RETENTION_VACUUM_PAGES = 1000  # free pages given back to the file system after each compacted day
+ARCHIVE_DIRECTORY = 'res/archive'  # gzipped JSON lines of the archived rows, one file per guild and day
+MATCHER_DIRECTORY = 'res/matchers'  # compiled matchers saved at shutdown and mapped at startup, one per guild
+
+GUILDS = [935817966757478452]  # the first guild keeps the legacy res/db file
+SHARD_DIRECTORY = 'res/guilds'  # database files of the other guilds
+COMMAND_GUILDS = None  # guilds the slash commands are registered in, e.g. GUILDS to test; None is every guild
 DEVELOPERS = [366565792910671873]
 
 
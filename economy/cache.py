@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, TypeVar
+
+from const import WORD_CACHE_SIZE, OWNER_CACHE_SIZE
+from shard import ShardLocal
+
+T = TypeVar('T')
+
+
+class IdentityMap(Generic[T]):
+    """
+    LRU map from a key to the single live object of that key.
+
+    Mutating code paths invalidate the keys they change, so a cached object is never stale.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.objects: 'OrderedDict[Hashable, T]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.objects)
+
+    def get(self, key: Hashable) -> Optional[T]:
+        """
+        Get the cached object of a key, and mark it as recently used.
+        :param key: key of the object
+        :return: the object, or None on a miss
+        """
+        if key not in self.objects:
+            self.misses += 1
+            return
+        self.hits += 1
+        self.objects.move_to_end(key)
+        return self.objects[key]
+
+    def put(self, key: Hashable, value: T) -> T:
+        """
+        Cache an object, evicting the least recently used one if the map is full.
+        :return: the cached object
+        """
+        self.objects[key] = value
+        self.objects.move_to_end(key)
+        if len(self.objects) > self.size:
+            self.objects.popitem(last=False)
+        return value
+
+    def invalidate(self, key: Hashable):
+        """ Drop the cached object of a key, if any. """
+        self.objects.pop(key, None)
+
+    def clear(self):
+        self.objects.clear()
+
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f'{len(self.objects)}/{self.size} cached, {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)'
+
+
+def forget_word(word_id: int, text: str):
+    """ Invalidate a word, by ID and by text. """
+    word_cache.invalidate(word_id)
+    word_text_cache.invalidate(text)
+
+
+def forget_owner(owner_id: int):
+    """ Invalidate an owner. """
+    owner_cache.invalidate(owner_id)
+
+
+word_cache = ShardLocal(lambda: IdentityMap(WORD_CACHE_SIZE))
+word_text_cache = ShardLocal(lambda: IdentityMap(WORD_CACHE_SIZE))
+owner_cache = ShardLocal(lambda: IdentityMap(OWNER_CACHE_SIZE))
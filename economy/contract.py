@@ -0,0 +1,120 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from const import RATE_SCALE
+from economy.models import Owner
+from shard import ShardLocal
+from util import database, get_reader
+
+
+class Contract:
+    """ A share of the income of a word, given to a beneficiary until the contract expires. """
+
+    @staticmethod
+    def new(word_id: int, beneficiary_id: int, share: int, expires: datetime) -> 'Contract':
+        """
+        Make a contract, and rebuild the payout table.
+        :param word_id: economy Word ID
+        :param beneficiary_id: Discord ID of the owner who gets the share
+        :param share: share of the income in per-mille, more than 0 and at most RATE_SCALE
+        :param expires: end of the contract
+        :return: Contract object
+        :exception ValueError: if the beneficiary is not an owner, or the active shares of the word would add up
+                               to more than RATE_SCALE
+        """
+        if not 0 < share <= RATE_SCALE:
+            raise ValueError(f'Share {share} is out of range')
+        if not Owner.is_owner(beneficiary_id):
+            raise ValueError(f'Owner with id {beneficiary_id} does not exist')
+        if share > payouts.get_available_share(word_id):
+            raise ValueError(f'Shares of the word with id {word_id} would exceed {RATE_SCALE}')
+        cursor = database.cursor()
+        cursor.execute('INSERT INTO contract (word_id, beneficiary_id, share, expires) VALUES (?, ?, ?, ?)',
+                       (word_id, beneficiary_id, share, expires))
+        database.commit()
+        payouts.load()
+        return Contract(cursor.lastrowid, word_id, beneficiary_id, share, expires)
+
+    @staticmethod
+    def get_by_word(word_id: int) -> List['Contract']:
+        """
+        Get the active contracts of a word.
+        :param word_id: economy Word ID
+        :return: list of Contract objects, the earliest expiry first
+        """
+        cursor = get_reader().cursor()
+        cursor.execute('SELECT id, word_id, beneficiary_id, share, expires FROM contract '
+                       'WHERE word_id = ? AND expires > ? ORDER BY expires',
+                       (word_id, datetime.now()))
+        return [Contract(id_, word_id, beneficiary_id, share, datetime.fromisoformat(expires))
+                for id_, word_id, beneficiary_id, share, expires in cursor.fetchall()]
+
+    @staticmethod
+    def remove_owner(owner_id: int):
+        """ Drop the contracts that pay a removed owner; their shares go back to the word owners. """
+        cursor = database.cursor()
+        cursor.execute('DELETE FROM contract WHERE beneficiary_id = ?', (owner_id,))
+        database.commit()
+        payouts.load()
+
+    def __init__(self, id_: int, word_id: int, beneficiary_id: int, share: int, expires: datetime):
+        self.id = id_
+        self.word_id = word_id
+        self.beneficiary_id = beneficiary_id
+        self.share = share
+        self.expires = expires
+
+
+class PayoutTable:
+    """
+    The active contracts compiled into (beneficiary ID, share) lists per word.
+
+    The table is rebuilt only when a contract is made or removed, or when the earliest active contract
+    expires, so settling a detection is a dict lookup no matter how many contracts exist.
+    """
+
+    def __init__(self):
+        self.shares: Dict[int, List[Tuple[int, int]]] = dict()
+        self.next_expiry: Optional[datetime] = None
+
+    def load(self):
+        """ Compile the active contracts of the existing words. """
+        now = datetime.now()
+        cursor = database.cursor()
+        cursor.execute('SELECT word_id, beneficiary_id, share, expires FROM contract '
+                       'WHERE expires > ? AND word_id IN (SELECT id FROM word)', (now,))
+        shares: Dict[int, Dict[int, int]] = dict()
+        next_expiry = None
+        for word_id, beneficiary_id, share, expires in cursor.fetchall():
+            word_shares = shares.setdefault(word_id, dict())
+            word_shares[beneficiary_id] = word_shares.get(beneficiary_id, 0) + share
+            expires = datetime.fromisoformat(expires)
+            if next_expiry is None or expires < next_expiry:
+                next_expiry = expires
+        self.shares = {word_id: list(word_shares.items()) for word_id, word_shares in shares.items()}
+        self.next_expiry = next_expiry
+
+    def expire(self):
+        """ Rebuild the table if a contract has expired since the last build. """
+        if self.next_expiry is not None and datetime.now() >= self.next_expiry:
+            self.load()
+
+    def get(self, word_id: int) -> List[Tuple[int, int]]:
+        """
+        Get who shares the income of a word. The word owner gets the rest.
+        :param word_id: economy Word ID
+        :return: list of (beneficiary ID, share in per-mille)
+        """
+        return self.shares.get(word_id, [])
+
+    def get_total_share(self, word_id: int) -> int:
+        """ Get the share of the income of a word that does not go to its owner, in per-mille. """
+        return sum(share for _, share in self.get(word_id))
+
+    def get_available_share(self, word_id: int) -> int:
+        """ Get the share of the income of a word that can still be contracted, in per-mille. """
+        self.expire()
+        return RATE_SCALE - self.get_total_share(word_id)
+
+
+payouts = ShardLocal(PayoutTable)
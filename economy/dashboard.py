@@ -0,0 +1,149 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from heapq import nlargest
+from sqlite3 import Cursor
+from typing import Dict, List, Optional, Tuple
+
+from economy.executor import read_transaction
+from economy.ledger import ledger
+from economy.pricing import pricing
+from economy.usage import leaderboard, log_buffer, get_hour
+from shard import ShardLocal
+from util import database, get_reader
+
+
+class WordStat:
+    """ Figures of a word at the time of a snapshot. """
+
+    def __init__(self, word_id: int, word: str, owner_id: int, price: int, revenue: int, daily_revenue: int):
+        self.word_id = word_id
+        self.word = word
+        self.owner_id = owner_id
+        self.price = price
+        self.fee = pricing.get_fee(price, len(word))
+        self.revenue = revenue
+        self.daily_revenue = daily_revenue
+
+    @property
+    def profit_rate(self) -> float:
+        """ Revenue so far over the registration price. """
+        return self.revenue / self.price if self.price else 0.0
+
+
+class WordTable:
+    """
+    The rows of the `word` table the snapshots are built from, with the total price of the words of each owner.
+
+    The rows are read again only when the dictionary version has changed since the last build, so a snapshot of
+    an unchanged dictionary reads no word at all. A build replaces the dicts rather than changing them, so the
+    snapshots that hold the previous ones keep them as they were.
+    """
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.words: Dict[int, Tuple[str, int, int]] = dict()
+        self.prices: Dict[int, int] = dict()
+
+    def refresh(self, cursor: Cursor):
+        """ Read the words again if they changed, in the transaction of the cursor. """
+        cursor.execute("SELECT value FROM meta WHERE key = 'dictionary_version'")
+        version = cursor.fetchone()[0]
+        if version == self.version:
+            return
+        cursor.execute('SELECT id, word, owner_id, price FROM word')
+        words = {word_id: (word, owner_id, price) for word_id, word, owner_id, price in cursor.fetchall()}
+        prices: Dict[int, int] = defaultdict(int)
+        for _, owner_id, price in words.values():
+            prices[owner_id] += price
+        self.words, self.prices, self.version = words, dict(prices), version
+
+
+word_table = ShardLocal(WordTable)
+
+
+class Snapshot:
+    """ Rankings and word figures of the whole economy, built at once and served until the next build. """
+
+    def __init__(self, created: datetime, money: List[Tuple[int, int]], property_: List[Tuple[int, int]],
+                 words: List[WordStat], table: Dict[int, Tuple[str, int, int]], revenues: Dict[int, int],
+                 daily: Dict[int, int]):
+        self.created = created
+        self.money = money
+        self.property = property_
+        self.words = words
+        self.table = table
+        self.revenues = revenues
+        self.daily = daily
+
+    def get_stat(self, word_id: int) -> WordStat:
+        word, owner_id, price = self.table[word_id]
+        return WordStat(word_id, word, owner_id, price, self.revenues.get(word_id, 0), self.daily.get(word_id, 0))
+
+    def get_owner_words(self, owner_id: int) -> List[WordStat]:
+        """ Get the figures of the words of an owner, the highest revenue first. """
+        stats = [self.get_stat(word_id) for word_id, (_, word_owner_id, _) in self.table.items()
+                 if word_owner_id == owner_id]
+        return sorted(stats, key=lambda x: x.revenue, reverse=True)
+
+
+def build_snapshot(count: int = 10) -> Snapshot:
+    """
+    Build a snapshot from the balances, the revenue counters of the leaderboard and the hourly rollups of the past
+    day. The words are only read when they changed since the last build, and the figures of a word are made when
+    they are asked for. Runs on a reader thread; the unflushed balances and rows are copied from the buffers.
+    :param count: count of the rows of each ranking
+    :return: the snapshot
+    """
+    def capture():
+        return ({owner_id: ledger.balances[owner_id] for owner_id in ledger.dirty}, list(log_buffer.rows),
+                dict(leaderboard.revenues), leaderboard.get_top(count))
+
+    now = datetime.now()
+    with read_transaction(capture) as (cursor, (balances, pending, revenues, top)):
+        # one row per member, far fewer than the words, and the ledger only holds the balances it has touched
+        cursor.execute('SELECT id, money FROM owner')
+        money = dict(cursor.fetchall())
+        money.update((owner_id, balance) for owner_id, balance in balances.items() if owner_id in money)
+        daily: Dict[int, int] = defaultdict(int)
+        cursor.execute('SELECT word_id, revenue FROM word_use_hourly WHERE hour >= ?',
+                       (get_hour(now - timedelta(days=1)),))
+        for word_id, revenue in cursor.fetchall():
+            daily[word_id] += revenue
+        for _, _, word_id, amount in pending:
+            daily[word_id] += amount
+        word_table.refresh(cursor)
+        table, prices = word_table.words, word_table.prices
+
+    property_ = {owner_id: balance + prices.get(owner_id, 0) for owner_id, balance in money.items()}
+    snapshot = Snapshot(now,
+                        nlargest(count, money.items(), key=lambda x: x[1]),
+                        nlargest(count, property_.items(), key=lambda x: x[1]),
+                        list(), table, revenues, dict(daily))
+    snapshot.words = [snapshot.get_stat(word_id) for word_id, _ in top if word_id in table]
+    return snapshot
+
+
+def get_dashboards() -> List[Tuple[int, int, Optional[int]]]:
+    """
+    Get the dashboard message of every guild.
+    :return: list of (guild ID, channel ID, message ID)
+    """
+    cursor = get_reader().cursor()
+    cursor.execute('SELECT guild_id, channel_id, message_id FROM dashboard')
+    return cursor.fetchall()
+
+
+def set_dashboard(guild_id: int, channel_id: int, message_id: int) -> Optional[Tuple[int, int]]:
+    """
+    Set the message the dashboard of a guild is published in, replacing the previous one.
+    :return: (channel ID, message ID) of the replaced dashboard, or None if the guild had none
+    """
+    cursor = database.cursor()
+    cursor.execute('SELECT channel_id, message_id FROM dashboard WHERE guild_id = ?', (guild_id,))
+    replaced = cursor.fetchone()
+    cursor.execute('INSERT INTO dashboard (guild_id, channel_id, message_id) VALUES (?, ?, ?) '
+                   'ON CONFLICT (guild_id) DO UPDATE SET channel_id = excluded.channel_id, '
+                   'message_id = excluded.message_id',
+                   (guild_id, channel_id, message_id))
+    database.commit()
+    return replaced
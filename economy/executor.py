@@ -0,0 +1,122 @@
+from asyncio import get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from sqlite3 import Cursor
+from threading import RLock
+from time import perf_counter
+from typing import Callable, Iterator, Tuple, TypeVar
+
+from const import READER_THREADS
+from shard import Shard, ShardLocal, current, get_current
+from telemetry import timings, record
+from util import database, get_reader, open_reader
+
+T = TypeVar('T')
+
+
+class DatabaseExecutor:
+    """
+    Runs the blocking database access on a single dedicated thread, so the event loop never waits for sqlite.
+
+    Jobs are queued in the order they are submitted and run one at a time, which keeps the single sqlite
+    connection and the in-memory buffers free of concurrent access. Every shard has its own thread, so a busy
+    guild never queues in front of a quiet one.
+
+    Query-only work runs on a few reader threads instead, each with a read-only connection. In WAL mode
+    they read the last commit while the writer goes on, so a long scan never delays a message being billed.
+    """
+
+    def __init__(self, shard: Shard):
+        self.shard = shard
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'database-{shard.guild_id}',
+                                           initializer=current.set, initargs=(shard,))
+        self.readers = ThreadPoolExecutor(max_workers=READER_THREADS, thread_name_prefix=f'reader-{shard.guild_id}',
+                                          initializer=open_reader, initargs=(shard,))
+        # held by every writer job, so a reader that takes it sees the buffers and the database between two jobs
+        self.lock = RLock()
+
+    def _job(self, func: Callable[..., T], submitted: float) -> T:
+        started = perf_counter()
+        record(timings, 'database.wait', started - submitted)
+        try:
+            with self.lock:
+                return func()
+        finally:
+            record(timings, 'database.execution', perf_counter() - started)
+
+    def _read_job(self, func: Callable[..., T], submitted: float) -> T:
+        started = perf_counter()
+        record(timings, 'reader.wait', started - submitted)
+        try:
+            return func()
+        finally:
+            record(timings, 'reader.execution', perf_counter() - started)
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a blocking function on the database thread and wait for its result.
+        :param func: function to run
+        :return: return value of the function
+        """
+        job = partial(self._job, partial(func, *args, **kwargs), perf_counter())
+        return await get_running_loop().run_in_executor(self.executor, job)
+
+    async def read(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a blocking query-only function on a reader thread and wait for its result.
+        :param func: function to run; it reads through `get_reader` or `read_transaction`
+        :return: return value of the function
+        """
+        job = partial(self._read_job, partial(func, *args, **kwargs), perf_counter())
+        return await get_running_loop().run_in_executor(self.readers, job)
+
+    def shutdown(self):
+        """ Wait for the queued jobs and stop the database and reader threads. """
+        self.readers.shutdown(wait=True)
+        self.executor.shutdown(wait=True)
+
+
+executor = ShardLocal(lambda: DatabaseExecutor(get_current()))
+
+
+async def run(func: Callable[..., T], *args, **kwargs) -> T:
+    """ Run a blocking function on the database thread of the current shard. """
+    return await executor.run(func, *args, **kwargs)
+
+
+async def run_in(shard: Shard, func: Callable[..., T], *args, **kwargs) -> T:
+    """ Run a blocking function on the database thread of a shard, e.g. for every shard from a loop. """
+    return await executor.shard_instance(shard).run(func, *args, **kwargs)
+
+
+async def read(func: Callable[..., T], *args, **kwargs) -> T:
+    """ Run a blocking query-only function on a reader thread of the current shard. """
+    return await executor.read(func, *args, **kwargs)
+
+
+@contextmanager
+def read_transaction(capture: Callable[[], T]) -> Iterator[Tuple[Cursor, T]]:
+    """
+    Read the database and the in-memory buffers of the current shard as of the same moment.
+
+    On a reader thread, the read transaction is started and `capture` copies the buffers while no writer job
+    runs; the queries of the block then read that WAL snapshot without holding up the writer. On any other
+    thread the writer connection is read as it is.
+    :param capture: function that copies what the block needs from the buffers
+    :return: a cursor and the return value of `capture`
+    """
+    connection = get_reader()
+    if connection is database.shard_instance():
+        yield connection.cursor(), capture()
+        return
+    cursor = connection.cursor()
+    with executor.lock:
+        cursor.execute('BEGIN')
+        # the first read pins the snapshot
+        cursor.execute('SELECT COUNT(*) FROM sqlite_master').fetchall()
+        captured = capture()
+    try:
+        yield cursor, captured
+    finally:
+        connection.rollback()
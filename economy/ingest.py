@@ -0,0 +1,96 @@
+import pickle
+from asyncio import get_running_loop, Future
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count as counter
+from multiprocessing import get_context
+from os import getpid, makedirs, path, remove, replace
+from shutil import rmtree
+from typing import Dict, List, Optional, Tuple
+
+from const import INGEST_WORKERS, SNAPSHOT_DIRECTORY
+from economy.matcher import WordMatcher
+from shard import ShardLocal, get_current
+from util import get_hangul_keys
+
+# snapshot versions are unique within the process, so a worker never mistakes an old file for a new one
+versions = counter(1)
+
+# worker process: guild ID -> (snapshot version, matcher)
+_matchers: Dict[int, Tuple[int, WordMatcher]] = dict()
+
+
+def scan(guild_id: int, version: int, snapshot_path: str, content: str) -> Tuple[List[int], int]:
+    """
+    Match a message against a dictionary snapshot. Runs in a worker process, which loads the snapshot of
+    a guild only when its version changed.
+    :return: IDs of the matched words in billing order, and the keystrokes of the message
+    """
+    cached = _matchers.get(guild_id)
+    if cached is None or cached[0] != version:
+        with open(snapshot_path, 'rb') as file:
+            cached = _matchers[guild_id] = (version, pickle.load(file))
+    return [word.id for word in cached[1].find(content)], get_hangul_keys(content)
+
+
+class MatcherSnapshot:
+    """ The latest pickled matcher of a shard, which the worker processes load. """
+
+    def __init__(self):
+        # (version, path), replaced as a whole so the event loop never reads half an update
+        self.latest: Optional[Tuple[int, str]] = None
+        self.previous: Optional[str] = None
+        self.source: Optional[Tuple[int, int]] = None
+
+    def publish(self, matcher: WordMatcher):
+        """
+        Write a new snapshot if the registered texts changed since the last one. Runs on the database thread,
+        before the command that changed the dictionary returns, so only messages already being scanned can
+        miss the change.
+        """
+        source = (id(matcher), matcher.revision)
+        if source == self.source:
+            return
+        version = next(versions)
+        snapshot_path = path.join(SNAPSHOT_DIRECTORY, f'{get_current().guild_id}-{getpid()}-{version}.pickle')
+        with open(snapshot_path + '.tmp', 'wb') as file:
+            pickle.dump(matcher.compile(), file, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(snapshot_path + '.tmp', snapshot_path)
+        # the previous file stays for the messages that are still being scanned with it
+        if self.previous is not None:
+            remove(self.previous)
+        self.previous = self.latest[1] if self.latest is not None else None
+        self.latest, self.source = (version, snapshot_path), source
+
+
+snapshots = ShardLocal(MatcherSnapshot)
+
+
+class Ingestor:
+    """
+    Pool of worker processes that match the messages, so matching is not bound by the GIL.
+
+    Workers only read the dictionary snapshots; the balances are still checked and written on the database
+    thread of each shard, in the order the messages arrived.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS):
+        rmtree(SNAPSHOT_DIRECTORY, ignore_errors=True)
+        makedirs(SNAPSHOT_DIRECTORY)
+        # fork, because spawning would run the bot's __main__ again in every worker
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('fork'))
+        # start every worker now, before the database threads exist
+        self.pool.submit(int).result()
+
+    def scan(self, content: str) -> 'Future[Tuple[List[int], int]]':
+        """
+        Start matching a message of the current shard in a worker process.
+        :return: future of the IDs of the matched words in billing order, and the keystrokes of the message;
+                 it raises FileNotFoundError if the snapshot was replaced twice while the message waited
+        """
+        version, snapshot_path = snapshots.shard_instance().latest
+        return get_running_loop().run_in_executor(
+            self.pool, scan, get_current().guild_id, version, snapshot_path, content)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+        rmtree(SNAPSHOT_DIRECTORY, ignore_errors=True)
@@ -0,0 +1,117 @@
+from sqlite3 import Cursor
+from time import monotonic
+from typing import Dict, Optional, Set
+
+from const import LEDGER_FLUSH_INTERVAL, LEDGER_FLUSH_SIZE
+from shard import ShardLocal
+from util import database
+
+
+class Ledger:
+    """
+    Write-back cache of the owner balances, in integer milli-로소.
+
+    Debits and credits are applied in memory and written to the `owner` table in group commits,
+    either every `flush_interval` seconds or every `flush_size` mutations. The ledger never commits by itself:
+    `economy.settlement.flush` writes it in the same transaction as the log rows the balances were moved for.
+    """
+
+    def __init__(self, flush_interval: float = LEDGER_FLUSH_INTERVAL, flush_size: int = LEDGER_FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+
+        self.balances: Dict[int, int] = dict()
+        self.dirty: Set[int] = set()
+        self.mutations = 0
+        self.last_flush = monotonic()
+
+    def load(self, owner_id: int, money: int):
+        """
+        Remember a balance read from the database, unless a newer one is already cached.
+        :param owner_id: Discord ID
+        :param money: balance stored in the database
+        """
+        self.balances.setdefault(owner_id, money)
+
+    def get(self, owner_id: int) -> Optional[int]:
+        """
+        Get the latest balance of an owner.
+        :param owner_id: Discord ID
+        :return: balance, or None if the owner does not exist
+        """
+        if owner_id not in self.balances:
+            cursor = database.cursor()
+            cursor.execute('SELECT money FROM owner WHERE id = ?', (owner_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return
+            self.balances[owner_id] = row[0]
+        return self.balances[owner_id]
+
+    def set(self, owner_id: int, money: int) -> int:
+        """
+        Set the balance of an owner.
+        :param owner_id: Discord ID
+        :param money: new balance
+        :return: new balance
+        """
+        self.balances[owner_id] = money
+        self.dirty.add(owner_id)
+        self.mutations += 1
+        return money
+
+    def credit(self, owner_id: int, amount: int) -> int:
+        """
+        Add money to an owner.
+        :param owner_id: Discord ID
+        :param amount: amount of money, negative for a debit
+        :return: new balance
+        :exception ValueError: if the owner does not exist
+        """
+        money = self.get(owner_id)
+        if money is None:
+            raise ValueError(f'Owner with id {owner_id} does not exist')
+        return self.set(owner_id, money + amount)
+
+    def debit(self, owner_id: int, amount: int) -> int:
+        """
+        Take money from an owner.
+        :param owner_id: Discord ID
+        :param amount: amount of money
+        :return: new balance
+        """
+        return self.credit(owner_id, -amount)
+
+    def discard(self, owner_id: int):
+        """ Forget an owner, e.g. after they were removed. """
+        self.balances.pop(owner_id, None)
+        self.dirty.discard(owner_id)
+
+    def apply(self, deltas: Dict[int, int]):
+        """
+        Add money to many owners at once, without flushing in between.
+        :param deltas: Discord ID -> amount of money, negative for a debit
+        :exception ValueError: if an owner does not exist, in which case no balance is changed
+        """
+        for owner_id in deltas:
+            if self.get(owner_id) is None:
+                raise ValueError(f'Owner with id {owner_id} does not exist')
+        for owner_id, amount in deltas.items():
+            self.balances[owner_id] += amount
+            self.dirty.add(owner_id)
+        self.mutations += len(deltas)
+
+    def is_due(self) -> bool:
+        """ Whether enough mutations or time have piled up. """
+        return self.mutations >= self.flush_size or monotonic() - self.last_flush >= self.flush_interval
+
+    def write(self, cursor: Cursor):
+        """ Write every pending balance, leaving the commit to the caller. """
+        if self.dirty:
+            cursor.executemany('UPDATE owner SET money = ? WHERE id = ?',
+                               [(self.balances[owner_id], owner_id) for owner_id in self.dirty])
+            self.dirty.clear()
+        self.mutations = 0
+        self.last_flush = monotonic()
+
+ledger = ShardLocal(Ledger)
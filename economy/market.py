@@ -1,19 +1,122 @@
-from typing import Optional, List
+from bisect import insort, bisect_left
+from datetime import datetime
+from itertools import islice
+from typing import Optional, List, Dict, Iterable, Set, Tuple
 
+from economy.cache import forget_word, forget_owner
+from economy.ledger import ledger
 from economy.models import Word, Owner
+from economy.settlement import flush
+from shard import ShardLocal
 from util import database
 
 
-def exhibit(word: Word, price: float):
+class Fill:
+    """ A word that changed hands on the market. """
+
+    def __init__(self, word_id: int, seller_id: int, buyer_id: int, price: int):
+        self.word_id = word_id
+        self.seller_id = seller_id
+        self.buyer_id = buyer_id
+        self.price = price
+
+
+class OrderBook:
+    """
+    In-memory view of the `market` (asks) and `bid` tables.
+
+    Asks are kept in exhibit order and in a list sorted by price, so both listings are read in O(k).
+    A bid escrows its price from the bidder until it is filled or cancelled. Every change is written
+    through to the database, and the book is loaded once.
     """
-    Exhibits a word in the market.
+
+    def __init__(self):
+        self.asks: Dict[int, int] = dict()
+        self.by_price: List[Tuple[int, int]] = list()
+        self.bids: Dict[int, Dict[int, int]] = dict()
+
+    def load(self):
+        """ Load the asks and the bids of the existing words from the database. """
+        cursor = database.cursor()
+        cursor.execute('SELECT word_id, price FROM market WHERE word_id IN (SELECT id FROM word) ORDER BY rowid')
+        self.asks = dict(cursor.fetchall())
+        self.by_price = sorted((-price, word_id) for word_id, price in self.asks.items())
+        cursor.execute('SELECT word_id, bidder_id, price FROM bid WHERE word_id IN (SELECT id FROM word)')
+        self.bids = dict()
+        for word_id, bidder_id, price in cursor.fetchall():
+            self.bids.setdefault(word_id, dict())[bidder_id] = price
+
+    def add_ask(self, word_id: int, price: int):
+        self.asks[word_id] = price
+        insort(self.by_price, (-price, word_id))
+
+    def remove_ask(self, word_id: int) -> Optional[int]:
+        price = self.asks.pop(word_id, None)
+        if price is not None:
+            del self.by_price[bisect_left(self.by_price, (-price, word_id))]
+        return price
+
+    def get_best_bid(self, word_id: int) -> Optional[Tuple[int, int]]:
+        """
+        Get the highest bid on a word. Ties go to the earlier bid.
+        :return: (bidder ID, price), or None if there is no bid
+        """
+        bids = self.bids.get(word_id)
+        if not bids:
+            return
+        return max(bids.items(), key=lambda x: x[1])
+
+    def remove_bid(self, word_id: int, bidder_id: int) -> Optional[int]:
+        bids = self.bids.get(word_id, dict())
+        price = bids.pop(bidder_id, None)
+        if not bids:
+            self.bids.pop(word_id, None)
+        return price
+
+
+book = ShardLocal(OrderBook)
+
+
+def _transfer(word: Word, seller_id: int, buyer_id: int, price: int) -> Fill:
+    """
+    Hand a word over, record the fill and drop the bid of the buyer on it, and commit with the balances. The money
+    is moved in the ledger by the caller, and the book is only changed once the commit went through.
+    """
+    cursor = database.cursor()
+    cursor.execute('UPDATE word SET owner_id = ? WHERE id = ?', (buyer_id, word.id))
+    cursor.execute('INSERT INTO fill (word_id, seller_id, buyer_id, price, datetime) VALUES (?, ?, ?, ?, ?)',
+                   (word.id, seller_id, buyer_id, price, datetime.now()))
+    cursor.execute('DELETE FROM market WHERE word_id = ?', (word.id,))
+    cursor.execute('DELETE FROM bid WHERE word_id = ? AND bidder_id = ?', (word.id, buyer_id))
+    flush()
+    book.remove_ask(word.id)
+    book.remove_bid(word.id, buyer_id)
+    forget_word(word.id, word.word)
+    forget_owner(seller_id)
+    forget_owner(buyer_id)
+    return Fill(word.id, seller_id, buyer_id, price)
+
+
+def exhibit(word: Word, price: int) -> Optional[Fill]:
+    """
+    Exhibits a word in the market. If a standing bid is at or above the price, the word is sold
+    to the highest bidder at the bid price instead.
     :param word: The word to exhibit.
     :param price: The price of the word.
-    :return: None
+    :return: the fill if a bid was matched, None otherwise
+    :exception ValueError: if the owner of the word does not exist, in which case nothing is changed
     """
+    best = book.get_best_bid(word.id)
+    if best is not None and best[1] >= price:
+        bidder_id, bid_price = best
+        # the price was escrowed from the bidder when the bid was placed
+        ledger.apply({word.owner_id: bid_price})
+        return _transfer(word, word.owner_id, bidder_id, bid_price)
+
     cursor = database.cursor()
     cursor.execute('INSERT INTO market VALUES (?, ?)', (word.id, price))
     database.commit()
+    book.add_ask(word.id, price)
 
 
 def withhold(word_id: int):
@@ -25,46 +128,143 @@ def withhold(word_id: int):
     cursor = database.cursor()
     cursor.execute('DELETE FROM market WHERE word_id = ?', (word_id,))
     database.commit()
+    book.remove_ask(word_id)
 
 
-def buy(word: Word, owner: Owner):
+def buy(word: Word, owner: Owner) -> Fill:
     """
-    Buys a word from the market.
+    Buys a word from the market at its asking price. The escrow of a bid of the buyer on the word is refunded.
     :param word: The word to buy.
-    :param owner: The owner of the word.
-    :return: None
+    :param owner: The owner who buys the word.
+    :return: the fill
+    :exception ValueError: if the word is not on the market, the buyer owns it or cannot pay, or an owner does
+                           not exist, in which case nothing is changed
     """
-    withhold(word.id)
+    price = book.asks.get(word.id)
+    if price is None:
+        raise ValueError(f'Word with id {word.id} is not on the market')
+    if owner.id == word.owner_id:
+        raise ValueError(f'Owner with id {owner.id} already owns the word with id {word.id}')
+    escrow = get_bid(word.id, owner.id) or 0
+    if owner.money + escrow < price:
+        raise ValueError(f'Owner with id {owner.id} cannot pay {price}')
+    ledger.apply({owner.id: escrow - price, word.owner_id: price})
+    return _transfer(word, word.owner_id, owner.id, price)
+
+
+def bid(word: Word, bidder: Owner, price: int) -> Optional[Fill]:
+    """
+    Place a buy order on a word, replacing the previous bid of the bidder. The price is escrowed
+    from the bidder. If the word is on the market at or below the price, it is bought right away.
+    :param word: The word to bid on.
+    :param bidder: The owner who bids.
+    :param price: The highest price the bidder pays.
+    :return: the fill if the word was bought right away, None otherwise
+    :exception ValueError: if the bidder cannot pay, in which case nothing is changed
+    """
+    ask = book.asks.get(word.id)
+    if ask is not None and ask <= price:
+        return buy(word, bidder)
+
+    escrow = get_bid(word.id, bidder.id) or 0
+    if bidder.money + escrow < price:
+        raise ValueError(f'Owner with id {bidder.id} cannot pay {price}')
+    ledger.apply({bidder.id: escrow - price})
     cursor = database.cursor()
-    cursor.execute('UPDATE word SET owner_id = ? WHERE id = ?', (owner.id, word.id))
+    cursor.execute('DELETE FROM bid WHERE word_id = ? AND bidder_id = ?', (word.id, bidder.id))
+    cursor.execute('INSERT INTO bid (word_id, bidder_id, price, datetime) VALUES (?, ?, ?, ?)',
+                   (word.id, bidder.id, price, datetime.now()))
+    flush()
+    book.bids.setdefault(word.id, dict())[bidder.id] = price
+
+
+def unbid(word_id: int, bidder_id: int) -> Optional[int]:
+    """
+    Cancel a bid and refund its escrow.
+    :return: the refunded price, or None if there was no bid
+    """
+    price = get_bid(word_id, bidder_id)
+    if price is None:
+        return
+    ledger.credit(bidder_id, price)
+    cursor = database.cursor()
+    cursor.execute('DELETE FROM bid WHERE word_id = ? AND bidder_id = ?', (word_id, bidder_id))
+    flush()
+    book.remove_bid(word_id, bidder_id)
+    return price
+
+
+def close_word(word_id: int):
+    """ Withhold a word that is about to be removed, and refund every bid on it. """
+    for bidder_id in list(book.bids.get(word_id, dict())):
+        unbid(word_id, bidder_id)
+    if is_on_sale(word_id):
+        withhold(word_id)
+
+
+def close_owner(owner_id: int, word_ids: Iterable[int]):
+    """ Close the words of an owner that is about to be removed, and drop the bids of the owner. """
+    for word_id in word_ids:
+        close_word(word_id)
+    cursor = database.cursor()
+    cursor.execute('DELETE FROM bid WHERE bidder_id = ?', (owner_id,))
     database.commit()
+    for word_id in list(book.bids):
+        book.remove_bid(word_id, owner_id)
 
 
 def is_on_sale(word_id: int) -> bool:
     """ Check if the word is on the market """
-    cursor = database.cursor()
-    cursor.execute('SELECT * FROM market WHERE word_id = ?', (word_id,))
-    return cursor.fetchone() is not None
+    return word_id in book.asks
 
 
-def get_price(word_id: int) -> Optional[float]:
+def get_price(word_id: int) -> Optional[int]:
     """ Get the price of a word """
-    if not is_on_sale(word_id):
-        return None
-    cursor = database.cursor()
-    cursor.execute('SELECT price FROM market WHERE word_id = ?', (word_id,))
-    return cursor.fetchone()[0]
+    return book.asks.get(word_id)
+
+
+def get_on_sale(word_ids: Iterable[int]) -> Set[int]:
+    """ Get which of the words are on the market """
+    return {word_id for word_id in word_ids if word_id in book.asks}
+
+
+def get_prices(word_ids: Iterable[int]) -> Dict[int, int]:
+    """ Get the prices of the words on the market """
+    return {word_id: book.asks[word_id] for word_id in word_ids if word_id in book.asks}
+
+
+def get_bid(word_id: int, bidder_id: int) -> Optional[int]:
+    """ Get the standing bid of an owner on a word """
+    return book.bids.get(word_id, dict()).get(bidder_id)
+
+
+def get_available(word_id: int, bidder: Owner) -> int:
+    """ Get what an owner can bid on a word: the balance, and the escrow of the bid the new one replaces """
+    return bidder.money + (get_bid(word_id, bidder.id) or 0)
+
+
+def get_best_bid(word_id: int) -> Optional[int]:
+    """ Get the highest bid on a word """
+    best = book.get_best_bid(word_id)
+    return best[1] if best is not None else None
 
 
 def get_recent_words(count: int = 10) -> List[Word]:
-    """ Get the most recent words on the market """
-    cursor = database.cursor()
-    cursor.execute('SELECT word_id FROM market ORDER BY word_id DESC LIMIT ?', (count,))
-    return [Word.get_by_id(word_id) for (word_id,) in cursor.fetchall()]
+    """ Get the most recently exhibited words on the market """
+    return [Word.get_by_id(word_id) for word_id in islice(reversed(book.asks), count)]
 
 
 def get_words_by_price(count: int = 10) -> List[Word]:
     """ Get the most expensive words on the market """
-    cursor = database.cursor()
-    cursor.execute('SELECT word_id FROM market ORDER BY price DESC LIMIT ?', (count,))
-    return [Word.get_by_id(word_id) for (word_id,) in cursor.fetchall()]
+    return [Word.get_by_id(word_id) for _, word_id in book.by_price[:count]]
+
+
+def get_listings(sort: str = 'recent', count: int = 10) -> List[Tuple[Word, int, Optional[int]]]:
+    """
+    Get the words on the market with their asking price and highest bid, read at once on the database thread.
+    :param sort: 'recent' or 'price'
+    :param count: count of the words
+    :return: list of (word, asking price, highest bid or None)
+    """
+    words = get_words_by_price(count) if sort == 'price' else get_recent_words(count)
+    return [(word, book.asks[word.id], get_best_bid(word.id)) for word in words]
@@ -0,0 +1,205 @@
+import pickle
+from collections import deque
+from mmap import mmap, ACCESS_READ
+from os import makedirs, path, replace
+from struct import Struct, error as StructError
+from typing import Dict, List, Optional, Tuple, Iterable, Iterator
+
+from const import MATCHER_DIRECTORY
+from economy.models import Word
+from shard import get_current
+from telemetry import count
+
+# magic, format of the pickled matcher, dictionary version the matcher was built at
+HEADER = Struct('<4sIQ')
+MAGIC = b'GRSM'
+# bump whenever the attributes of WordMatcher or Word change, so older files are rebuilt
+FORMAT = 1
+
+
+class WordMatcher:
+    """
+    Aho-Corasick automaton over the registered words.
+
+    Finds every billable word of a message in one pass, while keeping the semantics of the old
+    "longest word first, consume the matched span" scan.
+    """
+
+    def __init__(self, words: Iterable[Word] = ()):
+        self.words: Dict[str, Word] = dict()
+
+        self._goto: List[Dict[str, int]] = [dict()]
+        self._fail: List[int] = [0]
+        self._output: List[Optional[str]] = [None]
+        self._dirty = False
+        # bumped whenever the set of registered texts changes
+        self.revision = 0
+
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self) -> Iterator[Word]:
+        return iter(self.words.values())
+
+    def __contains__(self, text: str) -> bool:
+        return text in self.words
+
+    def get(self, text: str) -> Optional[Word]:
+        """ Get the registered Word of the text, if any. """
+        return self.words.get(text)
+
+    def add(self, word: Word) -> 'WordMatcher':
+        """
+        Add a word, or replace the Word object of an already registered text (e.g. after a purchase).
+        :param word: Word object
+        """
+        if word.word not in self.words:
+            node = 0
+            for letter in word.word:
+                if letter not in self._goto[node]:
+                    self._goto.append(dict())
+                    self._fail.append(0)
+                    self._output.append(None)
+                    self._goto[node][letter] = len(self._goto) - 1
+                node = self._goto[node][letter]
+            self._output[node] = word.word
+            self._dirty = True
+            self.revision += 1
+        self.words[word.word] = word
+        return self
+
+    def remove(self, text: str) -> 'WordMatcher':
+        """
+        Remove a word. The trie nodes are kept, only the output is cleared.
+        :param text: word content
+        """
+        if self.words.pop(text, None) is None:
+            return self
+        node = 0
+        for letter in text:
+            node = self._goto[node][letter]
+        self._output[node] = None
+        self.revision += 1
+        return self
+
+    def compile(self) -> 'WordMatcher':
+        """ Compute the failure links now rather than on the next scan, e.g. before the matcher is pickled. """
+        if self._dirty:
+            self._build()
+        return self
+
+    def save(self, path: str, version: int):
+        """
+        Write the compiled matcher, with its Word objects, to a file.
+        :param path: path of the file, replaced as a whole
+        :param version: dictionary version of the database the matcher matches
+        """
+        with open(path + '.tmp', 'wb') as file:
+            file.write(HEADER.pack(MAGIC, FORMAT, version))
+            pickle.dump(self.compile(), file, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(path + '.tmp', path)
+
+    @staticmethod
+    def load(path: str, version: int) -> Optional['WordMatcher']:
+        """
+        Map a saved matcher into memory and unpickle it.
+        :param path: path of the file
+        :param version: current dictionary version of the database
+        :return: the matcher, or None if the file is missing, of another format or stale
+        """
+        try:
+            with open(path, 'rb') as file, mmap(file.fileno(), 0, access=ACCESS_READ) as view:
+                magic, format_, saved = HEADER.unpack_from(view)
+                if magic != MAGIC or format_ != FORMAT or saved != version:
+                    return
+                with memoryview(view) as buffer, buffer[HEADER.size:] as payload:
+                    return pickle.loads(payload)
+        except (OSError, ValueError, StructError, EOFError, pickle.UnpicklingError):
+            return
+
+    def _build(self):
+        """ (Re)compute the failure links after new words were inserted. """
+        queue = deque()
+        for node in self._goto[0].values():
+            self._fail[node] = 0
+            queue.append(node)
+        while queue:
+            node = queue.popleft()
+            for letter, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and letter not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(letter, 0)
+                queue.append(child)
+        self._dirty = False
+
+    def scan(self, content: str) -> List[Tuple[int, str]]:
+        """
+        Find all (possibly overlapping) occurrences of the registered words.
+        :param content: message content
+        :return: list of (start index, word text)
+        """
+        self.compile()
+        goto, fail, output = self._goto, self._fail, self._output
+        found = list()
+        node = 0
+        for i, letter in enumerate(content):
+            while node and letter not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(letter, 0)
+            suffix = node
+            while suffix:
+                if (text := output[suffix]) is not None:
+                    found.append((i - len(text) + 1, text))
+                suffix = fail[suffix]
+        return found
+
+    def find(self, content: str) -> List[Word]:
+        """
+        Find the words used in the content, in billing order.
+
+        Longer words win over shorter ones (ties go to the older word), and each matched span is consumed,
+        so a span is never billed twice.
+        :param content: message content
+        :return: list of Word objects, one per billable occurrence
+        """
+        candidates = sorted(self.scan(content),
+                            key=lambda x: (-len(x[1]), self.words[x[1]].id, x[0]))
+        used = bytearray(len(content))
+        hits = list()
+        for start, text in candidates:
+            end = start + len(text)
+            if any(used[start:end]):
+                continue
+            used[start:end] = b'\x01' * len(text)
+            hits.append(self.words[text])
+        count('words.scanned', len(candidates))
+        count('words.matched', len(hits))
+        return hits
+
+
+def get_matcher_path() -> str:
+    """ Get the path of the saved matcher of the current shard. """
+    makedirs(MATCHER_DIRECTORY, exist_ok=True)
+    return path.join(MATCHER_DIRECTORY, f'{get_current().guild_id}.pickle')
+
+
+def open_matcher() -> WordMatcher:
+    """
+    Load the saved matcher of the current shard, or build it from the database and save it if the dictionary
+    changed since it was saved. Runs on the database thread.
+    """
+    version = Word.get_dictionary_version()
+    matcher = WordMatcher.load(get_matcher_path(), version)
+    if matcher is None:
+        matcher = WordMatcher(Word.get_all())
+        matcher.save(get_matcher_path(), version)
+    return matcher
+
+
+def save_matcher(matcher: WordMatcher):
+    """ Save the matcher of the current shard, which must match the database, for the next startup. """
+    matcher.save(get_matcher_path(), Word.get_dictionary_version())
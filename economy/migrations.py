@@ -0,0 +1,326 @@
+from sqlite3 import Connection, Cursor
+from typing import Callable, List, Dict, Tuple
+
+from const import MONEY_SCALE, RATE_SCALE
+from economy.usage import rebuild_rollups
+
+
+def create_tables(cursor: Cursor):
+    """ The tables the bot was written against. """
+    cursor.execute('CREATE TABLE IF NOT EXISTS owner ('
+                   'id INTEGER PRIMARY KEY, '
+                   'money REAL NOT NULL DEFAULT 0)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS word ('
+                   'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                   'word TEXT NOT NULL, '
+                   'owner_id INTEGER NOT NULL, '
+                   'price REAL NOT NULL)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS market ('
+                   'word_id INTEGER NOT NULL, '
+                   'price REAL NOT NULL)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS preference ('
+                   'owner_id INTEGER NOT NULL, '
+                   'word_id INTEGER NOT NULL, '
+                   'rate REAL NOT NULL)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS word_use ('
+                   'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                   'datetime TIMESTAMP NOT NULL, '
+                   'user_id INTEGER NOT NULL, '
+                   'word_id INTEGER NOT NULL)')
+
+
+def create_rollups(cursor: Cursor):
+    """ The charged amount of each detection, the hourly rollups and the revenue counters. """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'word_revenue'")
+    if cursor.fetchone() is not None:
+        return
+    cursor.execute('PRAGMA table_info(word_use)')
+    if 'amount' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE word_use ADD COLUMN amount REAL')
+    cursor.execute('CREATE TABLE IF NOT EXISTS word_use_hourly ('
+                   'word_id INTEGER NOT NULL, '
+                   'hour TEXT NOT NULL, '
+                   'count INTEGER NOT NULL DEFAULT 0, '
+                   'revenue REAL NOT NULL DEFAULT 0, '
+                   'PRIMARY KEY (word_id, hour))')
+    cursor.execute('CREATE TABLE word_revenue ('
+                   'word_id INTEGER PRIMARY KEY, '
+                   'count INTEGER NOT NULL DEFAULT 0, '
+                   'revenue REAL NOT NULL DEFAULT 0)')
+    # nothing is archived before create_retention, which makes the table of the daily aggregates
+    rebuild_rollups(cursor, archived=False)
+
+
+def create_indexes(cursor: Cursor):
+    """ The indexes of the lookups and the sorted scans. """
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS word_word ON word (word)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS word_owner_id ON word (owner_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS word_use_word_id_datetime ON word_use (word_id, datetime)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS word_use_user_id_datetime ON word_use (user_id, datetime)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS word_use_datetime ON word_use (datetime)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS market_price ON market (price)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS market_word_id ON market (word_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS preference_word_id ON preference (word_id, owner_id)')
+
+
+def create_order_book(cursor: Cursor):
+    """ The standing buy orders with their escrow, and the history of the words sold on the market. """
+    cursor.execute('CREATE TABLE IF NOT EXISTS bid ('
+                   'word_id INTEGER NOT NULL, '
+                   'bidder_id INTEGER NOT NULL, '
+                   'price REAL NOT NULL, '
+                   'datetime TIMESTAMP NOT NULL, '
+                   'PRIMARY KEY (word_id, bidder_id))')
+    cursor.execute('CREATE TABLE IF NOT EXISTS fill ('
+                   'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                   'word_id INTEGER NOT NULL, '
+                   'seller_id INTEGER NOT NULL, '
+                   'buyer_id INTEGER NOT NULL, '
+                   'price REAL NOT NULL, '
+                   'datetime TIMESTAMP NOT NULL)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS bid_bidder_id ON bid (bidder_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS fill_word_id ON fill (word_id, datetime)')
+
+
+def create_contracts(cursor: Cursor):
+    """ The co-ownership contracts, which give a share of the income of a word to another owner. """
+    cursor.execute('CREATE TABLE IF NOT EXISTS contract ('
+                   'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                   'word_id INTEGER NOT NULL, '
+                   'beneficiary_id INTEGER NOT NULL, '
+                   'share REAL NOT NULL, '
+                   'expires TIMESTAMP NOT NULL)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS contract_word_id ON contract (word_id, expires)')
+
+
+def create_dashboard(cursor: Cursor):
+    """ The message each guild publishes its dashboard in. """
+    cursor.execute('CREATE TABLE IF NOT EXISTS dashboard ('
+                   'guild_id INTEGER PRIMARY KEY, '
+                   'channel_id INTEGER NOT NULL, '
+                   'message_id INTEGER NOT NULL)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS word_use_hourly_hour ON word_use_hourly (hour)')
+
+
+def create_retention(cursor: Cursor):
+    """ Per-day aggregates of the archived log, and incremental vacuum to shrink the file after compaction. """
+    cursor.execute('CREATE TABLE IF NOT EXISTS word_use_daily ('
+                   'day TEXT NOT NULL, '
+                   'user_id INTEGER NOT NULL, '
+                   'word_id INTEGER NOT NULL, '
+                   'count INTEGER NOT NULL, '
+                   'revenue REAL NOT NULL, '
+                   'PRIMARY KEY (day, user_id, word_id))')
+    # the file is switched to incremental vacuum by `migrate`, since that takes a full vacuum outside a transaction
+
+
+def create_dictionary_version(cursor: Cursor):
+    """ A counter of the changes of the words and their preferences, which the saved matchers are checked against. """
+    cursor.execute('CREATE TABLE IF NOT EXISTS meta ('
+                   'key TEXT PRIMARY KEY, '
+                   'value INTEGER NOT NULL)')
+    cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dictionary_version', 0)")
+    for table in ('word', 'preference'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version '
+                           f'AFTER {event} ON {table} BEGIN '
+                           "UPDATE meta SET value = value + 1 WHERE key = 'dictionary_version'; "
+                           'END')
+
+
+def rebuild_table(cursor: Cursor, table: str, columns: str, select: str):
+    """
+    Replace a table with one of other column types, which sqlite cannot alter in place. The rows keep their rowid
+    order, and the indexes, the triggers and the AUTOINCREMENT sequence of the table are made again.
+    :param cursor: database cursor
+    :param table: table name
+    :param columns: column definitions of the new table
+    :param select: expressions of the new columns, over the columns of the old table
+    """
+    cursor.execute("SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') "
+                   'AND sql IS NOT NULL', (table,))
+    schema = [sql for (sql,) in cursor.fetchall()]
+    cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+    sequence = cursor.fetchone()
+    cursor.execute(f'CREATE TABLE {table}_rebuilt ({columns})')
+    cursor.execute(f'INSERT INTO {table}_rebuilt SELECT {select} FROM {table} ORDER BY rowid')
+    cursor.execute(f'DROP TABLE {table}')
+    cursor.execute(f'ALTER TABLE {table}_rebuilt RENAME TO {table}')
+    for sql in schema:
+        cursor.execute(sql)
+    if sequence is not None:
+        # removed rows, e.g. archived ones, keep their IDs
+        cursor.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+        cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, sequence[0]))
+
+
+def convert_money(cursor: Cursor):
+    """ Integer milli-로소 instead of REAL 로소 in every column of money, so sums and balances are exact. """
+    def money(column: str) -> str:
+        return f'CAST(ROUND({column} * {MONEY_SCALE}) AS INTEGER)'
+
+    rebuild_table(cursor, 'owner',
+                  'id INTEGER PRIMARY KEY, '
+                  'money INTEGER NOT NULL DEFAULT 0',
+                  f'id, {money("money")}')
+    rebuild_table(cursor, 'word',
+                  'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                  'word TEXT NOT NULL, '
+                  'owner_id INTEGER NOT NULL, '
+                  'price INTEGER NOT NULL',
+                  f'id, word, owner_id, {money("price")}')
+    rebuild_table(cursor, 'market',
+                  'word_id INTEGER NOT NULL, '
+                  'price INTEGER NOT NULL',
+                  f'word_id, {money("price")}')
+    rebuild_table(cursor, 'bid',
+                  'word_id INTEGER NOT NULL, '
+                  'bidder_id INTEGER NOT NULL, '
+                  'price INTEGER NOT NULL, '
+                  'datetime TIMESTAMP NOT NULL, '
+                  'PRIMARY KEY (word_id, bidder_id)',
+                  f'word_id, bidder_id, {money("price")}, datetime')
+    rebuild_table(cursor, 'fill',
+                  'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                  'word_id INTEGER NOT NULL, '
+                  'seller_id INTEGER NOT NULL, '
+                  'buyer_id INTEGER NOT NULL, '
+                  'price INTEGER NOT NULL, '
+                  'datetime TIMESTAMP NOT NULL',
+                  f'id, word_id, seller_id, buyer_id, {money("price")}, datetime')
+    rebuild_table(cursor, 'word_use',
+                  'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                  'datetime TIMESTAMP NOT NULL, '
+                  'user_id INTEGER NOT NULL, '
+                  'word_id INTEGER NOT NULL, '
+                  'amount INTEGER',
+                  f'id, datetime, user_id, word_id, {money("amount")}')
+    rebuild_table(cursor, 'word_use_hourly',
+                  'word_id INTEGER NOT NULL, '
+                  'hour TEXT NOT NULL, '
+                  'count INTEGER NOT NULL DEFAULT 0, '
+                  'revenue INTEGER NOT NULL DEFAULT 0, '
+                  'PRIMARY KEY (word_id, hour)',
+                  f'word_id, hour, count, {money("revenue")}')
+    rebuild_table(cursor, 'word_revenue',
+                  'word_id INTEGER PRIMARY KEY, '
+                  'count INTEGER NOT NULL DEFAULT 0, '
+                  'revenue INTEGER NOT NULL DEFAULT 0',
+                  f'word_id, count, {money("revenue")}')
+    rebuild_table(cursor, 'word_use_daily',
+                  'day TEXT NOT NULL, '
+                  'user_id INTEGER NOT NULL, '
+                  'word_id INTEGER NOT NULL, '
+                  'count INTEGER NOT NULL, '
+                  'revenue INTEGER NOT NULL, '
+                  'PRIMARY KEY (day, user_id, word_id)',
+                  f'day, user_id, word_id, count, {money("revenue")}')
+    # the saved matchers hold Word objects with the old prices
+    cursor.execute("UPDATE meta SET value = value + 1 WHERE key = 'dictionary_version'")
+    # the rollups are summed again from the rounded amounts, so they match the log to the milli-로소
+    rebuild_rollups(cursor)
+
+
+def convert_rates(cursor: Cursor):
+    """ Integer per-mille instead of REAL fractions for the discount rates and the contract shares. """
+    def rate(column: str) -> str:
+        return f'CAST(ROUND({column} * {RATE_SCALE}) AS INTEGER)'
+
+    rebuild_table(cursor, 'preference',
+                  'owner_id INTEGER NOT NULL, '
+                  'word_id INTEGER NOT NULL, '
+                  'rate INTEGER NOT NULL',
+                  f'owner_id, word_id, {rate("rate")}')
+    rebuild_table(cursor, 'contract',
+                  'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                  'word_id INTEGER NOT NULL, '
+                  'beneficiary_id INTEGER NOT NULL, '
+                  'share INTEGER NOT NULL, '
+                  'expires TIMESTAMP NOT NULL',
+                  f'id, word_id, beneficiary_id, {rate("share")}, expires')
+    # the saved matchers hold Word objects with the old rates
+    cursor.execute("UPDATE meta SET value = value + 1 WHERE key = 'dictionary_version'")
+
+
+# the schema version is the count of the applied migrations; only ever append to this list
+MIGRATIONS: List[Callable[[Cursor], None]] = [
+    create_tables,
+    create_rollups,
+    create_indexes,
+    create_order_book,
+    create_contracts,
+    create_dashboard,
+    create_retention,
+    create_dictionary_version,
+    convert_money,
+    convert_rates,
+]
+
+# index name -> a query that must be answered with that index
+QUERY_PLANS: Dict[str, Tuple[str, tuple]] = {
+    'word_word': ('SELECT * FROM word WHERE word = ?', ('',)),
+    'word_owner_id': ('SELECT id FROM word WHERE owner_id = ?', (0,)),
+    'word_use_word_id_datetime': ('SELECT COUNT(*) FROM word_use WHERE word_id = ? AND datetime > ?', (0, '')),
+    'word_use_user_id_datetime': ('SELECT id, datetime, user_id, word_id FROM word_use '
+                                  'WHERE user_id = ? AND (datetime, id) < (?, ?) '
+                                  'ORDER BY datetime DESC, id DESC LIMIT ?', (0, '', 0, 10)),
+    'word_use_datetime': ('SELECT id, datetime, user_id, word_id FROM word_use WHERE (datetime, id) < (?, ?) '
+                          'ORDER BY datetime DESC, id DESC LIMIT ?', ('', 0, 10)),
+    'market_price': ('SELECT word_id FROM market ORDER BY price DESC LIMIT ?', (10,)),
+    'market_word_id': ('SELECT price FROM market WHERE word_id = ?', (0,)),
+    'preference_word_id': ('SELECT owner_id, rate FROM preference WHERE word_id = ?', (0,)),
+    'bid_bidder_id': ('DELETE FROM bid WHERE bidder_id = ?', (0,)),
+    'word_use_hourly_hour': ('SELECT word_id, revenue FROM word_use_hourly WHERE hour >= ?', ('',)),
+    'contract_word_id': ('SELECT id, word_id, beneficiary_id, share, expires FROM contract '
+                         'WHERE word_id = ? AND expires > ? ORDER BY expires', (0, '')),
+}
+
+
+# the value of PRAGMA auto_vacuum in the incremental mode, which lets compaction give pages back to the file system
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def get_version(connection: Connection) -> int:
+    """ Get the schema version of the database. """
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(connection: Connection) -> int:
+    """
+    Apply the migrations the database has not seen yet, and record the schema version. Each migration runs in
+    a transaction with the record of its version, so a failed migration leaves the database as it was before it.
+    :param connection: database connection
+    :return: the schema version
+    """
+    version = get_version(connection)
+    for i, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor = connection.cursor()
+        if not connection.in_transaction:
+            cursor.execute('BEGIN')
+        try:
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {i}')
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        print(f'Database migrated to version {i}: {migration.__name__}')
+    # the mode of an existing file only changes with a full vacuum, which runs outside a transaction
+    if connection.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        connection.execute('VACUUM')
+    return len(MIGRATIONS)
+
+
+def check_indexes(connection: Connection) -> List[str]:
+    """
+    Run EXPLAIN QUERY PLAN on the query of each index.
+    :param connection: database connection
+    :return: names of the indexes the planner did not use
+    """
+    missing = list()
+    for index, (query, parameters) in QUERY_PLANS.items():
+        plan = ' '.join(row[-1] for row in connection.execute(f'EXPLAIN QUERY PLAN {query}', parameters))
+        if index not in plan:
+            missing.append(index)
+    return missing
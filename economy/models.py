@@ -1,14 +1,36 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Set
 
 from discord import Embed
 from discord_slash import SlashContext
 
-from const import YELLOW
+from const import YELLOW, RATE_SCALE
+from economy.cache import word_cache, word_text_cache, owner_cache, forget_word, forget_owner
+from economy.ledger import ledger
+from economy.pricing import pricing
+from economy.usage import get_used_count, remove_word_revenue
+from shard import ShardLocal
 from util import database, format_money
 
 
 class Owner:
+    @staticmethod
+    def load_ids() -> Set[int]:
+        """ Read the Discord IDs of all economy Owners from the database. """
+        cursor = database.cursor()
+        cursor.execute('SELECT id FROM owner')
+        return {id_ for (id_,) in cursor.fetchall()}
+
+    @staticmethod
+    def get_ids() -> Set[int]:
+        """
+        Get the Discord IDs of all economy Owners.
+        They are loaded once per guild, then kept up to date in memory by `new` and `remove_owner`.
+        :return: set of Discord IDs
+        """
+        return owner_ids.shard_instance()
+
     @staticmethod
     def is_owner(id_: int) -> bool:
         """
@@ -16,23 +38,21 @@ class Owner:
         :param id_: Discord ID
         :return: True if user is an Owner, False otherwise
         """
-        cursor = database.cursor()
-        cursor.execute('SELECT id FROM owner WHERE id = ?', (id_,))
-        return cursor.fetchone() is not None
+        return id_ in Owner.get_ids()
 
     @staticmethod
     def get_by_id(id_: int) -> Optional['Owner']:
         """
-        Get economy Owner by their Discord ID.
+        Get economy Owner by their Discord ID. The words are loaded when they are first used.
         :param id_: Discord ID
         :return: Owner object
         """
-        cursor = database.cursor()
-        cursor.execute('SELECT * FROM owner WHERE id = ?', (id_,))
-        row = cursor.fetchone()
-        if row is None:
+        if not Owner.is_owner(id_):
             return
-        return Owner(id_, row[1]).load_words()
+        owner = owner_cache.get(id_)
+        if owner is None:
+            owner = owner_cache.put(id_, Owner(id_, ledger.get(id_)))
+        return owner
 
     @staticmethod
     def get_all() -> List['Owner']:
@@ -41,8 +61,14 @@ class Owner:
         :return: List of Owner objects
         """
         cursor = database.cursor()
-        cursor.execute('SELECT id FROM owner')
-        return [Owner.get_by_id(row[0]) for row in cursor.fetchall()]
+        cursor.execute('SELECT id, money FROM owner')
+        owners = [owner_cache.get(id_) or owner_cache.put(id_, Owner(id_, money)) for id_, money in cursor.fetchall()]
+        words = defaultdict(list)
+        for word in Word.get_all():
+            words[word.owner_id].append(word)
+        for owner in owners:
+            owner.words = words[owner.id]
+        return owners
 
     @staticmethod
     def new(id_: int):
@@ -56,6 +82,7 @@ class Owner:
         cursor = database.cursor()
         cursor.execute('INSERT INTO owner (id) VALUES (?)', (id_,))
         database.commit()
+        Owner.get_ids().add(id_)
         return Owner.get_by_id(id_)
 
     @staticmethod
@@ -65,30 +92,61 @@ class Owner:
         :param id_: Discord ID
         """
         cursor = database.cursor()
+        cursor.execute('SELECT id, word FROM word WHERE owner_id = ?', (id_,))
+        for word_id, text in cursor.fetchall():
+            remove_word_revenue(word_id)
+            forget_word(word_id, text)
         cursor.execute('DELETE FROM owner WHERE id = ?', (id_,))
         cursor.execute('DELETE FROM word WHERE owner_id = ?', (id_,))
         database.commit()
+        Owner.get_ids().discard(id_)
+        ledger.discard(id_)
+        forget_owner(id_)
 
-    def __init__(self, id_: int, money: float):
+    def __init__(self, id_: int, money: int):
         self.id = id_
-        self.money = money
+        ledger.load(id_, money)
+
+        self._words: Optional[List[Word]] = None
+
+    @property
+    def words(self) -> List['Word']:
+        """ The words owned by this owner, loaded on first access. """
+        if self._words is None:
+            self.load_words()
+        return self._words
 
-        self.words: List[Word] = list()
+    @words.setter
+    def words(self, words: List['Word']):
+        self._words = words
+
+    @property
+    def money(self) -> int:
+        """ The latest balance, including changes not flushed to the database yet. """
+        return ledger.get(self.id)
 
     def save(self) -> 'Owner':
-        """ Save this owner to the database. """
-        cursor = database.cursor()
-        cursor.execute('UPDATE owner SET money = ? WHERE id = ?', (self.money, self.id))
-        database.commit()
+        """ Save this owner to the database, with every other pending balance and log row. """
+        # the settlement imports the models
+        from economy.settlement import flush
+        flush()
         return self
 
-    def set_money(self, money: float) -> 'Owner':
+    def set_money(self, money: int) -> 'Owner':
         """
         Set the money of this owner.
-        :param money: amount of money
+        :param money: amount of milli-로소
         """
-        self.money = money
-        return self.save()
+        ledger.set(self.id, money)
+        return self
+
+    def add_money(self, amount: int) -> 'Owner':
+        """
+        Add money to this owner.
+        :param amount: amount of milli-로소, negative to take money
+        """
+        ledger.credit(self.id, amount)
+        return self
 
     def __str__(self):
         return f'Owner {self.id} ({format_money(self.money)}, {len(self.words)} words)'
@@ -101,14 +159,10 @@ class Owner:
         Load all words owned by this owner.
         :return: Owner object
         """
-        self.words = list()
-        cursor = database.cursor()
-        cursor.execute('SELECT id FROM word WHERE owner_id = ?', (self.id,))
-        for row in cursor.fetchall():
-            self.words.append(Word.get_by_id(row[0]))
+        self.words = Word.select('word.owner_id = ?', (self.id,))
         return self
 
-    def get_property(self) -> float:
+    def get_property(self) -> int:
         return self.money + sum(map(lambda x: x.price, self.words))
 
 
@@ -123,9 +177,16 @@ class Word:
                 return False
         return True
 
+    @staticmethod
+    def get_dictionary_version() -> int:
+        """ Get the dictionary version, which the triggers on the `word` and `preference` tables bump on every change. """
+        cursor = database.cursor()
+        cursor.execute("SELECT value FROM meta WHERE key = 'dictionary_version'")
+        return cursor.fetchone()[0]
+
     @staticmethod
     def get_price_rate(length: int) -> float:
-        return length ** 2 / 100
+        return pricing.get_price_rate(length)
 
     @staticmethod
     def get_all() -> List['Word']:
@@ -133,12 +194,27 @@ class Word:
         Get all words.
         :return: List of Word objects
         """
+        return Word.select()
+
+    @staticmethod
+    def select(condition: str = '1', parameters: tuple = ()) -> List['Word']:
+        """
+        Get the words matching a condition, with their preferences, in two queries.
+        :param condition: SQL condition on the `word` table; qualify the columns with `word.`
+        :param parameters: parameters of the condition
+        :return: List of Word objects
+        """
         cursor = database.cursor()
-        cursor.execute('SELECT id FROM word')
-        words = list()
-        for row in cursor.fetchall():
-            words.append(Word.get_by_id(row[0]))
-        return words
+        cursor.execute('SELECT p.word_id, p.owner_id, p.rate '
+                       'FROM preference p JOIN word ON word.id = p.word_id '
+                       f'WHERE {condition}',
+                       parameters)
+        preferences = defaultdict(dict)
+        for word_id, owner_id, rate in cursor.fetchall():
+            preferences[word_id][owner_id] = rate
+        cursor.execute(f'SELECT id, word, owner_id, price FROM word WHERE {condition}', parameters)
+        return [word_cache.get(row[0]) or Word(*row, preferences=preferences[row[0]]).cache()
+                for row in cursor.fetchall()]
 
     @staticmethod
     def get_by_id(id_: int) -> 'Word':
@@ -148,12 +224,28 @@ class Word:
         :return: Word object
         :exception ValueError: if no Word with that ID exists
         """
+        if (word := word_cache.get(id_)) is not None:
+            return word
         cursor = database.cursor()
         cursor.execute('SELECT * FROM word WHERE id = ?', (id_,))
         row = cursor.fetchone()
         if row is None:
             raise ValueError(f'Word with id {id_} does not exist')
-        return Word(id_, row[1], row[2], row[3])
+        return Word(id_, row[1], row[2], row[3]).cache()
+
+    @staticmethod
+    def get_by_ids(ids: List[int]) -> List['Word']:
+        """
+        Get the words of many IDs, reading the ones that are not cached in one query.
+        :param ids: economy Word IDs
+        :return: list of Word objects in the order of the IDs, without the IDs of removed words
+        """
+        words = {id_: word for id_ in ids if (word := word_cache.get(id_)) is not None}
+        missing = list({id_ for id_ in ids if id_ not in words})
+        if missing:
+            words.update((word.id, word) for word in
+                         Word.select(f'word.id IN ({", ".join("?" * len(missing))})', tuple(missing)))
+        return [words[id_] for id_ in ids if id_ in words]
 
     @staticmethod
     def get_by_word(word: str) -> Optional['Word']:
@@ -162,12 +254,14 @@ class Word:
         :param word: word content
         :return: Word object
         """
+        if (cached := word_text_cache.get(word)) is not None:
+            return cached
         cursor = database.cursor()
         cursor.execute('SELECT * FROM word WHERE word = ?', (word,))
         row = cursor.fetchone()
         if row is None:
             return
-        return Word(row[0], row[1], row[2], row[3])
+        return Word(row[0], row[1], row[2], row[3]).cache()
 
     @staticmethod
     def is_duplicate(word: str) -> bool:
@@ -181,12 +275,12 @@ class Word:
         return row is not None
 
     @staticmethod
-    def new(owner: Owner, text: str, price: float) -> 'Word':
+    def new(owner: Owner, text: str, price: int) -> 'Word':
         """
         Create a new economy Word.
         :param owner: owner of the word
         :param text: content of the word
-        :param price: price of the word
+        :param price: price of the word in milli-로소
         :exception ValueError: if the word is already owned by someone
         :exception ValueError: if the word is invalid
         """
@@ -198,6 +292,7 @@ class Word:
         cursor = database.cursor()
         cursor.execute('INSERT INTO word (word, owner_id, price) VALUES(?, ?, ?)', (text, owner.id, price))
         database.commit()
+        forget_owner(owner.id)
         return Word.get_by_word(text)
 
     @staticmethod
@@ -207,16 +302,31 @@ class Word:
         :param word: word content
         """
         cursor = database.cursor()
+        cursor.execute('SELECT id, owner_id FROM word WHERE word = ?', (word,))
+        for word_id, owner_id in cursor.fetchall():
+            remove_word_revenue(word_id)
+            forget_word(word_id, word)
+            forget_owner(owner_id)
         cursor.execute('DELETE FROM word WHERE word = ?', (word,))
         database.commit()
 
-    def __init__(self, id_: int, word: str, owner_id: int, price: float):
+    def __init__(self, id_: int, word: str, owner_id: int, price: int,
+                 preferences: Optional[Dict[int, float]] = None):
         self.id = id_
         self.word = word
         self.owner_id = owner_id
         self.price = price
         self.preferences: Dict[int, float] = dict()
-        self.load_preferences()
+        if preferences is None:
+            self.load_preferences()
+        else:
+            self.preferences.update(preferences)
+
+    def cache(self) -> 'Word':
+        """ Make this object the live object of its ID and text in the identity map. """
+        word_cache.put(self.id, self)
+        word_text_cache.put(self.word, self)
+        return self
 
     def __str__(self):
         return f'Word {self.word} ({self.owner_id})'
@@ -228,21 +338,20 @@ class Word:
         """ Load the preferences of the word and store them in a dictionary. """
         self.preferences.clear()
         cursor = database.cursor()
-        cursor.execute('SELECT * FROM preference WHERE word_id = ?', (self.id,))
-        rows = cursor.fetchall()
-        for row in rows:
-            self.preferences[row[0]] = row[2]
+        cursor.execute('SELECT owner_id, rate FROM preference WHERE word_id = ?', (self.id,))
+        for owner_id, rate in cursor.fetchall():
+            self.preferences[owner_id] = rate
         return self
 
-    def apply_preference(self, owner_id: int, rate: float) -> 'Word':
+    def apply_preference(self, owner_id: int, rate: int) -> 'Word':
         """
         Apply a preference to the word.
         :param owner_id: discord ID of the preference target
-        :param rate: [0, 1]
+        :param rate: share of the fee the target pays, in per-mille [0, RATE_SCALE]
         :return:
         """
         cursor = database.cursor()
-        if rate == 1:
+        if rate == RATE_SCALE:
             cursor.execute('DELETE FROM preference WHERE word_id = ? AND owner_id = ?',
                            (self.id, owner_id))
         elif owner_id in self.preferences:
@@ -253,14 +362,16 @@ class Word:
                            (self.id, owner_id, rate))
         database.commit()
         self.load_preferences()
-        return self
+        forget_owner(self.owner_id)
+        return self.cache()
 
-    def get_fee(self) -> float:
-        return Word.get_price_rate(len(self.word)) * self.price
+    def get_fee(self) -> int:
+        return pricing.get_fee(self.price, len(self.word))
 
-    def get_embed(self, ctx: SlashContext) -> Embed:
+    def get_embed(self, ctx: SlashContext, used: Optional[int] = None) -> Embed:
         owner = ctx.guild.get_member(self.owner_id)
-        used = self.get_used_count()
+        if used is None:
+            used = self.get_used_count()
         embed = Embed(title=f'__{self.word}__ 단어 정보', color=YELLOW)
         embed.add_field(name='사용료', value=f'__**{format_money(self.get_fee())}**__')
         embed.add_field(name='가격', value=f'{format_money(self.price)}')
@@ -271,14 +382,14 @@ class Word:
                 user = ctx.guild.get_member(user_id)
                 if user is None:
                     continue
-                lines.append(f'- {user.display_name}: {(1 - rate) * 100:.2f}%')
+                lines.append(f'- {user.display_name}: {(RATE_SCALE - rate) * 100 / RATE_SCALE:.1f}%')
             embed.add_field(name='할인', value='\n'.join(lines), inline=False)
         embed.add_field(name='과거 1일간 검출 기록', value=f'{used} 회')
         return embed
 
     def get_used_count(self, while_: timedelta = timedelta(days=1)) -> int:
         """ Fetch how many this word is detected in the past. """
-        cursor = database.cursor()
-        cursor.execute('SELECT COUNT(*) FROM word_use WHERE word_id = ? AND datetime > ?',
-                       (self.id, datetime.now() - while_))
-        return cursor.fetchone()[0]
+        return get_used_count(self.id, datetime.now() - while_)
+
+
+owner_ids = ShardLocal(Owner.load_ids)
@@ -0,0 +1,39 @@
+from const import OWNER_PAYOUT_RATE, KEYSTROKE_INCOME, PRICE_RATE_EXPONENT, PRICE_RATE_DIVISOR, RATE_SCALE
+
+
+class Pricing:
+    """
+    The rates the fees and the income of a message are computed with.
+
+    The bot always runs with the values of `const`; the replay tool changes them to try a pricing change
+    against recorded traffic. Amounts of money are integer milli-로소, and the payout rate is integer per-mille.
+    """
+
+    def __init__(self, payout_rate: int = OWNER_PAYOUT_RATE, keystroke_income: int = KEYSTROKE_INCOME,
+                 price_rate_exponent: int = PRICE_RATE_EXPONENT, price_rate_divisor: int = PRICE_RATE_DIVISOR):
+        self.payout_rate = payout_rate
+        self.keystroke_income = keystroke_income
+        self.price_rate_exponent = price_rate_exponent
+        self.price_rate_divisor = price_rate_divisor
+
+    def get_price_rate(self, length: int) -> float:
+        """ Get the fee of a word of a length, per unit of its price. """
+        return length ** self.price_rate_exponent / self.price_rate_divisor
+
+    def get_fee(self, price: int, length: int) -> int:
+        """ Get the fee of a word, rounded down to a whole milli-로소 with integer arithmetic only. """
+        return price * length ** self.price_rate_exponent // self.price_rate_divisor
+
+    def get_fee_sql(self, word: str = 'w.word', price: str = 'w.price') -> str:
+        """ Get `get_fee` as an SQL expression over the columns of a word, for the rows logged without their fee. """
+        return f'{price}{f" * length({word})" * self.price_rate_exponent} / {self.price_rate_divisor}'
+
+    def get_payout(self, amount: int) -> int:
+        """ Get what the owners of a word are paid for a fee charged for it, rounded down to a whole milli-로소. """
+        return amount * self.payout_rate // RATE_SCALE
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+pricing = Pricing()
@@ -0,0 +1,139 @@
+import gzip
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from os import listdir, makedirs, path, replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from const import ARCHIVE_DIRECTORY, MONEY_SCALE, RETENTION_DAYS, RETENTION_VACUUM_PAGES
+from economy.pricing import pricing
+from shard import get_current
+from util import database, get_reader
+
+
+def get_archive_directory() -> str:
+    """ Get the archive directory of the current shard. """
+    return path.join(ARCHIVE_DIRECTORY, str(get_current().guild_id))
+
+
+def has_archive() -> bool:
+    """ Check if any day of the log of the current shard was archived. """
+    directory = get_archive_directory()
+    return path.isdir(directory) and any(name.endswith('.jsonl.gz') for name in listdir(directory))
+
+
+def read_archive_file(day: str) -> List[tuple]:
+    """
+    Read the archived rows of a day. Files archived before money became integer hold the amounts in 로소,
+    which JSON keeps as floats, so they are converted here and rewritten in milli-로소 with the next write.
+    :param day: 'YYYY-MM-DD'
+    :return: list of (id, datetime, user ID, word ID, word, amount in milli-로소), oldest first
+    """
+    file_path = path.join(get_archive_directory(), f'{day}.jsonl.gz')
+    if not path.exists(file_path):
+        return list()
+    rows = list()
+    with gzip.open(file_path, 'rt', encoding='utf-8') as file:
+        for line in file:
+            *row, amount = json.loads(line)
+            rows.append((*row, round(amount * MONEY_SCALE) if isinstance(amount, float) else amount))
+    return rows
+
+
+def write_archive_file(day: str, rows: List[tuple]):
+    """
+    Add rows to the archive of a day. The file is rewritten as a whole and replaced, and rows already in it are
+    kept once, so archiving a day again after a crash is harmless.
+    :param day: 'YYYY-MM-DD'
+    :param rows: list of (id, datetime, user ID, word ID, word, amount)
+    """
+    merged = {row[0]: row for row in read_archive_file(day)}
+    merged.update((row[0], row) for row in rows)
+    directory = get_archive_directory()
+    makedirs(directory, exist_ok=True)
+    file_path = path.join(directory, f'{day}.jsonl.gz')
+    with gzip.open(file_path + '.tmp', 'wt', encoding='utf-8') as file:
+        for row in sorted(merged.values(), key=lambda x: (x[1], x[0])):
+            file.write(json.dumps(row, ensure_ascii=False) + '\n')
+    replace(file_path + '.tmp', file_path)
+
+
+def archive_day(now: Optional[datetime] = None) -> Optional[Tuple[str, List[tuple]]]:
+    """
+    Archive the oldest day of the log that is past the retention horizon. Runs on a reader thread, since the
+    rows past the horizon no longer change.
+    :param now: current time, for tests
+    :return: (day, archived rows), or None if no day is past the horizon
+    """
+    horizon = ((now or datetime.now()) - timedelta(days=RETENTION_DAYS)).strftime('%Y-%m-%d')
+    cursor = get_reader().cursor()
+    cursor.execute('SELECT MIN(datetime) FROM word_use WHERE datetime < ?', (horizon,))
+    first = cursor.fetchone()[0]
+    if first is None:
+        return
+    day = first[:10]
+    end = (datetime.fromisoformat(day) + timedelta(days=1)).strftime('%Y-%m-%d')
+    cursor.execute('SELECT u.id, u.datetime, u.user_id, u.word_id, w.word, '
+                   f'COALESCE(u.amount, {pricing.get_fee_sql()}, 0) '
+                   'FROM word_use u LEFT JOIN word w ON w.id = u.word_id '
+                   'WHERE u.datetime >= ? AND u.datetime < ? '
+                   'ORDER BY u.datetime, u.id',
+                   (day, end))
+    rows = cursor.fetchall()
+    write_archive_file(day, rows)
+    return day, rows
+
+
+def compact_day(day: str, rows: List[tuple]):
+    """
+    Replace the archived rows of a day with per-day aggregates, then give some free pages back to the file system.
+    Runs on the database thread.
+    :param day: 'YYYY-MM-DD'
+    :param rows: the rows `archive_day` archived
+    """
+    aggregates: Dict[Tuple[int, int], List[int]] = defaultdict(lambda: [0, 0])
+    for _, _, user_id, word_id, _, amount in rows:
+        aggregate = aggregates[user_id, word_id]
+        aggregate[0] += 1
+        aggregate[1] += amount
+    end = (datetime.fromisoformat(day) + timedelta(days=1)).strftime('%Y-%m-%d')
+    cursor = database.cursor()
+    cursor.executemany('INSERT INTO word_use_daily (day, user_id, word_id, count, revenue) VALUES (?, ?, ?, ?, ?) '
+                       'ON CONFLICT (day, user_id, word_id) '
+                       'DO UPDATE SET count = count + excluded.count, revenue = revenue + excluded.revenue',
+                       [(day, user_id, word_id, count, revenue)
+                        for (user_id, word_id), (count, revenue) in aggregates.items()])
+    # rows logged for the day after it was archived wait for the next run
+    cursor.execute('DELETE FROM word_use WHERE datetime >= ? AND datetime < ? AND id <= ?',
+                   (day, end, max(row[0] for row in rows)))
+    # the daily aggregates cover the hourly rollups of the day
+    cursor.execute('DELETE FROM word_use_hourly WHERE hour < ?', (end,))
+    database.commit()
+    database.execute(f'PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})').fetchall()
+
+
+def read_archive(before: Optional[Tuple[str, int]], count: int,
+                 match: Callable[[tuple], bool]) -> List[tuple]:
+    """
+    Read the archived log through, the newest first, for the pages of `get_log` older than the live table.
+    :param before: (datetime, id) of the last row of the previous page, or None
+    :param count: the count of rows
+    :param match: filter of the (id, datetime, user ID, word ID, word, amount) rows
+    :return: list of (id, datetime, user ID, word ID, word)
+    """
+    directory = get_archive_directory()
+    if count <= 0 or not path.isdir(directory):
+        return list()
+    days = sorted((name[:10] for name in listdir(directory) if name.endswith('.jsonl.gz')), reverse=True)
+    result = list()
+    for day in days:
+        if before is not None and day > before[0][:10]:
+            continue
+        for row in reversed(read_archive_file(day)):
+            if before is not None and (row[1], row[0]) >= tuple(before):
+                continue
+            if match(row):
+                result.append(row[:5])
+                if len(result) == count:
+                    return result
+    return result
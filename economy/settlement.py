@@ -0,0 +1,104 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from const import RATE_SCALE
+from economy.contract import payouts
+from economy.ledger import ledger
+from economy.models import Owner, Word
+from economy.pricing import pricing
+from economy.usage import log_buffer, leaderboard
+from util import database
+
+
+class Settlement:
+    """
+    Everything a message costs and earns, computed before any balance moves.
+
+    A settlement is planned from the matched words in memory with `plan`, and applied at once with `apply`,
+    so a message either moves all of its money or none of it.
+    """
+
+    def __init__(self, owner_id: int):
+        self.owner_id = owner_id
+
+        self.charges: List[Tuple[Word, int]] = list()
+        self.used_words: List[Word] = list()
+        self.censored = False
+        self.income = 0
+
+    def get_deltas(self) -> Dict[int, int]:
+        """
+        Get the balance change of every owner involved. The shares of the contracts are rounded down and the
+        word owner gets the rest, so the payout is split without losing or making a milli-로소. Only integer
+        arithmetic is used, so the result never depends on float rounding.
+        :return: Discord ID -> amount of milli-로소, negative for a debit
+        """
+        deltas: Dict[int, int] = defaultdict(int)
+        for word, amount in self.charges:
+            if amount:
+                deltas[self.owner_id] -= amount
+                payout = rest = pricing.get_payout(amount)
+                for beneficiary_id, share in payouts.get(word.id):
+                    if not Owner.is_owner(beneficiary_id):
+                        # removed since the table was built; the share goes back to the word owner
+                        continue
+                    paid = payout * share // RATE_SCALE
+                    deltas[beneficiary_id] += paid
+                    rest -= paid
+                deltas[word.owner_id] += rest
+        if self.income:
+            deltas[self.owner_id] += self.income
+        return dict(deltas)
+
+
+def plan(owner: Owner, words: Iterable[Word], keys: int) -> Settlement:
+    """
+    Compute the charges of a message without changing anything.
+    :param owner: the author of the message
+    :param words: the matched words, in billing order
+    :param keys: keystrokes of the message, paid to the author
+    :return: the settlement of the message
+    """
+    settlement = Settlement(owner.id)
+    money = owner.money
+    for word in words:
+        if word.owner_id == owner.id:
+            continue
+        fee = word.get_fee()
+        settlement.used_words.append(word)
+        if money < fee:
+            settlement.censored = True
+            break
+        charge = fee * word.preferences[owner.id] // RATE_SCALE if owner.id in word.preferences else fee
+        settlement.charges.append((word, charge))
+        money -= charge
+    settlement.income = keys * pricing.keystroke_income
+    return settlement
+
+
+def apply(settlement: Settlement):
+    """
+    Apply a settlement: the balances, including the shares of the contracts, the log rows and the revenue
+    counters, then at most one commit.
+    :param settlement: a planned settlement
+    :exception ValueError: if an owner does not exist, in which case nothing is applied
+    """
+    payouts.expire()
+    ledger.apply(settlement.get_deltas())
+    log_buffer.extend((settlement.owner_id, word.id, amount) for word, amount in settlement.charges)
+    for word, amount in settlement.charges:
+        leaderboard.add(word.id, amount)
+    flush(force=False)
+
+
+def flush(force: bool = True):
+    """
+    Write the pending balances and log rows in one transaction. Both buffers are always written together, so a
+    balance is never committed without the log rows and the revenue it was moved for, or the other way around.
+    :param force: if False, only write when either buffer is due
+    """
+    if force or ledger.is_due() or log_buffer.is_due():
+        cursor = database.cursor()
+        ledger.write(cursor)
+        log_buffer.write(cursor)
+        database.commit()
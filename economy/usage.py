@@ -0,0 +1,201 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from heapq import nlargest
+from sqlite3 import Cursor
+from time import monotonic
+from typing import List, Tuple, Dict, Iterable
+
+from const import LOG_FLUSH_INTERVAL, LOG_FLUSH_SIZE, LEADERBOARD_SIZE
+from economy.executor import read_transaction
+from economy.ledger import ledger
+from economy.pricing import pricing
+from shard import ShardLocal
+from util import database
+
+
+class LogBuffer:
+    """
+    Append buffer of the `word_use` rows.
+
+    Rows are written with one executemany in one transaction, every `flush_interval` seconds or every
+    `flush_size` rows, so a crash loses at most that many detections. The hourly rollups, the per-word
+    revenue counters and the balances of the ledger are written in the same transaction, by
+    `economy.settlement.flush`.
+    """
+
+    def __init__(self, flush_interval: float = LOG_FLUSH_INTERVAL, flush_size: int = LOG_FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+
+        self.rows: List[Tuple[datetime, int, int, int]] = list()
+        self.last_flush = monotonic()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def extend(self, rows: Iterable[Tuple[int, int, int]]):
+        """
+        Log many word detections at once, without flushing in between.
+        :param rows: (user ID, word ID, fee actually charged) of each detection
+        """
+        now = datetime.now()
+        self.rows.extend((now, user_id, word_id, amount) for user_id, word_id, amount in rows)
+
+    def is_due(self) -> bool:
+        """ Whether enough rows or time have piled up. """
+        return len(self.rows) >= self.flush_size or monotonic() - self.last_flush >= self.flush_interval
+
+    def write(self, cursor: Cursor):
+        """ Write every pending row, with its rollups, leaving the commit to the caller. """
+        if self.rows:
+            cursor.executemany('INSERT INTO word_use (datetime, user_id, word_id, amount) VALUES (?, ?, ?, ?)',
+                               self.rows)
+            rollups: Dict[Tuple[int, str], List[int]] = defaultdict(lambda: [0, 0])
+            for datetime_, _, word_id, amount in self.rows:
+                rollup = rollups[word_id, get_hour(datetime_)]
+                rollup[0] += 1
+                rollup[1] += amount
+            cursor.executemany('INSERT INTO word_use_hourly (word_id, hour, count, revenue) VALUES (?, ?, ?, ?) '
+                               'ON CONFLICT (word_id, hour) '
+                               'DO UPDATE SET count = count + excluded.count, revenue = revenue + excluded.revenue',
+                               [(*key, count, revenue) for key, (count, revenue) in rollups.items()])
+            totals: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+            for (word_id, _), (count, revenue) in rollups.items():
+                totals[word_id][0] += count
+                totals[word_id][1] += revenue
+            # a word removed while its rows waited in the buffer gets no revenue counter back, as in the rebuild
+            word_ids = list(totals)
+            cursor.execute(f'SELECT id FROM word WHERE id IN ({", ".join("?" * len(word_ids))})', word_ids)
+            existing = {word_id for (word_id,) in cursor.fetchall()}
+            cursor.executemany('INSERT INTO word_revenue (word_id, count, revenue) VALUES (?, ?, ?) '
+                               'ON CONFLICT (word_id) '
+                               'DO UPDATE SET count = count + excluded.count, revenue = revenue + excluded.revenue',
+                               [(word_id, count, revenue) for word_id, (count, revenue) in totals.items()
+                                if word_id in existing])
+            self.rows.clear()
+        self.last_flush = monotonic()
+
+
+class Leaderboard:
+    """
+    Revenue of every word, with the top `size` words kept sorted.
+
+    Revenue only grows while a word exists, so a charge can only move its word up, and the top list is
+    updated in O(size) regardless of how long the log is.
+    """
+
+    def __init__(self, size: int = LEADERBOARD_SIZE):
+        self.size = size
+
+        self.revenues: Dict[int, int] = dict()
+        self.top: List[int] = list()
+
+    def load(self):
+        """ Load the revenue counters from the database. """
+        cursor = database.cursor()
+        cursor.execute('SELECT word_id, revenue FROM word_revenue WHERE word_id IN (SELECT id FROM word)')
+        self.revenues = dict(cursor.fetchall())
+        self.top = nlargest(self.size, self.revenues, key=self.revenues.get)
+
+    def add(self, word_id: int, amount: int):
+        """
+        Count a charged fee.
+        :param word_id: economy Word ID
+        :param amount: fee actually charged
+        """
+        self.revenues[word_id] = self.revenues.get(word_id, 0) + amount
+        if word_id not in self.top:
+            if len(self.top) < self.size:
+                self.top.append(word_id)
+            elif self.revenues[word_id] > self.revenues[self.top[-1]]:
+                self.top[-1] = word_id
+            else:
+                return
+        self.top.sort(key=self.revenues.get, reverse=True)
+
+    def remove(self, word_id: int):
+        """ Forget a removed word. """
+        if self.revenues.pop(word_id, None) is not None and word_id in self.top:
+            self.top = nlargest(self.size, self.revenues, key=self.revenues.get)
+
+    def get_top(self, count: int) -> List[Tuple[int, int]]:
+        """
+        Get the words with the highest revenue.
+        :param count: count of the rows, at most `size`
+        :return: list of (word ID, revenue)
+        """
+        return [(word_id, self.revenues[word_id]) for word_id in self.top[:count]]
+
+
+def get_hour(datetime_: datetime) -> str:
+    """ Get the rollup key of the hour, formatted like the `word_use` timestamps. """
+    return datetime_.strftime('%Y-%m-%d %H:00:00')
+
+
+def rebuild_rollups(cursor: Cursor, archived: bool = True):
+    """
+    Rebuild the rollups and the revenue counters from the `word_use` history and the daily aggregates of
+    the archived rows, leaving the commit to the caller. Rows logged before the charged amount was recorded
+    are valued at the current fee of the word.
+    :param cursor: cursor of the connection, and of the transaction, to rebuild in
+    :param archived: whether to count the daily aggregates of the archived rows
+    """
+    cursor.execute('DELETE FROM word_use_hourly')
+    cursor.execute('INSERT INTO word_use_hourly (word_id, hour, count, revenue) '
+                   "SELECT u.word_id, strftime('%Y-%m-%d %H:00:00', u.datetime), COUNT(*), "
+                   f'SUM(COALESCE(u.amount, {pricing.get_fee_sql()}, 0)) '
+                   'FROM word_use u LEFT JOIN word w ON w.id = u.word_id '
+                   'GROUP BY 1, 2')
+    cursor.execute('DELETE FROM word_revenue')
+    rollups = 'word_use_hourly'
+    if archived:
+        rollups = ('(SELECT word_id, count, revenue FROM word_use_hourly '
+                   'UNION ALL SELECT word_id, count, revenue FROM word_use_daily)')
+    cursor.execute('INSERT INTO word_revenue (word_id, count, revenue) '
+                   'SELECT word_id, SUM(count), SUM(revenue) '
+                   f'FROM {rollups} '
+                   'WHERE word_id IN (SELECT id FROM word) '
+                   'GROUP BY word_id')
+
+
+def backfill_rollups():
+    """
+    Write the buffered balances and rows, rebuild the rollups and the revenue counters in the same transaction,
+    and reload the leaderboard.
+    """
+    cursor = database.cursor()
+    ledger.write(cursor)
+    log_buffer.write(cursor)
+    rebuild_rollups(cursor)
+    database.commit()
+    leaderboard.load()
+
+
+def get_used_count(word_id: int, since: datetime) -> int:
+    """
+    Count the detections of a word since a point in time.
+    Whole hours are read from the rollups, and only the first, partial hour from the raw log.
+    :param word_id: economy Word ID
+    :param since: start of the period, exclusive
+    :return: count of the detections
+    """
+    boundary = since.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    with read_transaction(lambda: list(log_buffer.rows)) as (cursor, pending):
+        cursor.execute('SELECT COALESCE(SUM(count), 0) FROM word_use_hourly WHERE word_id = ? AND hour >= ?',
+                       (word_id, get_hour(boundary)))
+        count = cursor.fetchone()[0]
+        cursor.execute('SELECT COUNT(*) FROM word_use WHERE word_id = ? AND datetime > ? AND datetime < ?',
+                       (word_id, since, boundary))
+        count += cursor.fetchone()[0]
+    return count + sum(1 for datetime_, _, id_, _ in pending if id_ == word_id and datetime_ > since)
+
+
+def remove_word_revenue(word_id: int):
+    """ Remove the revenue counter of a removed word. """
+    leaderboard.remove(word_id)
+    cursor = database.cursor()
+    cursor.execute('DELETE FROM word_revenue WHERE word_id = ?', (word_id,))
+
+
+log_buffer = ShardLocal(LogBuffer)
+leaderboard = ShardLocal(Leaderboard)
@@ -1,75 +1,78 @@
-from datetime import datetime
-from typing import List
+from typing import List, Optional, Tuple
 
-from economy.models import Owner, Word
-from util import database
+from economy.executor import read_transaction
+from economy.retention import read_archive
+from economy.usage import log_buffer
 
 
-def get_ranking_by_money(count: int = 10) -> List[Owner]:
-    """ Get ranking by money """
-    cursor = database.cursor()
-    cursor.execute('SELECT id FROM owner ORDER BY money DESC LIMIT ?', (count,))
-    return [Owner.get_by_id(row[0]) for row in cursor.fetchall()]
-
-
-def get_ranking_by_word(count: int = 10):
-    """
-    Get ranking by word
-    :param count: count of the rows
-    :return: list of the converted rows with Word, fee, and fee_total
-    """
-    cursor = database.cursor()
-    words = dict()
-    for row in cursor.execute('SELECT user_id, word_id FROM word_use'):
-        if row[1] not in words:
-            word = Word.get_by_id(row[1])
-            words[row[1]] = [word, word.get_fee(), 0.0]
-        words[row[1]][2] += words[row[1]][1]
-    return list(sorted(words.values(), key=lambda x: x[2], reverse=True))[:count]
-
-
-def get_ranking_by_property(count: int = 10) -> List[Owner]:
-    """ Get ranking by property """
-    return list(sorted(Owner.get_all(), key=lambda x: x.get_property(), reverse=True))[:count]
-
-
-def add_log(user_id: int, word_id: int):
-    """ Add log """
-    now = datetime.now()
-    cursor = database.cursor()
-    cursor.execute('INSERT INTO word_use (datetime, user_id, word_id) VALUES (?, ?, ?)', (now, user_id, word_id))
-    database.commit()
-
-
-def get_log(owner_id: int, type_: str, count: int) -> List[tuple]:
+def get_log(owner_id: int, type_: str, count: int, before: Optional[Tuple[str, int]] = None,
+            archived: bool = False) -> List[tuple]:
     """
-    Get the word detection log
+    Get a page of the word detection log, the newest first. Pages are read with a keyset over
+    (datetime, id), so any page costs as much as the first one.
     :param owner_id: owner id of the user
     :param type_: 'i_paid', 'i_got', or 'all'
-    :param count: the count of rows
-    :return: the history
+    :param count: the count of rows of the page
+    :param before: (datetime, id) of the last row of the previous page, or None for the first page
+    :param archived: whether a page that reaches past the live table goes on into the archive, which reads
+                     whole day files, so it is only done when the user asks for the archived log
+    :return: list of (id, datetime, user ID, word ID, word, or None if the word was removed)
     """
-    owner = Owner.get_by_id(owner_id)
-    cursor = database.cursor()
     if type_ == 'i_paid':
-        cursor.execute('SELECT * '
-                       'FROM word_use '
-                       'WHERE user_id = ? '
-                       'ORDER BY datetime DESC '
-                       'LIMIT ?',
-                       (owner.id, count))
+        condition, parameters = 'u.user_id = ?', (owner_id,)
     elif type_ == 'i_got':
-        cursor.execute('SELECT * '
-                       'FROM word_use '
-                       'WHERE word_id IN (SELECT id FROM word WHERE owner_id = ?) '
-                       'ORDER BY datetime DESC '
-                       'LIMIT ?',
-                       (owner.id, count))
+        condition, parameters = 'w.owner_id = ?', (owner_id,)
     elif type_ == 'all':
-        cursor.execute('SELECT * '
-                       'FROM word_use '
-                       'ORDER BY datetime DESC '
+        condition, parameters = '1', ()
+    else:
+        return list()
+    if before is not None:
+        condition += ' AND (u.datetime, u.id) < (?, ?)'
+        parameters += tuple(before)
+
+    with read_transaction(lambda: list(log_buffer.rows)) as (cursor, pending):
+        cursor.execute('SELECT u.id, u.datetime, u.user_id, u.word_id, w.word '
+                       'FROM word_use u LEFT JOIN word w ON w.id = u.word_id '
+                       f'WHERE {condition} '
+                       'ORDER BY u.datetime DESC, u.id DESC '
                        'LIMIT ?',
-                       (count,))
+                       (*parameters, count))
+        rows = cursor.fetchall()
+
+        if pending:
+            # the buffered rows get the next IDs when they are written
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'word_use'")
+            row = cursor.fetchone()
+            next_id = (row[0] if row is not None else 0) + 1
+            word_ids = list({word_id for _, _, word_id, _ in pending})
+            cursor.execute(f'SELECT id, word, owner_id FROM word WHERE id IN ({", ".join("?" * len(word_ids))})',
+                           word_ids)
+            words = {word_id: (word, word_owner_id) for word_id, word, word_owner_id in cursor.fetchall()}
+            page = list()
+            for i in reversed(range(len(pending))):
+                datetime_, user_id, word_id, _ = pending[i]
+                row = (next_id + i, str(datetime_), user_id, word_id, words.get(word_id, (None,))[0])
+                if type_ == 'i_paid' and user_id != owner_id:
+                    continue
+                if type_ == 'i_got' and words.get(word_id, (None, None))[1] != owner_id:
+                    continue
+                if before is not None and (row[1], row[0]) >= tuple(before):
+                    continue
+                page.append(row)
+                if len(page) == count:
+                    break
+            rows = sorted(page + rows, key=lambda x: (x[1], x[0]), reverse=True)[:count]
+
+        if archived and len(rows) < count:
+            # the page reaches past the live table, into the archive
+            owned = set()
+            if type_ == 'i_got':
+                cursor.execute('SELECT id FROM word WHERE owner_id = ?', (owner_id,))
+                owned = {word_id for (word_id,) in cursor.fetchall()}
+
+            def match(archived: tuple) -> bool:
+                return type_ == 'all' or (type_ == 'i_paid' and archived[2] == owner_id) or archived[3] in owned
 
-    return cursor.fetchall()
+            last = (rows[-1][1], rows[-1][0]) if rows else before
+            rows += read_archive(last, count - len(rows), match)
+    return rows
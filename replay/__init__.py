@@ -0,0 +1,13 @@
+from os import chdir, getcwd, makedirs, path
+from sys import path as sys_path
+from tempfile import mkdtemp
+
+# Like the benchmarks, the replay moves into a scratch directory before `util` opens `res/db`, and works on
+# a copy of the database there. Paths given on the command line are relative to where it was started.
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+ORIGIN = getcwd()
+DIRECTORY = mkdtemp(prefix='goroso-replay-')
+
+sys_path.insert(0, ROOT)
+makedirs(path.join(DIRECTORY, 'res'))
+chdir(DIRECTORY)
@@ -0,0 +1,184 @@
+"""
+Replay recorded messages through the billing of the bot, against a scratch copy of the database.
+
+    python -m replay messages.jsonl[.gz] [--database res/db] [--payout-rate 110] [--keystroke-income 0.009]
+                     [--price-rate-exponent 2] [--price-rate-divisor 100] [--limit N] [--top 10] [--json report.json]
+
+Every line of the log is a JSON object with the `author_id` and the `content` of a message, and `bot: true` for
+the messages of bots. The log is read one line at a time, so it can be far larger than the memory.
+"""
+import replay  # noqa: F401, moves into the scratch directory before `util` opens the database
+
+import gzip
+import json
+from argparse import ArgumentParser
+from collections import defaultdict
+from contextlib import closing
+from heapq import nlargest
+from itertools import islice
+from os import path
+from sqlite3 import connect
+from time import perf_counter
+from typing import Dict, Iterator, Optional, Tuple
+
+from const import CURRENCY_NAME, MONEY_SCALE, RATE_SCALE
+from economy import market
+from economy.contract import payouts
+from economy.matcher import open_matcher
+from economy.migrations import migrate
+from economy.models import Owner, Word
+from economy.pricing import pricing
+from economy.settlement import Settlement, plan, apply, flush
+from economy.usage import leaderboard
+from util import database, get_hangul_keys, format_money, to_money, to_rate
+
+
+def copy_database(source: str):
+    """ Copy a database into the scratch directory with the backup API, which is safe while the bot writes to it. """
+    with closing(connect(f'file:{source}?mode=ro', uri=True)) as origin, closing(connect('res/db')) as copy:
+        origin.backup(copy)
+
+
+def read_messages(file_path: str) -> Iterator[Tuple[int, str]]:
+    """
+    Stream the messages of a log, skipping the messages of bots.
+    :param file_path: JSON lines file, gzipped if it ends with `.gz`
+    :return: iterator of (author ID, content)
+    """
+    opener = gzip.open if file_path.endswith('.gz') else open
+    with opener(file_path, 'rt', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if message.get('bot'):
+                continue
+            yield message['author_id'], message['content']
+
+
+def get_balances() -> Dict[int, int]:
+    """ Get the balance of every owner, after writing the pending ones. """
+    flush()
+    return dict(database.execute('SELECT id, money FROM owner').fetchall())
+
+
+class Report:
+    """ Totals of a replay. Only the per-owner and per-word figures are kept, so it never grows with the log. """
+
+    def __init__(self):
+        self.messages = 0
+        self.billed = 0
+        self.censored = 0
+        self.charges = 0
+        self.fees = 0
+        self.payouts = 0
+        self.income = 0
+        self.revenues: Dict[int, int] = defaultdict(int)
+        self.seconds = 0.0
+
+    def add(self, settlement: Settlement):
+        """ Count an applied settlement. """
+        self.billed += 1
+        self.censored += settlement.censored
+        self.income += settlement.income
+        for word, amount in settlement.charges:
+            self.charges += 1
+            self.fees += amount
+            self.payouts += pricing.get_payout(amount)
+            self.revenues[word.id] += amount
+
+    def to_dict(self, before: Dict[int, int], after: Dict[int, int]) -> dict:
+        """ The report as JSON, with every amount of money in milli-로소. """
+        return {
+            'pricing': pricing.to_dict(),
+            'messages': self.messages,
+            'billed': self.billed,
+            'censored': self.censored,
+            'charges': self.charges,
+            'fees': self.fees,
+            'payouts': self.payouts,
+            'income': self.income,
+            'seconds': self.seconds,
+            'messages_per_second': self.messages / self.seconds if self.seconds else 0.0,
+            'balances': {owner_id: {'before': before.get(owner_id, 0), 'after': money}
+                         for owner_id, money in after.items()},
+            'revenues': dict(self.revenues),
+        }
+
+
+def replay_messages(file_path: str, limit: Optional[int] = None) -> Report:
+    """
+    Bill every message of a log the way `GeneralCog.on_message` does, without Discord, on a migrated database.
+    :param file_path: JSON lines file of the messages
+    :param limit: count of the messages to replay, all of them by default
+    :return: the report
+    """
+    matcher = open_matcher()
+    leaderboard.load()
+    market.book.load()
+    payouts.load()
+
+    report = Report()
+    started = perf_counter()
+    for author_id, content in islice(read_messages(file_path), limit):
+        report.messages += 1
+        if not Owner.is_owner(author_id):
+            continue
+        settlement = plan(Owner.get_by_id(author_id), matcher.find(content), get_hangul_keys(content))
+        apply(settlement)
+        report.add(settlement)
+    flush()
+    report.seconds = perf_counter() - started
+    return report
+
+
+def main():
+    parser = ArgumentParser(prog='python -m replay', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('log', help='JSON lines file of the messages, optionally gzipped')
+    parser.add_argument('--database', default='res/db', help='database to copy; it is never written')
+    parser.add_argument('--payout-rate', type=float,
+                        help=f'in percent, default: {pricing.payout_rate * 100 / RATE_SCALE}')
+    parser.add_argument('--keystroke-income', type=float,
+                        help=f'in {CURRENCY_NAME}, default: {pricing.keystroke_income / MONEY_SCALE}')
+    parser.add_argument('--price-rate-exponent', type=int, help=f'default: {pricing.price_rate_exponent}')
+    parser.add_argument('--price-rate-divisor', type=int, help=f'default: {pricing.price_rate_divisor}')
+    parser.add_argument('--limit', type=int, help='replay only this many messages')
+    parser.add_argument('--top', type=int, default=10, help='owners and words to print')
+    parser.add_argument('--json', help='also write the full report, with every balance and word, to this file')
+    arguments = parser.parse_args()
+
+    copy_database(path.join(replay.ORIGIN, arguments.database))
+    if arguments.keystroke_income is not None:
+        arguments.keystroke_income = to_money(arguments.keystroke_income)
+    if arguments.payout_rate is not None:
+        arguments.payout_rate = to_rate(arguments.payout_rate)
+    for name in ('payout_rate', 'keystroke_income', 'price_rate_exponent', 'price_rate_divisor'):
+        if getattr(arguments, name) is not None:
+            setattr(pricing, name, getattr(arguments, name))
+
+    migrate(database)
+    before = get_balances()
+    report = replay_messages(path.join(replay.ORIGIN, arguments.log), arguments.limit)
+    after = get_balances()
+
+    result = report.to_dict(before, after)
+    print(f'Pricing: {", ".join(f"{name}={value}" for name, value in result["pricing"].items())}')
+    print(f'{report.messages:,} messages, {report.billed:,} from owners, in {report.seconds:.1f}s '
+          f'({result["messages_per_second"]:,.0f} messages/s)')
+    print(f'{report.charges:,} charges, {report.censored:,} censored messages, fees {format_money(report.fees)}, '
+          f'payouts {format_money(report.payouts)}, keystroke income {format_money(report.income)}')
+    print('Balances:')
+    for owner_id, money in nlargest(arguments.top, after.items(), key=lambda x: x[1]):
+        print(f'  {owner_id}: {format_money(before.get(owner_id, 0))} -> {format_money(money)}')
+    print('Revenue:')
+    for word_id, revenue in nlargest(arguments.top, report.revenues.items(), key=lambda x: x[1]):
+        word = Word.get_by_id(word_id)
+        print(f'  {word.word} ({word.owner_id}): {format_money(revenue)}')
+    print(f'Scratch database: {path.join(replay.DIRECTORY, "res", "db")}')
+    if arguments.json:
+        with open(path.join(replay.ORIGIN, arguments.json), 'w') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+from contextvars import ContextVar
+from os import makedirs, path
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+from const import GUILDS, SHARD_DIRECTORY
+
+T = TypeVar('T')
+
+
+class Shard:
+    """
+    The economy of one guild: its own database file, database thread, caches and buffers.
+
+    The first guild of `GUILDS` keeps the legacy `res/db` file, every other guild gets a file of its own.
+    """
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        if guild_id == GUILDS[0]:
+            self.path = 'res/db'
+        else:
+            makedirs(SHARD_DIRECTORY, exist_ok=True)
+            self.path = path.join(SHARD_DIRECTORY, f'{guild_id}.db')
+        self.objects: Dict['ShardLocal', object] = dict()
+
+    def __repr__(self):
+        return f'Shard({self.guild_id})'
+
+
+# the shard of the running task or database thread; code that never picked one uses the legacy guild
+current: ContextVar[Shard] = ContextVar('shard')
+shards: Dict[int, Shard] = dict()
+
+
+def get_shard(guild_id: int) -> Shard:
+    """ Get the shard of a guild, creating it on first use. """
+    if guild_id not in shards:
+        shards[guild_id] = Shard(guild_id)
+    return shards[guild_id]
+
+
+def get_shards() -> List[Shard]:
+    """ Get every shard that has been used so far. """
+    return list(shards.values())
+
+
+def use_shard(guild_id: int) -> Shard:
+    """
+    Make a guild the current shard of the running task or thread.
+    :param guild_id: Discord ID of the guild
+    :return: the shard
+    """
+    shard = get_shard(guild_id)
+    current.set(shard)
+    return shard
+
+
+def get_current() -> Shard:
+    """ Get the current shard. """
+    shard = current.get(None)
+    return shard if shard is not None else get_shard(GUILDS[0])
+
+
+class ShardLocal(Generic[T]):
+    """
+    Module-level singleton with one instance per shard.
+
+    Attribute access is forwarded to the instance of the current shard, which is made by `factory`
+    the first time the shard uses it. The proxy's own methods are prefixed with `shard_`, so they never
+    shadow a method of the instance. This keeps `from util import database` and the other singletons
+    working unchanged, while every guild reads and writes only its own state.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+
+    def shard_instance(self, shard: Optional[Shard] = None) -> T:
+        """ Get the instance of a shard, the current one by default. """
+        shard = shard or current.get(None) or get_current()
+        try:
+            return shard.objects[self]
+        except KeyError:
+            return shard.objects.setdefault(self, self._factory())
+
+    def shard_reset(self, shard: Optional[Shard] = None):
+        """ Drop the instance of a shard, so the next use makes a new one. """
+        (shard or get_current()).objects.pop(self, None)
+
+    def __getattr__(self, name: str):
+        return getattr(self.shard_instance(), name)
+
+    def __len__(self):
+        return len(self.shard_instance())
+
+    def __str__(self):
+        return str(self.shard_instance())
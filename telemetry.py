@@ -0,0 +1,199 @@
+import json
+import re
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps, lru_cache
+from sqlite3 import Connection, Cursor
+from threading import Lock
+from time import perf_counter, time
+from typing import Callable, Deque, Dict, Iterable, List, Tuple
+
+SAMPLES = 2048
+
+
+def percentile(values: Iterable[float], rate: float) -> float:
+    """ Nearest-rank percentile of the values. """
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(rate * len(values)))]
+
+
+class Histogram:
+    """ Count, total and maximum of a value, with the latest `size` samples kept for the percentiles. """
+
+    def __init__(self, scale: float = 1000.0, unit: str = 'ms', size: int = SAMPLES):
+        self.scale = scale
+        self.unit = unit
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def copy(self) -> 'Histogram':
+        histogram = Histogram(self.scale, self.unit, self.samples.maxlen)
+        histogram.count, histogram.total, histogram.max = self.count, self.total, self.max
+        histogram.samples.extend(self.samples)
+        return histogram
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, rate: float) -> float:
+        """ Nearest-rank percentile of the kept samples. """
+        return percentile(self.samples, rate)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'average': self.average * self.scale,
+            'p50': self.percentile(0.5) * self.scale,
+            'p95': self.percentile(0.95) * self.scale,
+            'p99': self.percentile(0.99) * self.scale,
+            'max': self.max * self.scale,
+        }
+
+    def __str__(self):
+        if not self.count:
+            return 'no samples'
+        result = self.to_dict()
+        return (f'p50 {result["p50"]:.2f}{self.unit}, p95 {result["p95"]:.2f}{self.unit}, '
+                f'p99 {result["p99"]:.2f}{self.unit}, max {result["max"]:.2f}{self.unit} ({self.count})')
+
+
+# the histograms are added to by the database threads while the event loop reports them
+lock = Lock()
+# durations in seconds, reported in milliseconds
+timings: Dict[str, Histogram] = defaultdict(Histogram)
+# plain counts, e.g. words matched per message
+counts: Dict[str, Histogram] = defaultdict(lambda: Histogram(1.0, ''))
+# durations of the sqlite statements by their shape
+queries: Dict[str, Histogram] = defaultdict(Histogram)
+
+
+def count(name: str, value: float):
+    """ Record a count, e.g. how many words a message matched. """
+    record(counts, name, value)
+
+
+def record(histograms: Dict[str, Histogram], name: str, value: float):
+    """ Add a value to a histogram of `timings`, `counts` or `queries`. """
+    with lock:
+        histograms[name].add(value)
+
+
+def get_histograms(histograms: Dict[str, Histogram]) -> List[Tuple[str, Histogram]]:
+    """ Get copies of the histograms of `timings`, `counts` or `queries`, sorted by their names. """
+    with lock:
+        return sorted((name, histogram.copy()) for name, histogram in histograms.items())
+
+
+@contextmanager
+def measure(name: str):
+    """ Time the body of the with statement. """
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        record(timings, name, perf_counter() - started)
+
+
+def timed(name: str) -> Callable:
+    """ Time every call of a coroutine function, e.g. a slash command or a listener. """
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        async def wrapper(*args, **kwargs):
+            with measure(name):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@lru_cache(maxsize=1024)
+def get_shape(sql: str) -> str:
+    """ Normalize a statement, so the queries that differ only by an IN list are counted together. """
+    sql = ' '.join(sql.split())
+    return re.sub(r'\(\?(, \?)+\)', '(?, ...)', sql)
+
+
+class InstrumentedCursor:
+    """ sqlite3.Cursor that records the duration of every statement. """
+
+    def __init__(self, cursor: Cursor):
+        self.cursor = cursor
+
+    def execute(self, sql: str, parameters=()) -> 'InstrumentedCursor':
+        started = perf_counter()
+        try:
+            self.cursor.execute(sql, parameters)
+        finally:
+            record(queries, get_shape(sql), perf_counter() - started)
+        return self
+
+    def executemany(self, sql: str, parameters) -> 'InstrumentedCursor':
+        started = perf_counter()
+        try:
+            self.cursor.executemany(sql, parameters)
+        finally:
+            record(queries, get_shape(sql), perf_counter() - started)
+        return self
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __getattr__(self, name: str):
+        return getattr(self.cursor, name)
+
+
+class InstrumentedConnection:
+    """ sqlite3.Connection whose cursors record the duration of every statement. """
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+
+    def cursor(self) -> InstrumentedCursor:
+        return InstrumentedCursor(self.connection.cursor())
+
+    def execute(self, sql: str, parameters=()) -> InstrumentedCursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, parameters) -> InstrumentedCursor:
+        return self.cursor().executemany(sql, parameters)
+
+    def commit(self):
+        started = perf_counter()
+        try:
+            self.connection.commit()
+        finally:
+            record(queries, 'COMMIT', perf_counter() - started)
+
+    def __getattr__(self, name: str):
+        return getattr(self.connection, name)
+
+
+def get_slow_queries(count_: int = 5) -> List[Tuple[str, Histogram]]:
+    """ Get the statement shapes with the most total time. """
+    return sorted(get_histograms(queries), key=lambda x: x[1].total, reverse=True)[:count_]
+
+
+def snapshot() -> Dict[str, Dict]:
+    """ Get every histogram as plain data. """
+    return {
+        'time': time(),
+        'timings': {name: histogram.to_dict() for name, histogram in get_histograms(timings)},
+        'counts': {name: histogram.to_dict() for name, histogram in get_histograms(counts)},
+        'queries': {name: histogram.to_dict() for name, histogram in get_histograms(queries)},
+    }
+
+
+def dump(path: str):
+    """ Append a snapshot to a JSON lines file. """
+    with open(path, 'a') as file:
+        file.write(json.dumps(snapshot(), ensure_ascii=False) + '\n')
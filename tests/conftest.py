@@ -0,0 +1,22 @@
+import pytest
+
+import shard
+from const import GUILDS
+from util import database
+
+
+@pytest.fixture(autouse=True)
+def scratch(tmp_path, monkeypatch):
+    """
+    Run every test in its own directory, so `res/db` is a new database, and with new per-shard state,
+    so no cache, buffer or connection of another test is seen.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'res').mkdir()
+    monkeypatch.setattr(shard, 'shards', dict())
+    token = shard.current.set(shard.get_shard(GUILDS[0]))
+    yield
+    shard.current.reset(token)
+    for used in shard.shards.values():
+        if (connection := used.objects.get(database)) is not None:
+            connection.close()
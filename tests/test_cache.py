@@ -0,0 +1,42 @@
+import pytest
+
+from economy import market
+from economy.migrations import migrate
+from economy.models import Owner, Word
+from util import database
+
+
+def test_a_removed_word_is_forgotten():
+    migrate(database)
+    owner = Owner.new(1)
+    word = Word.new(owner, '사과', 1000)
+    assert Word.get_by_id(word.id) is word
+    assert Word.get_by_word('사과') is word
+    assert Owner.get_by_id(owner.id).words == [word]
+
+    Word.remove_word('사과')
+
+    assert Word.get_by_word('사과') is None
+    with pytest.raises(ValueError):
+        Word.get_by_id(word.id)
+    assert Word.get_by_ids([word.id]) == []
+    assert Owner.get_by_id(owner.id).words == []
+
+
+def test_a_sold_word_is_read_again_with_its_new_owner():
+    migrate(database)
+    seller, buyer = Owner.new(1), Owner.new(2)
+    buyer.set_money(10 ** 6)
+    word = Word.new(seller, '사과', 1000)
+    assert Owner.get_by_id(seller.id).words == [word]
+    assert Owner.get_by_id(buyer.id).words == []
+    market.exhibit(word, 5000)
+
+    market.buy(word, buyer)
+
+    sold = Word.get_by_id(word.id)
+    assert sold is not word
+    assert sold.owner_id == buyer.id
+    assert Word.get_by_word('사과') is sold
+    assert Owner.get_by_id(seller.id).words == []
+    assert [word.id for word in Owner.get_by_id(buyer.id).words] == [sold.id]
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from time import sleep
+
+import pytest
+
+from cogs.general import GeneralCog
+from economy.contract import Contract, payouts
+from economy.migrations import migrate
+from economy.models import Owner, Word
+from economy.pricing import pricing
+from economy.settlement import Settlement, apply, flush
+from util import database
+
+
+def make_economy():
+    migrate(database)
+    payouts.load()
+    author, word_owner, first, second = (Owner.new(id_) for id_ in (1, 2, 3, 4))
+    author.set_money(10 ** 6)
+    return author, word_owner, first, second, Word.new(word_owner, '사과', 1000)
+
+
+def settle(author: Owner, word: Word, amount: int) -> Settlement:
+    settlement = Settlement(author.id)
+    settlement.charges.append((word, amount))
+    return settlement
+
+
+def test_the_payout_is_split_without_losing_a_milli_roso():
+    author, word_owner, first, second, word = make_economy()
+    expires = datetime.now() + timedelta(days=1)
+    Contract.new(word.id, first.id, 333, expires)
+    Contract.new(word.id, second.id, 250, expires)
+
+    deltas = settle(author, word, 1001).get_deltas()
+
+    payout = pricing.get_payout(1001)
+    assert payout == 1101
+    assert deltas[first.id] == 1101 * 333 // 1000 == 366
+    assert deltas[second.id] == 1101 * 250 // 1000 == 275
+    assert deltas[word_owner.id] == payout - 366 - 275
+    assert deltas[author.id] == -1001
+
+
+def test_expired_contracts_do_not_count_toward_the_cap():
+    author, word_owner, first, second, word = make_economy()
+    Contract.new(word.id, first.id, 1000, datetime.now() + timedelta(milliseconds=50))
+
+    assert GeneralCog.make_contract(word.id, second.id, 1, datetime.now() + timedelta(days=1))[0] is None
+    sleep(0.1)
+    contract, available = GeneralCog.make_contract(word.id, second.id, 1000, datetime.now() + timedelta(days=1))
+    assert (contract.beneficiary_id, available) == (second.id, 1000)
+
+    with pytest.raises(ValueError):
+        Contract.new(word.id, 99, 1, datetime.now() + timedelta(days=1))
+
+
+def test_a_removed_beneficiary_does_not_stop_the_billing():
+    author, word_owner, first, _, word = make_economy()
+    Contract.new(word.id, first.id, 500, datetime.now() + timedelta(days=1))
+    # the payout table still holds the contract of the removed owner
+    Owner.remove_owner(first.id)
+
+    apply(settle(author, word, 1000))
+    flush()
+
+    assert author.money == 10 ** 6 - 1000
+    assert word_owner.money == pricing.get_payout(1000)
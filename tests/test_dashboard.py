@@ -0,0 +1,35 @@
+from economy.dashboard import build_snapshot, set_dashboard
+from economy.migrations import migrate
+from economy.models import Owner, Word
+from economy.settlement import apply, flush, plan
+from util import database
+
+
+def test_the_words_are_only_read_when_they_changed():
+    migrate(database)
+    author, word_owner = Owner.new(1), Owner.new(2)
+    author.set_money(10 ** 6)
+    apple = Word.new(word_owner, '사과', 1000)
+    build_snapshot()
+
+    apply(plan(author, [apple], 0))
+    flush()
+    statements = list()
+    database.set_trace_callback(statements.append)
+    snapshot = build_snapshot()
+    database.set_trace_callback(None)
+    assert 'SELECT id, word, owner_id, price FROM word' not in statements
+    assert [(stat.word_id, stat.revenue) for stat in snapshot.words] == [(apple.id, apple.get_fee())]
+    assert dict(snapshot.property)[word_owner.id] == word_owner.money + 1000
+
+    banana = Word.new(word_owner, '바나나', 2000)
+    snapshot = build_snapshot()
+    assert [stat.word_id for stat in snapshot.get_owner_words(word_owner.id)] == [apple.id, banana.id]
+    assert dict(snapshot.property)[word_owner.id] == word_owner.money + 3000
+
+
+def test_a_new_dashboard_replaces_the_old_one():
+    migrate(database)
+    assert set_dashboard(1, 10, 100) is None
+    assert set_dashboard(1, 11, 101) == (10, 100)
+    assert database.execute('SELECT guild_id, channel_id, message_id FROM dashboard').fetchall() == [(1, 11, 101)]
@@ -0,0 +1,26 @@
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+MODULES = ('economy.cache', 'economy.contract', 'economy.dashboard', 'economy.executor', 'economy.ingest',
+           'economy.ledger', 'economy.market', 'economy.matcher', 'economy.migrations', 'economy.models',
+           'economy.pricing', 'economy.retention', 'economy.settlement', 'economy.usage', 'economy.util',
+           'cogs.general')
+
+
+def test_importing_the_modules_leaves_the_schema_to_the_migrations(tmp_path):
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (str(ROOT), os.environ.get('PYTHONPATH')))))
+    # a fresh interpreter, since the modules are imported already for the other tests
+    subprocess.run([sys.executable, '-c', '; '.join(f'import {module}' for module in MODULES)],
+                   cwd=tmp_path, env=environment, check=True)
+
+    if (tmp_path / 'res' / 'db').exists():
+        connection = sqlite3.connect(tmp_path / 'res' / 'db')
+        try:
+            assert connection.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0] == 0
+            assert connection.execute('PRAGMA user_version').fetchone()[0] == 0
+        finally:
+            connection.close()
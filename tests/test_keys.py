@@ -0,0 +1,52 @@
+from util import get_hangul_keys, get_keys, get_keys_bulk, strawberrify
+
+SYLLABLES = ''.join(chr(code) for code in range(44032, 55204))
+OTHERS = '~!@#$%^&*()_+| abcXYZ019.,?ㅋㅎㅏ😀\n'
+
+
+def get_keys_per_letter(sentence: str) -> int:
+    """ `get_keys` as it was before the table, one letter at a time. """
+    keys = 0
+    for letter in sentence:
+        if 44032 <= ord(letter) <= 55203:  # 44032: 가, 55203: 힣
+            cho, jung, jong = strawberrify(letter)
+            if cho in 'ㄲㄸㅃㅆㅉ':
+                keys += 2
+            else:
+                keys += 1
+            if jung in 'ㅒㅖㅘㅙㅚㅝㅞㅟ':
+                keys += 2
+            else:
+                keys += 1
+            if jong in 'ㄲㄳㄵㄶㄺㄻㄼㄽㄾㄿㅀㅄ':
+                keys += 2
+            elif jong == ' ':
+                pass
+            else:
+                keys += 1
+        elif letter in '~!@#$%^&*()_+|':
+            keys += 2
+        else:
+            keys += 1
+    return keys
+
+
+def test_the_table_matches_the_per_letter_count():
+    for letter in SYLLABLES + OTHERS:
+        assert get_keys(letter) == get_keys_per_letter(letter), letter
+
+
+def test_hangul_keys_count_only_the_syllables():
+    sentence = SYLLABLES[::97] + OTHERS
+    # `on_message` used to count only the letters `Word.is_valid` accepted
+    expected = sum(get_keys_per_letter(letter) for letter in sentence if '가' <= letter <= '힣')
+
+    assert get_hangul_keys(sentence) == expected
+    assert get_keys(sentence) == get_keys_per_letter(sentence)
+
+
+def test_bulk_matches_the_single_counts():
+    sentences = ['', SYLLABLES[:500], OTHERS, SYLLABLES[-300:] + OTHERS, '가']
+
+    assert get_keys_bulk(sentences) == [get_keys_per_letter(sentence) for sentence in sentences]
+    assert get_keys_bulk(sentences, hangul_only=True) == [get_hangul_keys(sentence) for sentence in sentences]
@@ -0,0 +1,42 @@
+import pytest
+
+from economy.ledger import Ledger, ledger
+from economy.migrations import migrate
+from economy.models import Owner
+from economy.settlement import flush
+from util import database
+
+
+def test_balances_are_read_through_and_flushed():
+    migrate(database)
+    Owner.new(1).set_money(5000)
+    Owner.new(2).set_money(0)
+    flush()
+
+    cold = Ledger()
+    assert cold.get(1) == 5000
+    assert cold.get(3) is None
+
+    ledger.credit(1, 1000)
+    ledger.apply({1: -2500, 2: 2500})
+    assert ledger.get(1) == 3500
+    assert database.execute('SELECT money FROM owner WHERE id = 1').fetchone()[0] == 5000
+
+    flush()
+    assert not ledger.dirty
+    assert Ledger().get(1) == 3500
+    assert Ledger().get(2) == 2500
+
+
+def test_apply_changes_nothing_if_an_owner_does_not_exist():
+    migrate(database)
+    Owner.new(1).set_money(5000)
+    flush()
+
+    with pytest.raises(ValueError):
+        ledger.apply({1: -1000, 3: 1000})
+    with pytest.raises(ValueError):
+        ledger.credit(3, 1000)
+
+    assert ledger.get(1) == 5000
+    assert not ledger.dirty
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+from economy import retention
+from economy.ledger import ledger
+from economy.migrations import migrate
+from economy.models import Owner, Word
+from economy.retention import archive_day, compact_day, has_archive
+from economy.settlement import apply, flush, plan
+from economy.usage import log_buffer
+from economy.util import get_log
+from util import database
+
+
+def make_log(now: datetime):
+    """ Log two detections a day for the past 40 days, and archive the ones past the retention horizon. """
+    migrate(database)
+    author, word_owner = Owner.new(1), Owner.new(2)
+    word = Word.new(word_owner, '사과', 1000)
+    database.executemany('INSERT INTO word_use (datetime, user_id, word_id, amount) VALUES (?, ?, ?, ?)',
+                         [(now - timedelta(days=day, hours=hour), author.id, word.id, 10)
+                          for day in range(40) for hour in (1, 2)])
+    database.commit()
+    while (archived := archive_day(now)) is not None:
+        compact_day(*archived)
+
+
+def test_the_archive_is_only_read_when_asked_for(monkeypatch):
+    now = datetime.now()
+    make_log(now)
+    live = database.execute('SELECT COUNT(*) FROM word_use').fetchone()[0]
+    assert has_archive() and 0 < live < 80
+
+    def read_archive_file(day: str):
+        raise AssertionError('the archive was read')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(retention, 'read_archive_file', read_archive_file)
+        assert len(get_log(1, 'i_paid', 100)) == live
+
+    rows = get_log(1, 'i_paid', 100, archived=True)
+    assert len(rows) == 80
+    assert [(row[1], row[0]) for row in rows] == sorted(((row[1], row[0]) for row in rows), reverse=True)
+
+
+def read_pages(type_: str, owner_id: int, count: int) -> list:
+    """ Read the whole log a page at a time, each page after the last row of the previous one. """
+    rows, before = list(), None
+    while page := get_log(owner_id, type_, count, before):
+        rows += page
+        before = (page[-1][1], page[-1][0])
+    return rows
+
+
+def test_buffered_rows_are_read_with_the_committed_ones():
+    migrate(database)
+    author, other, word_owner = Owner.new(1), Owner.new(2), Owner.new(3)
+    author.set_money(10 ** 6)
+    other.set_money(10 ** 6)
+    apple, banana = Word.new(word_owner, '사과', 1000), Word.new(word_owner, '바나나', 1000)
+    for buffer in (ledger.shard_instance(), log_buffer.shard_instance()):
+        buffer.flush_interval, buffer.flush_size = 3600, 1000
+    apply(plan(author, [apple, banana], 0))
+    apply(plan(other, [apple], 0))
+    flush()
+    # these stay in the buffer
+    apply(plan(author, [banana, apple], 0))
+    apply(plan(other, [banana], 0))
+    assert len(log_buffer) == 3
+
+    readers = (('all', 1), ('i_paid', 1), ('i_got', 3), ('i_got', 1))
+    buffered = [read_pages(type_, owner_id, 2) for type_, owner_id in readers]
+    used = (apple.get_used_count(), banana.get_used_count())
+
+    assert [row[0] for row in buffered[0]] == [6, 5, 4, 3, 2, 1]
+    assert [row[0] for row in buffered[1]] == [5, 4, 2, 1]
+    assert buffered[2] == buffered[0]
+    assert buffered[3] == []
+    assert used == (3, 3)
+
+    flush()
+
+    # the buffered rows got the IDs and the places they were shown with
+    assert [read_pages(type_, owner_id, 2) for type_, owner_id in readers] == buffered
+    assert (apple.get_used_count(), banana.get_used_count()) == used
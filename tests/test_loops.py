@@ -0,0 +1,20 @@
+from asyncio import run
+from sqlite3 import OperationalError
+from types import SimpleNamespace
+
+from cogs.general import for_each_shard
+
+
+def test_a_failing_guild_does_not_stop_the_others(capsys):
+    shards = [SimpleNamespace(guild_id=guild_id) for guild_id in (1, 2, 3)]
+    done = list()
+
+    async def job(shard):
+        if shard.guild_id == 2:
+            raise OperationalError('database is locked')
+        done.append(shard.guild_id)
+
+    run(for_each_shard('flush_buffers', shards, job))
+
+    assert done == [1, 3]
+    assert 'flush_buffers failed in guild 2' in capsys.readouterr().out
@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pytest
+
+from cogs.general import GeneralCog
+from economy import market
+from economy.migrations import migrate
+from economy.models import Owner, Word
+from util import database
+
+
+def make_economy():
+    migrate(database)
+    seller, buyer = Owner.new(1), Owner.new(2)
+    return seller, buyer, Word.new(seller, '사과', 1000), Word.new(seller, '바나나', 2000)
+
+
+def test_listings_carry_the_prices_and_the_best_bids():
+    seller, buyer, apple, banana = make_economy()
+    buyer.set_money(10 ** 6)
+    market.exhibit(apple, 5000)
+    market.exhibit(banana, 9000)
+    market.bid(banana, buyer, 3000)
+
+    assert market.get_listings('recent') == [(banana, 9000, 3000), (apple, 5000, None)]
+    assert market.get_listings('price') == [(banana, 9000, 3000), (apple, 5000, None)]
+
+
+def test_buy_word_checks_the_price_it_pays():
+    seller, buyer, apple, _ = make_economy()
+    buyer.set_money(4000)
+    market.exhibit(apple, 5000)
+
+    assert GeneralCog.buy_word(apple, buyer) == (None, 5000, 4000)
+    assert market.is_on_sale(apple.id)
+
+    buyer.set_money(6000)
+    fill, price, money = GeneralCog.buy_word(apple, buyer)
+    assert (fill.buyer_id, price, money) == (buyer.id, 5000, 6000)
+    assert buyer.money == 1000
+    assert not market.is_on_sale(apple.id)
+
+
+def count_rows(table: str) -> int:
+    return database.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_a_failed_buy_leaves_the_book_as_it_was():
+    seller, buyer, apple, _ = make_economy()
+    buyer.set_money(4000)
+    market.exhibit(apple, 5000)
+
+    with pytest.raises(ValueError):
+        market.buy(apple, buyer)
+    with pytest.raises(ValueError):
+        market.buy(apple, SimpleNamespace(id=99, money=10 ** 6))
+
+    assert market.get_listings() == [(apple, 5000, None)]
+    assert count_rows('market') == 1 and count_rows('fill') == 0
+    assert (buyer.money, seller.money) == (4000, 0)
+
+
+def test_exhibit_fills_the_best_bid():
+    seller, buyer, apple, _ = make_economy()
+    other = Owner.new(3)
+    buyer.set_money(10000)
+    other.set_money(10000)
+    market.bid(apple, buyer, 4000)
+    market.bid(apple, other, 3000)
+
+    fill = market.exhibit(apple, 3500)
+
+    assert (fill.buyer_id, fill.price) == (buyer.id, 4000)
+    assert Word.get_by_id(apple.id).owner_id == buyer.id
+    assert (seller.money, buyer.money, other.money) == (4000, 6000, 7000)
+    assert not market.is_on_sale(apple.id)
+    assert market.get_bid(apple.id, buyer.id) is None and market.get_bid(apple.id, other.id) == 3000
+    assert database.execute('SELECT bidder_id FROM bid').fetchall() == [(other.id,)]
+
+
+def test_bid_at_the_ask_buys_and_refunds_the_escrow():
+    seller, buyer, apple, _ = make_economy()
+    buyer.set_money(10000)
+    market.bid(apple, buyer, 2000)
+    assert buyer.money == 8000
+    market.exhibit(apple, 5000)
+
+    fill = market.bid(apple, buyer, 6000)
+
+    assert (fill.buyer_id, fill.price) == (buyer.id, 5000)
+    assert (seller.money, buyer.money) == (5000, 5000)
+    assert count_rows('bid') == 0 and count_rows('market') == 0
+
+
+def test_cancelled_bids_refund_their_escrow():
+    seller, buyer, apple, banana = make_economy()
+    other = Owner.new(3)
+    buyer.set_money(10000)
+    other.set_money(10000)
+    market.bid(apple, buyer, 3000)
+    market.bid(apple, buyer, 4000)
+    market.bid(banana, other, 2000)
+    assert (buyer.money, other.money) == (6000, 8000)
+
+    assert market.unbid(apple.id, buyer.id) == 4000
+    assert market.unbid(apple.id, buyer.id) is None
+    market.close_word(banana.id)
+
+    assert (buyer.money, other.money) == (10000, 10000)
+    assert count_rows('bid') == 0 and not market.book.bids
@@ -0,0 +1,67 @@
+from random import Random
+from types import SimpleNamespace
+from typing import List
+
+from economy.matcher import WordMatcher
+from economy.migrations import migrate
+from economy.models import Owner, Word
+from economy.settlement import plan
+from util import database
+
+
+def scan_per_word(words: List[SimpleNamespace], content: str) -> List[str]:
+    """ The scan `handle_word_cost` did before the matcher: longest word first, each occurrence replaced. """
+    used = list()
+    for word in sorted(words, key=lambda x: len(x.word), reverse=True):
+        while word.word in content:
+            content = content.replace(word.word, ' ', 1)
+            used.append(word.word)
+    return used
+
+
+def test_find_matches_the_per_word_scan():
+    random = Random(0)
+    # few letters, so the words overlap, nest and repeat a lot
+    texts = sorted({''.join(random.choices('가나다라', k=random.randint(1, 4))) for _ in range(40)})
+    random.shuffle(texts)
+    words = [SimpleNamespace(id=i, word=text) for i, text in enumerate(texts, 1)]
+    matcher = WordMatcher(words)
+
+    for _ in range(2000):
+        content = ' '.join(''.join(random.choices('가나다라마', k=random.randint(1, 12)))
+                           for _ in range(random.randint(1, 4)))
+        assert [word.word for word in matcher.find(content)] == scan_per_word(words, content), content
+
+
+def test_find_consumes_overlapping_spans():
+    words = [SimpleNamespace(id=1, word='사과'), SimpleNamespace(id=2, word='과자'),
+             SimpleNamespace(id=3, word='사과나무'), SimpleNamespace(id=4, word='나무')]
+    matcher = WordMatcher(words)
+
+    assert [word.id for word in matcher.find('사과자')] == [1]
+    assert [word.id for word in matcher.find('사과나무 과자 나무나무')] == [3, 2, 4, 4]
+    assert [word.id for word in matcher.find('사과사과사과')] == [1, 1, 1]
+
+
+def test_find_breaks_length_ties_by_the_older_word():
+    matcher = WordMatcher([SimpleNamespace(id=2, word='과자'), SimpleNamespace(id=1, word='사과')])
+
+    assert [word.id for word in matcher.find('사과자 과자사과')] == [1, 1, 2]
+
+
+def test_plan_stops_at_the_first_word_the_author_cannot_pay():
+    migrate(database)
+    author, word_owner = Owner.new(1), Owner.new(2)
+    own = Word.new(author, '가나다라', 1000)
+    cheap, expensive, after = (Word.new(word_owner, '사과', 10), Word.new(word_owner, '바나나', 10 ** 6),
+                               Word.new(word_owner, '포도', 10))
+    author.set_money(cheap.get_fee() + after.get_fee())
+    words = WordMatcher(Word.get_all()).find('가나다라 사과 바나나 포도')
+    assert words == [own, expensive, cheap, after]
+
+    settlement = plan(author, words, 0)
+
+    # the own word is skipped, and the billing stops at the first unaffordable word, as the old scan did
+    assert settlement.censored
+    assert settlement.used_words == [expensive]
+    assert settlement.charges == []
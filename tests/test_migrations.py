@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from economy.migrations import MIGRATIONS, AUTO_VACUUM_INCREMENTAL, migrate, check_indexes, get_version
+from util import database
+
+
+def test_every_query_uses_its_index():
+    assert migrate(database) == len(MIGRATIONS)
+    assert check_indexes(database) == []
+
+
+def test_migrating_twice_changes_nothing():
+    migrate(database)
+    schema = database.execute('SELECT type, name, sql FROM sqlite_master ORDER BY name').fetchall()
+
+    assert migrate(database) == len(MIGRATIONS)
+    assert get_version(database) == len(MIGRATIONS)
+    assert database.execute('SELECT type, name, sql FROM sqlite_master ORDER BY name').fetchall() == schema
+
+
+def test_a_failed_migration_leaves_the_database_as_it_was(monkeypatch):
+    migrate(database)
+
+    def create_and_fail(cursor):
+        cursor.execute('CREATE TABLE half_done (id INTEGER PRIMARY KEY)')
+        cursor.execute('INSERT INTO half_done (id) VALUES (1)')
+        raise RuntimeError('stopped halfway')
+
+    monkeypatch.setattr('economy.migrations.MIGRATIONS', MIGRATIONS + [create_and_fail])
+    with pytest.raises(RuntimeError):
+        migrate(database)
+
+    assert get_version(database) == len(MIGRATIONS)
+    assert database.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'half_done'").fetchone()[0] == 0
+    assert database.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+
+
+def test_a_legacy_database_is_converted_to_integers(monkeypatch):
+    with monkeypatch.context() as patch:
+        # the schema before the money and the rates were integers
+        patch.setattr('economy.migrations.MIGRATIONS', MIGRATIONS[:8])
+        migrate(database)
+    yesterday = datetime.now() - timedelta(days=1)
+    database.executemany('INSERT INTO owner (id, money) VALUES (?, ?)', [(1, 12.3456), (2, 0.1 + 0.2)])
+    database.execute("INSERT INTO word (id, word, owner_id, price) VALUES (1, '사과', 2, 99.9999)")
+    database.execute('INSERT INTO market (word_id, price) VALUES (1, 150.25)')
+    database.execute('INSERT INTO preference (owner_id, word_id, rate) VALUES (1, 1, 0.3335)')
+    database.execute('INSERT INTO contract (word_id, beneficiary_id, share, expires) VALUES (1, 1, 0.25, ?)',
+                     (yesterday,))
+    database.executemany('INSERT INTO word_use (datetime, user_id, word_id, amount) VALUES (?, 1, 1, ?)',
+                         [(yesterday, 0.1), (yesterday, 0.2), (yesterday, 1.0049)])
+    database.commit()
+
+    assert migrate(database) == len(MIGRATIONS)
+
+    assert database.execute('SELECT id, money FROM owner ORDER BY id').fetchall() == [(1, 12346), (2, 300)]
+    assert database.execute('SELECT price FROM word').fetchall() == [(100000,)]
+    assert database.execute('SELECT price FROM market').fetchall() == [(150250,)]
+    assert database.execute('SELECT rate FROM preference').fetchall() == [(334,)]
+    assert database.execute('SELECT share FROM contract').fetchall() == [(250,)]
+    assert database.execute('SELECT amount FROM word_use ORDER BY id').fetchall() == [(100,), (200,), (1005,)]
+    # the rollups are summed from the rounded amounts
+    assert database.execute('SELECT count, revenue FROM word_revenue').fetchall() == [(3, 1305)]
+    assert database.execute('SELECT SUM(revenue) FROM word_use_hourly').fetchone()[0] == 1305
+    assert {type_ for (type_,) in database.execute('SELECT DISTINCT typeof(money) FROM owner')} == {'integer'}
+    assert check_indexes(database) == []
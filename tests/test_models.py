@@ -0,0 +1,46 @@
+from typing import List
+
+from economy.migrations import migrate
+from economy.models import Owner, Word
+from util import database
+
+
+def seed(words: int, owners: int = 100):
+    """ Register `words` words round-robin to `owners` owners, with a preference on every tenth word. """
+    migrate(database)
+    database.executemany('INSERT INTO owner (id, money) VALUES (?, 0)', [(id_,) for id_ in range(1, owners + 1)])
+    database.executemany('INSERT INTO word (word, owner_id, price) VALUES (?, ?, 1000)',
+                         [(chr(44032 + i // 100) + chr(44032 + i % 100), i % owners + 1) for i in range(words)])
+    database.execute('INSERT INTO preference (owner_id, word_id, rate) SELECT 1, id, 500 FROM word WHERE id % 10 = 0')
+    database.commit()
+
+
+def count_statements(function) -> List[str]:
+    statements = list()
+    database.set_trace_callback(statements.append)
+    try:
+        function()
+    finally:
+        database.set_trace_callback(None)
+    return statements
+
+
+def test_loading_every_word_takes_a_bounded_count_of_queries():
+    seed(10000)
+    words = list()
+    statements = count_statements(lambda: words.extend(Word.get_all()))
+
+    assert len(words) == 10000
+    assert sum(len(word.preferences) for word in words) == 1000
+    # the words and their preferences, not one query per word
+    assert len(statements) <= 2
+
+
+def test_loading_every_owner_takes_a_bounded_count_of_queries():
+    seed(10000)
+    owners = list()
+    statements = count_statements(lambda: owners.extend(Owner.get_all()))
+
+    assert len(owners) == 100
+    assert sum(len(owner.words) for owner in owners) == 10000
+    assert len(statements) <= 3
@@ -0,0 +1,103 @@
+import sqlite3
+from types import SimpleNamespace
+from typing import Tuple
+
+from cogs.general import GeneralCog
+from economy.ledger import ledger
+from economy.matcher import WordMatcher
+from economy.migrations import migrate
+from economy.models import Owner, Word
+from economy.settlement import apply, flush, plan
+from economy.usage import log_buffer
+from util import database
+
+
+def test_settle_skips_a_word_removed_after_matching():
+    migrate(database)
+    author, word_owner = Owner.new(1), Owner.new(2)
+    author.set_money(10 ** 6)
+    removed = Word.new(word_owner, '사과', 1000)
+    kept = Word.new(word_owner, '바나나', 1000)
+    cog = SimpleNamespace(matcher=WordMatcher([removed, kept]))
+    # an ingest worker matched both words, then the first one was removed before the message was settled
+    scanned = ([removed.id, kept.id], 0)
+    Word.remove_word(removed.word)
+
+    settlement = GeneralCog.settle(cog, author, SimpleNamespace(content='사과 바나나'), scanned)
+    flush()
+
+    assert [word.id for word, _ in settlement.charges] == [kept.id]
+    assert author.money == 10 ** 6 - kept.get_fee()
+
+
+def get_committed(author_id: int) -> Tuple[int, int, int]:
+    """ Read what another connection sees: the balance of the author, and the sums of the log and the revenue. """
+    connection = sqlite3.connect('res/db')
+    try:
+        money = connection.execute('SELECT money FROM owner WHERE id = ?', (author_id,)).fetchone()[0]
+        logged = connection.execute('SELECT COALESCE(SUM(amount), 0) FROM word_use WHERE user_id = ?',
+                                    (author_id,)).fetchone()[0]
+        revenue = connection.execute('SELECT COALESCE(SUM(revenue), 0) FROM word_revenue').fetchone()[0]
+        return money, logged, revenue
+    finally:
+        connection.close()
+
+
+def test_balances_and_log_rows_are_committed_together():
+    migrate(database)
+    author, word_owner = Owner.new(1), Owner.new(2)
+    author.set_money(10 ** 6)
+    word = Word.new(word_owner, '사과', 1000)
+    flush()
+    # the ledger comes due after every message and the log buffer only after many
+    ledger.shard_instance().flush_size = 1
+    log_buffer.shard_instance().flush_size = 1000
+
+    for _ in range(5):
+        apply(plan(author, [word], 0))
+        money, logged, revenue = get_committed(author.id)
+        assert money == 10 ** 6 - logged
+        assert revenue == logged
+
+    assert logged == 5 * word.get_fee()
+
+
+def test_the_ledger_does_not_commit_by_itself():
+    migrate(database)
+    author = Owner.new(1)
+    ledger.shard_instance().flush_size = 1
+
+    author.set_money(5000)
+    author.add_money(1000)
+    assert get_committed(author.id)[0] == 0
+    flush(force=False)
+    assert get_committed(author.id)[0] == 6000
+
+
+def test_discounts_and_payouts_are_integer_arithmetic():
+    migrate(database)
+    author, word_owner = Owner.new(1), Owner.new(2)
+    author.set_money(10 ** 6)
+    word = Word.new(word_owner, '사과나무', 1001)
+    word.apply_preference(author.id, 333)
+    fee = word.get_fee()
+
+    settlement = plan(author, [word], 0)
+
+    assert settlement.charges == [(word, fee * 333 // 1000)]
+    assert settlement.get_deltas() == {author.id: -(fee * 333 // 1000), word_owner.id: fee * 333 // 1000 * 11 // 10}
+
+
+def test_a_word_removed_with_buffered_rows_gets_no_revenue_back():
+    migrate(database)
+    author, word_owner = Owner.new(1), Owner.new(2)
+    author.set_money(10 ** 6)
+    removed, kept = Word.new(word_owner, '사과', 1000), Word.new(word_owner, '바나나', 1000)
+    apply(plan(author, [removed, kept], 0))
+    assert len(log_buffer) == 2
+
+    Word.remove_word(removed.word)
+    flush()
+
+    assert database.execute('SELECT word_id FROM word_revenue').fetchall() == [(kept.id,)]
+    assert database.execute('SELECT COUNT(*) FROM word_use').fetchone()[0] == 2
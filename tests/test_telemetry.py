@@ -0,0 +1,39 @@
+from collections import defaultdict
+from threading import Thread
+
+from telemetry import Histogram, percentile, record, get_histograms, snapshot
+
+
+def test_percentile_is_the_nearest_rank():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([3.0, 1.0, 2.0], 0.5) == 2.0
+    assert percentile(range(100), 0.99) == 99
+
+    histogram = Histogram()
+    for value in range(100):
+        histogram.add(value)
+    assert histogram.percentile(0.95) == percentile(range(100), 0.95)
+
+
+def test_histograms_are_reported_while_threads_add_to_them():
+    histograms = defaultdict(Histogram)
+
+    def add():
+        for i in range(20000):
+            record(histograms, 'a', 1.0)
+            if i % 100 == 0:
+                # a new name grows the dict under the iteration of the reports
+                record(histograms, f'new {i}', 1.0)
+
+    threads = [Thread(target=add) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        copies = get_histograms(histograms)
+        assert all(histogram.count == len(histogram.samples) or histogram.count > histogram.samples.maxlen
+                   for _, histogram in copies)
+        snapshot()
+    for thread in threads:
+        thread.join()
+
+    assert dict(get_histograms(histograms))['a'].count == 80000
@@ -1,8 +1,46 @@
+from itertools import repeat
 from sqlite3 import connect
+from threading import local
+from typing import List, Sequence
 
-from const import CURRENCY_SYMBOL
+from const import CURRENCY_SYMBOL, MONEY_SCALE, RATE_SCALE, DATABASE_SYNCHRONOUS, WAL_AUTOCHECKPOINT
+from shard import Shard, ShardLocal, current, get_current
+from telemetry import InstrumentedConnection
 
-database = connect('res/db')
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def open_database(path: str) -> InstrumentedConnection:
+    """
+    Open the writer connection of a database in WAL mode, so the readers never block it and it never
+    blocks the readers.
+    """
+    connection = connect(path, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute(f'PRAGMA synchronous = {DATABASE_SYNCHRONOUS}')
+    connection.execute(f'PRAGMA wal_autocheckpoint = {WAL_AUTOCHECKPOINT}')
+    return InstrumentedConnection(connection)
+
+
+database = ShardLocal(lambda: open_database(get_current().path))
+
+# the read-only connection of each reader thread
+readers = local()
+
+
+def open_reader(shard: Shard):
+    """ Initializer of a reader thread: make the shard current and open a read-only connection to it. """
+    current.set(shard)
+    readers.connection = InstrumentedConnection(connect(f'file:{shard.path}?mode=ro', uri=True))
+
+
+def get_reader() -> InstrumentedConnection:
+    """ Get the read-only connection of a reader thread, or the writer connection on any other thread. """
+    connection = getattr(readers, 'connection', None)
+    return connection if connection is not None else database.shard_instance()
 
 
 def a_ya(string: str):
@@ -72,38 +110,107 @@ def strawberrify(hangul: str) -> tuple:
     return cho, jung, jong
 
 
-def get_keys(sentence: str) -> int:
-    keys = 0
-    for letter in sentence:
-        if 44032 <= ord(letter) <= 55203:  # 44032: 가, 55203: 힣
-            cho, jung, jong = strawberrify(letter)
-            if cho in 'ㄲㄸㅃㅆㅉ':
-                keys += 2
-            else:
-                keys += 1
-            if jung in 'ㅒㅖㅘㅙㅚㅝㅞㅟ':
-                keys += 2
-            else:
-                keys += 1
-            if jong in 'ㄲㄳㄵㄶㄺㄻㄼㄽㄾㄿㅀㅄ':
-                keys += 2
-            elif jong == ' ':
-                pass
-            else:
-                keys += 1
-        elif letter in '~!@#$%^&*()_+|':
+SPECIAL_LETTERS = '~!@#$%^&*()_+|'
+
+
+def count_keys(letter: str) -> int:
+    """ Count the keystrokes of a single letter on the 2-set Korean keyboard. """
+    if 44032 <= ord(letter) <= 55203:  # 44032: 가, 55203: 힣
+        keys = 0
+        cho, jung, jong = strawberrify(letter)
+        if cho in 'ㄲㄸㅃㅆㅉ':
+            keys += 2
+        else:
+            keys += 1
+        if jung in 'ㅒㅖㅘㅙㅚㅝㅞㅟ':
             keys += 2
         else:
             keys += 1
-    return keys
+        if jong in 'ㄲㄳㄵㄶㄺㄻㄼㄽㄾㄿㅀㅄ':
+            keys += 2
+        elif jong == ' ':
+            pass
+        else:
+            keys += 1
+        return keys
+    elif letter in SPECIAL_LETTERS:
+        return 2
+    else:
+        return 1
+
 
+# keystrokes of every Hangul syllable (가-힣); every other letter is 1 key except the special letters
+HANGUL_KEYS = {chr(code): count_keys(chr(code)) for code in range(44032, 55204)}
+KEYS = {**HANGUL_KEYS, **{letter: 2 for letter in SPECIAL_LETTERS}}
+# the same table indexed by code point, for the NumPy path
+KEYS_BY_CODE = bytes(KEYS.get(chr(code), 1) for code in range(55204))
 
-def format_money(value: float) -> str:
+
+def get_keys(sentence: str) -> int:
+    return sum(map(KEYS.get, sentence, repeat(1)))
+
+
+def get_hangul_keys(sentence: str) -> int:
+    """ Count the keystrokes of the Hangul syllables of a sentence, ignoring every other letter. """
+    return sum(filter(None, map(HANGUL_KEYS.get, sentence)))
+
+
+def get_keys_bulk(sentences: Sequence[str], *, hangul_only: bool = False) -> List[int]:
+    """
+    Count the keystrokes of many sentences at once, with NumPy if it is installed.
+    :param sentences: sentences to score
+    :param hangul_only: count only the Hangul syllables, like `get_hangul_keys`
+    :return: keystrokes of each sentence
+    """
+    if numpy is None:
+        function = get_hangul_keys if hangul_only else get_keys
+        return [function(sentence) for sentence in sentences]
+
+    lengths = numpy.fromiter(map(len, sentences), dtype=numpy.int64, count=len(sentences))
+    codes = numpy.frombuffer(''.join(sentences).encode('utf-32-le'), dtype=numpy.uint32)
+    table = numpy.frombuffer(KEYS_BY_CODE, dtype=numpy.uint8).astype(numpy.int64)
+    keys = numpy.where(codes < len(table), table[numpy.minimum(codes, len(table) - 1)], 1)
+    if hangul_only:
+        keys[(codes < 44032) | (codes > 55203)] = 0
+    totals = numpy.zeros(len(sentences), dtype=numpy.int64)
+    nonempty = lengths > 0
+    if nonempty.any():
+        starts = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+        totals[nonempty] = numpy.add.reduceat(keys, starts[nonempty])
+    return totals.tolist()
+
+
+def to_money(value: float) -> int:
+    """
+    Convert an amount of 로소, e.g. an option of a command, to the integer unit money is kept in.
+    :param value: amount of 로소
+    :return: amount of milli-로소, rounded to the nearest
+    """
+    return round(value * MONEY_SCALE)
+
+
+def to_rate(percent: float) -> int:
+    """
+    Convert a percentage, e.g. an option of a command, to the integer unit rates and shares are kept in.
+    :param percent: percentage
+    :return: per-mille, rounded to the nearest
+    """
+    return round(percent * RATE_SCALE / 100)
+
+
+def format_money(value: int) -> str:
+    """
+    Format an amount of money.
+    :param value: amount of milli-로소
+    :return: e.g. '1,234R 560mR'
+    """
     if not value:
         return '0' + CURRENCY_SYMBOL
+    sign = '-' if value < 0 else ''
+    whole, milli = divmod(abs(value), MONEY_SCALE)
     result = list()
-    if value > 1:
-        result.append(f'{int(value):,}{CURRENCY_SYMBOL}')
-    if micro := int((value - int(value)) * 1000):
-        result.append(f'{micro}m{CURRENCY_SYMBOL}')
+    if whole:
+        result.append(f'{sign}{whole:,}{CURRENCY_SYMBOL}')
+    if milli:
+        result.append(f'{"" if whole else sign}{milli}m{CURRENCY_SYMBOL}')
     return ' '.join(result)